@@ -1,6 +1,8 @@
 """Convenience wrapper for running asninja directly from source tree."""
 
+import sys
+
 from asninja.asninja import main
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
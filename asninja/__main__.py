@@ -1,5 +1,7 @@
 """asninja.__main__: executed when asninja directory is called as script."""
  
+import sys
+
 from .asninja import main
 
-main()
+sys.exit(main())
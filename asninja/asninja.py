@@ -1,31 +1,243 @@
 import argparse
+import functools
+import os
+import sys
 
-from asninja.converter import Converter
+# modules of subcommands and converter are imported when used, so thin client (and each subcommand) imports only what
+# it runs
 
 
-def main():
+def main(argv=None, cwd=None, cache=None):
+    """Runs asninja with command line args, returns exit code.
+
+    cwd is directory that relative paths in args are relative to (current dir if absent), cache
+    (MemoryProjectCache) keeps projects between calls (both are given by server).
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    # subcommands
+    if argv and argv[0] == 'serve':
+        import asninja.server
+        return asninja.server.main(argv[1:])
+    if argv and argv[0] == 'client':
+        import asninja.client
+        return asninja.client.main(argv[1:])
+    if argv and argv[0] == 'report':
+        import asninja.report
+        return asninja.report.main(argv[1:])
+    if argv and argv[0] == 'map':
+        import asninja.map_report
+        return asninja.map_report.main(argv[1:])
+    if argv and argv[0] == 'headers':
+        import asninja.headers
+        return asninja.headers.main(argv[1:])
+    if argv and argv[0] == 'size':
+        import asninja.size_report
+        return asninja.size_report.main(argv[1:])
+
+    from asninja.cache import ProjectCache
+    from asninja.converter import ConvertOptions
+    from asninja.timings import PhaseTimings
+
     parser = argparse.ArgumentParser(description='asninja')
     parser.add_argument('--prj', type=str, help='Atmel Studio project file')
-    parser.add_argument('--config', type=str, help='Configuration (Debug, Release, ...)', default='Debug')
-    parser.add_argument('--outpath', type=str, help='Output path (if absent when same as config name)', default=None)
+    parser.add_argument('--sln', type=str, help='Atmel Studio solution file (converts all projects)', default=None)
+    parser.add_argument('--jobs', type=int, help='Number of parallel conversions in solution mode', default=None)
+    parser.add_argument('--config', type=str,
+                        help='Configuration (Debug, Release, ...), comma-separated list or all', default='Debug')
+    parser.add_argument('--outpath', type=str,
+                        help='Output path (if absent when same as config name), parent of config dirs for several'
+                             ' configs', default=None)
     parser.add_argument('--output', type=str, help='Output filename')
     parser.add_argument('--flags', type=str, help='Additional compiler and linker flags (like -mthumb)', default=None)
     parser.add_argument('--add_defs', type=str, help='Additional compiler defines (like __SAM4S8C__)', default=None)
     parser.add_argument('--del_defs', type=str, help='Defines to remove from compiler defines', default=None)
     parser.add_argument('--gcc_toolchain', type=str, help='Custom GCC toolchain path', default=None)
+    parser.add_argument('--unified', action='store_true',
+                        help='Include graphs of referenced libraries with subninja (single build graph)')
+    parser.add_argument('--top_ninja', action='store_true',
+                        help='Write top-level build.ninja with phony target per config')
+    parser.add_argument('--cache_dir', type=str, help='Directory for cache of parsed projects', default=None)
+    parser.add_argument('--streaming', action='store_true',
+                        help='Load projects in one streaming pass (for very large project files)')
+    parser.add_argument('--compiler_launcher', type=str,
+                        help='Compiler launcher (like ccache, sccache), auto to detect it on PATH', default=None)
+    parser.add_argument('--pch', type=str,
+                        help='Header to precompile for C++ sources, auto to detect most common first include',
+                        default=None)
+    parser.add_argument('--unity', type=str,
+                        help='Unity build: dir to batch sources per directory or batch size', default=None)
+    parser.add_argument('--unity_exclude', type=str,
+                        help='Comma-separated patterns of sources to compile without unity build', default=None)
+    parser.add_argument('--compile_pool', type=str,
+                        help='Depth of compile jobs pool, auto to derive it from available memory', default=None)
+    parser.add_argument('--ar_pool', type=int, help='Depth of archive jobs pool', default=None)
+    parser.add_argument('--link_pool', type=int, help='Depth of link jobs pool', default=None)
+    parser.add_argument('--distributed', type=str,
+                        help='Distribute compile jobs with front-end (like distcc, icecc), auto to detect it on PATH;'
+                             ' compile pool defaults to 4 jobs per core (run ninja with -j of at least its depth)',
+                        default=None)
+    parser.add_argument('--local_preprocess', action='store_true',
+                        help='Preprocess sources locally in distributed mode (for include paths not present on'
+                             ' remote hosts)')
+    parser.add_argument('--local_pool', type=int,
+                        help='Depth of pool of local jobs (archive, link, preprocess) in distributed mode (number of'
+                             ' cores if absent)', default=None)
+    parser.add_argument('--optimize_includes', action='store_true',
+                        help='Drop include paths not used by sources (and duplicates), move most used first where it'
+                             ' keeps headers found (rerun when includes change)')
+    parser.add_argument('--thin_archives', action='store_true',
+                        help='Write thin archives (objects are referenced, not copied) for library projects')
+    parser.add_argument('--post_link', type=str,
+                        help='Comma-separated outputs made from linked elf: hex, bin, lss, size', default=None)
+    parser.add_argument('--no_regen', action='store_true',
+                        help='Do not write rule that regenerates build.ninja when project files change')
+    parser.add_argument('--watch', action='store_true',
+                        help='Stay resident and regenerate when project files (or referenced library projects) change')
+    parser.add_argument('--watch_poll', type=float,
+                        help='Poll project files every given seconds instead of inotify (for network drives)',
+                        default=None)
+    parser.add_argument('--debounce', type=float,
+                        help='Seconds without changes after which watch mode regenerates', default=0.3)
+    parser.add_argument('--timings', type=str, nargs='?', const='-',
+                        help='Write JSON with time and allocated memory (size and peak) per conversion phase'
+                             ' to file (stderr if absent)', default=None)
+    parser.add_argument('--profile', type=str, help='Run conversion under cProfile, write stats to file',
+                        default=None)
 
     # get all data from command line
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     # print(args)
+    if cwd is not None:
+        resolve_paths(args, cwd)
 
     _flags = args.flags.split(' ') if args.flags else []
     _add_defs = args.add_defs.split(' ') if args.add_defs else []
     _del_defs = args.del_defs.split(' ') if args.del_defs else []
     # print(_flags, _add_defs, _del_defs)
+    if args.unity and args.unity != 'dir' and not (args.unity.isdigit() and int(args.unity) > 1):
+        parser.error('--unity must be dir or batch size greater than 1')
+    _unity_exclude = args.unity_exclude.split(',') if args.unity_exclude else []
+    _post_link = args.post_link.split(',') if args.post_link else []
+    if any(kind not in ConvertOptions.POST_LINK for kind in _post_link):
+        parser.error('--post_link must be comma-separated list of ' + ', '.join(ConvertOptions.POST_LINK))
+    if args.compile_pool and args.compile_pool != 'auto' and not args.compile_pool.isdigit():
+        parser.error('--compile_pool must be auto or depth')
+    if args.distributed and args.compiler_launcher:
+        parser.error('--distributed can\'t be combined with --compiler_launcher (set CCACHE_PREFIX to distribute'
+                     ' ccache misses instead)')
+    if (args.local_preprocess or args.local_pool) and not args.distributed:
+        parser.error('--local_preprocess and --local_pool require --distributed')
+    _options = ConvertOptions(compiler_launcher=args.compiler_launcher, pch=args.pch, unity=args.unity,
+                              unity_exclude=_unity_exclude, timings=PhaseTimings() if args.timings else None,
+                              compile_pool=args.compile_pool, ar_pool=args.ar_pool, link_pool=args.link_pool,
+                              thin_archives=args.thin_archives, post_link=_post_link,
+                              distributed=args.distributed, local_preprocess=args.local_preprocess,
+                              local_pool=args.local_pool, optimize_includes=args.optimize_includes,
+                              unified=args.unified, regen=not args.no_regen, top_ninja=args.top_ninja,
+                              cache_dir=args.cache_dir, streaming=args.streaming)
+
+    if cache is not None and args.cache_dir:
+        cache = cache.with_disk_cache(ProjectCache(args.cache_dir))
+    run = watch if args.watch else functools.partial(convert, cache=cache)
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            ret = profiler.runcall(run, args, _flags, _add_defs, _del_defs, _options)
+        finally:
+            profiler.dump_stats(args.profile)
+    else:
+        ret = run(args, _flags, _add_defs, _del_defs, _options)
+
+    if args.timings == '-':
+        _options.timings.dump(sys.stderr)
+    elif args.timings:
+        with open(args.timings, 'w') as f:
+            _options.timings.dump(f)
+    return ret
+
+
+def resolve_paths(args, cwd):
+    """Makes paths in args absolute (relative to cwd), so they don't depend on current dir of process"""
+    from asninja.converter import Converter
+    for name in ['prj', 'sln', 'cache_dir', 'timings', 'profile']:
+        value = getattr(args, name)
+        if value and value != '-':
+            setattr(args, name, os.path.join(cwd, value))
+    # outpath of project defaults to current dir (of config dirs) or config dir, outpath of solution is relative to
+    # project dirs
+    if args.prj:
+        outpath = args.outpath
+        if not outpath:
+            outpath = '' if Converter.is_multi_config(args.config) else args.config
+        args.outpath = os.path.join(cwd, outpath)
+
+
+def convert(args, flags, add_defs, del_defs, options, cache=None):
+    """Converts project or solution from command line args, returns exit code"""
+    from asninja.converter import Converter
+    if args.sln:
+        results = Converter.convert_solution(as_sln=args.sln, config=args.config, outpath=args.outpath, flags=flags,
+                                             add_defs=add_defs, del_defs=del_defs,
+                                             custom_toolchain=args.gcc_toolchain, jobs=args.jobs, options=options,
+                                             cache=cache)
+        return 1 if write_results(results) else 0
+
+    changed = Converter.convert(as_prj=args.prj, config=args.config, outpath=args.outpath, output=args.output,
+                                flags=flags, add_defs=add_defs, del_defs=del_defs,
+                                custom_toolchain=args.gcc_toolchain, options=options, cache=cache)
+    if not changed:
+        sys.stdout.write('build.ninja unchanged\n')
+    return 0
+
+
+def write_results(results):
+    """Writes (name, elapsed, changed, error) of conversions, returns number of failed ones"""
+    failed = 0
+    for name, elapsed, changed, error in results:
+        status = error if error else ('ok' if changed else 'unchanged')
+        sys.stdout.write('{:<32} {:8.3f}s {}\n'.format(name, elapsed, status))
+        if error:
+            failed += 1
+    sys.stdout.write('{} project(s), {} failed\n'.format(len(results), failed))
+    sys.stdout.flush()
+    return failed
+
+
+def watch(args, flags, add_defs, del_defs, options):
+    """Converts project or solution from command line args and reconverts it on changes until interrupted"""
+    from asninja.cache import MemoryProjectCache, ProjectCache
+    from asninja.converter import Converter
+    from asninja.watch import ProjectWatch, make_watcher
+    if args.sln:
+        tasks = Converter.solution_tasks(as_sln=args.sln, config=args.config, outpath=args.outpath, flags=flags,
+                                         add_defs=add_defs, del_defs=del_defs, custom_toolchain=args.gcc_toolchain,
+                                         options=options)
+    else:
+        name, __ = os.path.splitext(os.path.basename(args.prj))
+        tasks = [(name, dict(as_prj=args.prj, config=args.config, outpath=args.outpath, output=args.output,
+                             flags=flags, add_defs=add_defs, del_defs=del_defs, custom_toolchain=args.gcc_toolchain,
+                             options=options))]
 
-    Converter.convert(as_prj=args.prj, config=args.config, outpath=args.outpath, output=args.output, flags=_flags,
-                      add_defs=_add_defs, del_defs=_del_defs, custom_toolchain=args.gcc_toolchain)
+    cache = MemoryProjectCache(ProjectCache(args.cache_dir) if args.cache_dir else None)
+    watcher = make_watcher(args.watch_poll)
+    project_watch = ProjectWatch(tasks, watcher, args.debounce, cache)
+    try:
+        write_results(project_watch.run())
+        sys.stdout.write('Watching {} project file(s) with {}, press Ctrl+C to stop\n'.format(
+            len(set().union(*project_watch.deps.values())), type(watcher).__name__))
+        sys.stdout.flush()
+        while True:
+            results = project_watch.step()
+            if results:
+                write_results(results)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
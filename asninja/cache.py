@@ -0,0 +1,230 @@
+import collections
+import contextlib
+import copy
+import hashlib
+import json
+import os
+import threading
+import zlib
+
+import asninja
+import asninja.helpers
+from .parser import AtmelStudioProject, RefLibrary
+
+
+class ProjectCache(object):
+    """On-disk cache of derived project models, keyed by project file content hash and asninja version"""
+    FILE_EXT = '.json.z'
+
+    def __init__(self, cache_dir, max_size=64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def key(self, file_name, output):
+        h = hashlib.sha256()
+        with open(file_name, 'rb') as f:
+            h.update(f.read())
+        h.update('\0{}\0{}'.format(asninja.__version__, output).encode('utf-8'))
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + self.FILE_EXT)
+
+    def load(self, file_name, output, project_class=AtmelStudioProject):
+        """Returns cached model of project, parses project (with project_class) only on cache miss"""
+        key = self.key(file_name, output)
+        data = None
+        try:
+            with open(self.path(key), 'rb') as f:
+                data = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+            # mtime is used as last access time for LRU eviction
+            os.utime(self.path(key))
+        except (OSError, ValueError, zlib.error):
+            data = None
+        if data is None:
+            return CachedProject.from_project(project_class(file_name, output), file_name, output, key)
+        return CachedProject(file_name, output, key, data, project_class=project_class)
+
+    def store(self, cp):
+        """Saves model if it was created or extended (new flags derived) since load"""
+        if not cp.changed:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        content = zlib.compress(json.dumps(cp.data, separators=(',', ':')).encode('utf-8'))
+        asninja.helpers.write_if_changed(self.path(cp.key), content)
+        cp.changed = False
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries while cache is larger than max_size"""
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(self.FILE_EXT):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total_size += st.st_size
+        entries.sort()
+        for __, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+
+class MemoryProjectCache(object):
+    """In-memory LRU cache of derived project models for long running processes (watch mode, server).
+
+    Model is reused while project file is unchanged (same mtime, size and inode), on change it's loaded from
+    disk cache (when given) or parsed again. Derived flags are kept in memory too. Cache can be used from several
+    threads, each load returns own view of model (views share derived data, not selected config).
+    """
+
+    def __init__(self, disk_cache=None, max_projects=None):
+        self.disk_cache = disk_cache
+        self.cache_dir = disk_cache.cache_dir if disk_cache else None
+        self.max_projects = max_projects
+        # (abs file name, output, project class, cache dir) -> (stat key, CachedProject), least recently used first
+        self.projects = collections.OrderedDict()
+        self.lock = threading.RLock()
+
+    def with_disk_cache(self, disk_cache):
+        """Cache that shares models (and lock) with this one and is backed by disk_cache"""
+        cache = MemoryProjectCache(disk_cache, self.max_projects)
+        cache.projects = self.projects
+        cache.lock = self.lock
+        return cache
+
+    @classmethod
+    def stat_key(cls, file_name):
+        st = os.stat(file_name)
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def load(self, file_name, output, project_class=AtmelStudioProject):
+        key = (os.path.abspath(file_name), output, project_class, self.cache_dir)
+        stat_key = self.stat_key(file_name)
+        with self.lock:
+            entry = self.projects.get(key)
+            if entry is not None and entry[0] == stat_key:
+                self.projects.move_to_end(key)
+                return entry[1].view()
+        # parsed without lock, so other projects can be loaded meanwhile
+        if self.disk_cache:
+            cp = self.disk_cache.load(file_name, output, project_class)
+        else:
+            cp = CachedProject.from_project(project_class(file_name, output), file_name, output, None)
+        cp.lock = self.lock
+        with self.lock:
+            self.projects[key] = stat_key, cp
+            self.projects.move_to_end(key)
+            while self.max_projects and len(self.projects) > self.max_projects:
+                self.projects.popitem(last=False)
+        return cp
+
+    def invalidate(self, file_names):
+        """Forgets models of files (changes within mtime granularity of file system keep stat key)"""
+        file_names = set(os.path.abspath(file_name) for file_name in file_names)
+        with self.lock:
+            for key in [key for key in self.projects if key[0] in file_names]:
+                del self.projects[key]
+
+    def store(self, cp):
+        if self.disk_cache:
+            self.disk_cache.store(cp)
+        else:
+            cp.changed = False
+
+
+class CachedProject(object):
+    """Derived model of AtmelStudioProject with same interface as used by Converter.
+
+    Flags are cached per config and arguments, on miss the project is parsed and flags are derived.
+    """
+
+    def __init__(self, file_name, output, key, data, asp=None, project_class=AtmelStudioProject):
+        self.file_name = file_name
+        self.output_arg = output
+        self.key = key
+        self.data = data
+        self.asp = asp
+        self.project_class = project_class
+        self.changed = asp is not None
+        self.config = None
+        # lock of MemoryProjectCache, guards parsed project shared by views
+        self.lock = None
+        self.is_cpp = data['is_cpp']
+        self.is_lib = data['is_lib']
+        self.output_name = data['output_name']
+        self.output_ext = data['output_ext']
+        self.toolchain_settings = data['toolchain_settings']
+        self.ref_libs = [RefLibrary(*ref_lib) for ref_lib in data['ref_libs']]
+
+    @classmethod
+    def from_project(cls, asp, file_name, output, key):
+        data = {'is_cpp': asp.is_cpp,
+                'is_lib': asp.is_lib,
+                'output_name': asp.output_name,
+                'output_ext': asp.output_ext,
+                'toolchain_settings': asp.toolchain_settings,
+                'toolchain_id': list(asp.toolchain_id()),
+                'ref_libs': [[ref_lib.path, ref_lib.raw_name, ref_lib.prj_file] for ref_lib in asp.ref_libs],
+                'src_files': asp.src_files(),
+                'configs': asp.configs(),
+                'flags': {}}
+        return CachedProject(file_name, output, key, data, asp, type(asp))
+
+    def view(self):
+        """Model that shares data and parsed project with this one, but selects config on its own"""
+        cp = copy.copy(self)
+        cp.config = None
+        cp.changed = False
+        return cp
+
+    def project(self):
+        if self.asp is None:
+            self.asp = self.project_class(self.file_name, self.output_arg)
+        return self.asp
+
+    def output(self):
+        assert self.output_name is not None
+        assert self.output_ext
+        return self.output_name + self.output_ext
+
+    def toolchain_id(self):
+        return tuple(self.data['toolchain_id'])
+
+    def configs(self):
+        return list(self.data['configs'])
+
+    def src_files(self):
+        return list(self.data['src_files'])
+
+    def select_config(self, config_name):
+        self.config = config_name if config_name in self.data['configs'] else None
+        return self.config is not None
+
+    def flags(self, kind, args, derive):
+        assert self.config is not None
+        key = json.dumps([self.config, kind] + args)
+        flags = self.data['flags'].get(key)
+        if flags is None:
+            with self.lock if self.lock is not None else contextlib.nullcontext():
+                asp = self.project()
+                asp.select_config(self.config)
+                flags = derive(asp)
+            self.data['flags'][key] = flags
+            self.changed = True
+        return list(flags)
+
+    def compiler_flags(self, c_compiler, add_defs, del_defs, add_undefs):
+        return self.flags('compiler', [c_compiler, add_defs, del_defs, add_undefs],
+                          lambda asp: asp.compiler_flags(c_compiler, add_defs, del_defs, add_undefs))
+
+    def linker_flags(self, outdir):
+        return self.flags('linker', [outdir], lambda asp: asp.linker_flags(outdir))
+
+    def archiver_flags(self):
+        return self.flags('archiver', [], lambda asp: asp.archiver_flags())
@@ -0,0 +1,96 @@
+"""asninja client: forwards asninja call to conversion server (asninja serve), converts in-process without server.
+
+Only standard library modules are imported until conversion runs in-process, so served call doesn't pay for imports
+of converter.
+"""
+import json
+import os
+import socket
+import sys
+import tempfile
+
+# calls that aren't served: subcommands and options of long running or process-wide modes
+LOCAL_COMMANDS = ['serve', 'client', 'report', 'map', 'size', 'headers']
+LOCAL_OPTIONS = ['--watch', '--profile']
+# environment variables conversion depends on (tools looked up in PATH, cache of toolchain discovery)
+CONVERSION_ENV = ['PATH', 'XDG_CACHE_HOME']
+
+
+def default_socket_path():
+    """ASNINJA_SOCKET or asninja.sock in XDG_RUNTIME_DIR (per-user file in temp dir if absent)"""
+    if os.environ.get('ASNINJA_SOCKET'):
+        return os.environ['ASNINJA_SOCKET']
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'asninja.sock')
+    return os.path.join(tempfile.gettempdir(), 'asninja-{}.sock'.format(os.getuid() if hasattr(os, 'getuid') else 0))
+
+
+def is_served(argv):
+    """True if call with argv can be run by server"""
+    if argv and argv[0] in LOCAL_COMMANDS:
+        return False
+    return not any(arg.split('=', 1)[0] in LOCAL_OPTIONS for arg in argv)
+
+
+def conversion_env():
+    """Environment conversion depends on: CONVERSION_ENV variables and Python that runs regen commands"""
+    env = {name: os.environ.get(name) for name in CONVERSION_ENV}
+    env['sys.executable'] = sys.executable
+    return env
+
+
+def connect(socket_path):
+    """Socket connected to server, None if no server listens on socket_path"""
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def send_request(socket_path, argv, cwd, env=None):
+    """Response of server (dict with exit_code, stdout and stderr), None if there is no server or it went away.
+
+    env is conversion_env() of caller (current one if None), server doesn't run call with other environment (exit_code
+    is None).
+    """
+    sock = connect(socket_path)
+    if sock is None:
+        return None
+    if env is None:
+        env = conversion_env()
+    try:
+        sock.sendall(json.dumps({'argv': argv, 'cwd': cwd, 'env': env}).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    except OSError:
+        return None
+    finally:
+        sock.close()
+    if not line:
+        return None
+    return json.loads(line.decode('utf-8'))
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if is_served(argv):
+        response = send_request(default_socket_path(), argv, os.getcwd())
+        if response is not None and response['exit_code'] is not None:
+            sys.stdout.write(response['stdout'])
+            sys.stderr.write(response['stderr'])
+            return response['exit_code']
+
+    # no server (or it has other environment), converter is imported only now
+    from asninja.asninja import main as asninja_main
+    return asninja_main(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
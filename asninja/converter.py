@@ -1,15 +1,189 @@
+import collections
+import contextlib
+import copy
+import fnmatch
+import io
 import os
+import posixpath
+import re
+import shlex
+import shutil
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import ninja_syntax
 
 import asninja.helpers
-from .parser import AtmelStudioProject
+from .cache import ProjectCache
+from .graph import BuildGraph
+from .include_paths import optimize_include_flags
+from .parser import AtmelStudioProject, StreamingAtmelStudioProject
+from .solution import AtmelStudioSolution
+from .timings import PhaseTimings
 from .toolchains.atmel_studio import AtmelStudioGccToolchain
+from .toolchains.discovery import ToolchainDiscovery
 from .toolchains.gcc import GccToolchain
 
 
+class ConvertOptions(object):
+    """Options of conversion and generated build graph (beyond project, config and flags)"""
+    LAUNCHERS = ['ccache', 'sccache']
+    LAUNCHER_STATS = {'ccache': '-s', 'sccache': '--show-stats'}
+    POOLS = ['compile', 'ar', 'link']
+    DISTRIBUTORS = ['distcc', 'icecc']
+    # kinds of jobs that stay on local host in distributed mode (local are preprocessing and precompiled header)
+    LOCAL_JOBS = ['ar', 'link', 'local']
+    # compile jobs per local core in distributed mode (most of them wait for remote hosts)
+    DISTRIBUTED_JOBS_PER_CORE = 4
+    POST_LINK = ['hex', 'bin', 'lss', 'size']
+    # memory of one compile job, for compile pool depth derived from available memory
+    COMPILE_JOB_MEMORY = 512 * 1024 * 1024
+
+    def __init__(self, compiler_launcher=None, pch=None, unity=None, unity_exclude=None, timings=None,
+                 compile_pool=None, ar_pool=None, link_pool=None, thin_archives=False, post_link=None,
+                 distributed=None, local_preprocess=False, local_pool=None, optimize_includes=False, unified=False,
+                 regen=True, top_ninja=False, cache_dir=None, streaming=False):
+        self.compiler_launcher = compiler_launcher
+        self.pch = pch
+        # 'dir' (batch per directory) or batch size
+        self.unity = unity
+        self.unity_exclude = unity_exclude or []
+        # PhaseTimings that collects timings of conversion phases (not part of generated graph)
+        self.timings = timings
+        # depths of job pools, compile_pool can be 'auto' (derived from available memory)
+        self.compile_pool = compile_pool
+        self.ar_pool = ar_pool
+        self.link_pool = link_pool
+        self.thin_archives = thin_archives
+        # outputs made from linked elf (hex, bin, lss, size)
+        self.post_link = post_link or []
+        # front-end (distcc, icecc) that sends compile jobs to remote hosts, can be 'auto' (first found)
+        self.distributed = distributed
+        # sources are preprocessed locally, remote hosts compile preprocessed sources (include paths aren't portable)
+        self.local_preprocess = local_preprocess
+        # depth of pool of jobs that stay on local host in distributed mode
+        self.local_pool = local_pool
+        # include paths are reduced to ones used by sources (see IncludePathOptimizer)
+        self.optimize_includes = optimize_includes
+        # graphs of referenced libraries are included with subninja (single build graph)
+        self.unified = unified
+        # build.ninja has generator edge that regenerates it
+        self.regen = regen
+        # top-level build.ninja with phony target per config is written
+        self.top_ninja = top_ninja
+        # parsed projects (and derived flags) are cached in cache_dir between runs
+        self.cache_dir = cache_dir
+        # projects are loaded with StreamingAtmelStudioProject
+        self.streaming = streaming
+
+    def phase(self, name):
+        """Context of timed conversion phase (does nothing without timings)"""
+        if self.timings is None:
+            return contextlib.nullcontext()
+        return self.timings.phase(name)
+
+    def cli_args(self):
+        """Command line arguments of asninja for these options"""
+        args = []
+        if self.unified:
+            args += ['--unified']
+        if not self.regen:
+            args += ['--no_regen']
+        if self.top_ninja:
+            args += ['--top_ninja']
+        if self.cache_dir:
+            args += ['--cache_dir', os.path.abspath(self.cache_dir)]
+        if self.streaming:
+            args += ['--streaming']
+        if self.compiler_launcher:
+            args += ['--compiler_launcher', self.compiler_launcher]
+        if self.pch:
+            args += ['--pch', self.pch]
+        if self.unity:
+            args += ['--unity', str(self.unity)]
+        if self.unity_exclude:
+            args += ['--unity_exclude', ','.join(self.unity_exclude)]
+        for kind in self.POOLS:
+            depth = getattr(self, kind + '_pool')
+            if depth:
+                args += ['--{}_pool'.format(kind), str(depth)]
+        if self.distributed:
+            args += ['--distributed', self.distributed]
+        if self.local_preprocess:
+            args += ['--local_preprocess']
+        if self.local_pool:
+            args += ['--local_pool', str(self.local_pool)]
+        if self.optimize_includes:
+            args += ['--optimize_includes']
+        if self.thin_archives:
+            args += ['--thin_archives']
+        if self.post_link:
+            args += ['--post_link', ','.join(self.post_link)]
+        return args
+
+    def resolved(self):
+        """Copy of options with auto-detected values resolved"""
+        options = copy.copy(self)
+        if self.compiler_launcher == 'auto':
+            options.compiler_launcher = None
+            for launcher in self.LAUNCHERS:
+                path = shutil.which(launcher)
+                if path:
+                    options.compiler_launcher = path
+                    break
+        if self.distributed == 'auto':
+            options.distributed = None
+            for distributor in self.DISTRIBUTORS:
+                path = shutil.which(distributor)
+                if path:
+                    options.distributed = path
+                    break
+        if self.compile_pool == 'auto':
+            memory = asninja.helpers.available_memory()
+            options.compile_pool = max(1, memory // self.COMPILE_JOB_MEMORY) if memory else None
+        if options.distributed:
+            cores = os.cpu_count() or 1
+            if not options.compile_pool:
+                options.compile_pool = self.DISTRIBUTED_JOBS_PER_CORE * cores
+            if not options.local_pool:
+                options.local_pool = cores
+        return options
+
+    def pools(self):
+        """Pool names with depths by kind (compile, ar, link, local), kinds without depth are not pooled.
+
+        In distributed mode archive, link and other local jobs share local pool (unless own depth is given).
+        """
+        pools = collections.OrderedDict()
+        for kind in self.POOLS:
+            depth = getattr(self, kind + '_pool')
+            if depth:
+                pools[kind] = kind + '_pool', int(depth)
+        if self.distributed and self.local_pool:
+            for kind in self.LOCAL_JOBS:
+                if kind not in pools:
+                    pools[kind] = 'local_pool', int(self.local_pool)
+        return pools
+
+    def launcher_stats_command(self):
+        """Command that prints statistics of compiler launcher cache (None for unknown launcher)"""
+        if not self.compiler_launcher:
+            return None
+        name, __ = os.path.splitext(os.path.basename(self.compiler_launcher))
+        if name not in self.LAUNCHER_STATS:
+            return None
+        return asninja.helpers.quote_command([self.compiler_launcher, self.LAUNCHER_STATS[name]])
+
+
 class Converter(object):
+    # header in builddir that includes precompiled header, gch is built next to it (name differs from any header)
+    PCH_WRAPPER = 'asninja_pch.h'
+    # directory in builddir with generated unity sources
+    UNITY_DIR = 'asninja_unity'
+    # depfile of regen edge, missing file listed there makes build.ninja dirty (missing explicit input is error)
+    REGEN_DEPFILE = 'build.ninja.d'
+
     @classmethod
     def detect_linker_script(cls, lflags):
         """Search '-T' params in lflags, in finded value strips first '../'"""
@@ -26,15 +200,462 @@ class Converter(object):
         return linker_script
 
     @classmethod
-    def convert(cls, as_prj, config, outpath, output, flags, add_defs, del_defs, custom_toolchain=None):
-        asp = AtmelStudioProject(as_prj, output)
+    def thin_archiver_flags(cls, arflags):
+        """Archiver flags with c, s and T (thin archive) modifiers added to operation (first option).
+
+        First flag may have several options (like ArchiverFlags "-r -v" of project), it is split.
+        """
+        if arflags:
+            try:
+                args = shlex.split(arflags[0])
+            except ValueError:
+                # unbalanced quotes
+                args = arflags[0].split()
+            if args and re.match(r'^-[a-zA-Z]+$', args[0]):
+                key = args[0] + ''.join(m for m in 'csT' if m not in args[0])
+                return [key] + [shlex.quote(arg) for arg in args[1:]] + arflags[1:]
+        return ['-rcsT'] + arflags
+
+    @classmethod
+    def remove_output_command(cls):
+        """Command prefix that removes $out (if exists) before next command.
 
+        del takes path with backslashes (slash starts switch), edge gives it as $out_native (see native_output).
+        """
+        if os.name == 'nt':
+            return 'cmd /c del /f /q "$out_native" 2>nul & '
+        return 'rm -f $out && '
+
+    @classmethod
+    def native_output(cls, builddir, output):
+        """Variables of edge for remove_output_command: output (in builddir) with backslashes on Windows"""
+        if os.name == 'nt':
+            return {'out_native': posixpath.join(builddir, output).replace('/', '\\')}
+        return None
+
+    @classmethod
+    def detect_toolchain(cls, asp, custom_toolchain=None):
         if custom_toolchain:
-            toolchain = GccToolchain(custom_toolchain)
+            return GccToolchain(custom_toolchain)
+        elif sys.platform.startswith('win'):
+            return AtmelStudioGccToolchain.from_project(asp)
+        else:
+            # no registry of Atmel Studio, toolchain is searched in PATH and common prefixes
+            return ToolchainDiscovery().find(asp.toolchain_id())
+
+    @classmethod
+    def asninja_args(cls):
+        """Command line (as list) that invokes asninja"""
+        # asninja may be run from source tree, so it's imported from known location instead of 'python -m asninja'
+        pkg_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        bootstrap = 'import sys; sys.path.insert(0, {!r}); from asninja.asninja import main; sys.exit(main())'.format(
+            pkg_parent)
+        return [sys.executable, '-c', bootstrap]
+
+    @classmethod
+    def shell_command(cls, command):
+        """Command run by shell (for redirections), ninja runs commands without shell on Windows"""
+        if os.name == 'nt':
+            return 'cmd /c ' + command
+        return command
+
+    @classmethod
+    def regen_command(cls, as_prj, config, outpath, output, flags, add_defs, del_defs, custom_toolchain=None,
+                      options=None):
+        """Command line that re-invokes converter with same arguments (paths are absolute).
+
+        Top-level build.ninja isn't regenerated (regen is run for config outpath).
+        """
+        args = cls.asninja_args() + ['--prj', os.path.abspath(as_prj), '--config', config,
+                                     '--outpath', os.path.abspath(outpath)]
+        if output:
+            args += ['--output', output]
+        if flags:
+            args += ['--flags', ' '.join(flags)]
+        if add_defs:
+            args += ['--add_defs', ' '.join(add_defs)]
+        if del_defs:
+            args += ['--del_defs', ' '.join(del_defs)]
+        if custom_toolchain:
+            args += ['--gcc_toolchain', custom_toolchain]
+        if options:
+            options = copy.copy(options)
+            options.top_ninja = False
+            args += options.cli_args()
+        return asninja.helpers.quote_command(args)
+
+    @classmethod
+    def regen_deps(cls):
+        """Files of asninja installation"""
+        pkg_dir = os.path.dirname(os.path.abspath(__file__))
+        deps = []
+        for root, __, files in os.walk(pkg_dir):
+            deps += [os.path.join(root, f) for f in files if f.endswith('.py')]
+        return sorted(deps)
+
+    @classmethod
+    def depfile(cls, target, deps):
+        """Content of depfile (make syntax, as written by gcc -MD) with deps of target"""
+        def escape(path):
+            return path.replace('\\', '/').replace('$', '$$').replace('#', '\\#').replace(' ', '\\ ')
+        return ' \\\n'.join([escape(target) + ':'] + [' ' + escape(dep) for dep in deps]) + '\n'
+
+    @classmethod
+    def load_project(cls, as_prj, output, cache=None, streaming=False):
+        project_class = StreamingAtmelStudioProject if streaming else AtmelStudioProject
+        if cache is None:
+            return project_class(as_prj, output)
+        return cache.load(as_prj, output, project_class)
+
+    @classmethod
+    def detect_pch_header(cls, asp, prj_dir, prj_path='..'):
+        """Header that is included first by most of C++ sources (None if there is no such header).
+
+        Header is included by PCH_WRAPPER in builddir, so quoted header found next to including source is returned
+        relative to builddir (prj_path is project dir relative to builddir), other ones are found through include
+        paths.
+        """
+        include_re = re.compile(r'^\s*#\s*include\s*([<"])([^>"]+)[>"]')
+        counts = collections.Counter()
+        for src_file in asp.src_files():
+            if not src_file.endswith('.cpp'):
+                continue
+            src_dir = posixpath.dirname(src_file.replace('\\', '/'))
+            try:
+                with open(os.path.join(prj_dir, src_file), 'r', errors='replace') as f:
+                    for line in f:
+                        m = include_re.match(line)
+                        if m:
+                            header = m.group(2)
+                            if m.group(1) == '"' and os.path.isfile(os.path.join(prj_dir, src_dir, header)):
+                                header = posixpath.normpath(posixpath.join(prj_path, src_dir, header))
+                            counts[header] += 1
+                            break
+            except OSError:
+                pass
+        if not counts:
+            return None
+        header, count = counts.most_common(1)[0]
+        return header if count > 1 else None
+
+    @classmethod
+    def pch_header(cls, asp, prj_dir, options, prj_path='..'):
+        """Header to precompile for C++ project (configured or auto-detected)"""
+        if not options.pch or not asp.is_cpp:
+            return None
+        if options.distributed and options.local_preprocess:
+            # preprocessed sources can't use precompiled header
+            return None
+        if options.pch == 'auto':
+            return cls.detect_pch_header(asp, prj_dir, prj_path)
+        return options.pch
+
+    @classmethod
+    def unity_batches(cls, asp, options):
+        """Groups sources (by directory or by batch size) to unity sources, returns list of (name, src_files).
+
+        Sources matched by unity_exclude patterns and batches of single source are compiled as is.
+        """
+        if not options.unity:
+            return []
+        groups = collections.OrderedDict()
+        for src_file in asp.src_files():
+            __, file_ext = os.path.splitext(src_file)
+            if file_ext not in ['.c', '.cpp'] or any(fnmatch.fnmatch(src_file, pattern)
+                                                     for pattern in options.unity_exclude):
+                continue
+            key = (file_ext, posixpath.dirname(src_file) if options.unity == 'dir' else '')
+            groups.setdefault(key, []).append(src_file)
+
+        batches = []
+        for (file_ext, __), src_files in groups.items():
+            size = len(src_files) if options.unity == 'dir' else int(options.unity)
+            for i in range(0, len(src_files), size):
+                batch = src_files[i:i + size]
+                if len(batch) > 1:
+                    # numbering is shared by C and C++ batches, so object files don't clash
+                    batches.append(('{}/unity_{}{}'.format(cls.UNITY_DIR, len(batches), file_ext), batch))
+        return batches
+
+    @classmethod
+    def unity_source(cls, src_files, prj_path='..'):
+        """Content of unity source (sources are relative to project dir, unity source is in builddir/UNITY_DIR)"""
+        return ''.join('#include "{}"\n'.format(posixpath.join('..', prj_path, src_file)) for src_file in src_files)
+
+    @classmethod
+    def generated_sources(cls, asp, prj_dir, options, prj_path='..'):
+        """Sources generated to builddir, returns pch_header, unity_batches and files (name -> content)"""
+        files = {}
+        pch_header = cls.pch_header(asp, prj_dir, options, prj_path)
+        if pch_header:
+            files[cls.PCH_WRAPPER] = '#include "{}"\n'.format(pch_header)
+        unity_batches = cls.unity_batches(asp, options)
+        for name, src_files in unity_batches:
+            files[name] = cls.unity_source(src_files, prj_path)
+        return pch_header, unity_batches, files
+
+    @classmethod
+    def select_configs(cls, asp, config):
+        """Config names from comma-separated string (or list), 'all' means all configs of project"""
+        if config == 'all':
+            return asp.configs()
+        return config.split(',') if isinstance(config, str) else list(config)
+
+    @classmethod
+    def is_multi_config(cls, config):
+        return config == 'all' or (',' in config if isinstance(config, str) else len(config) > 1)
+
+    @classmethod
+    def convert(cls, as_prj, config, outpath, output, flags, add_defs, del_defs, custom_toolchain=None,
+                options=None, cache=None):
+        """Converts project for one or several configs (project is parsed once).
+
+        For single config outpath is output dir (config name if absent), for several configs outpath is parent
+        of per-config output dirs (current dir if absent).
+        options (ConvertOptions) control conversion and generated build graph.
+        With options.cache_dir parsed projects (and derived flags) are cached between runs, cache (ProjectCache or
+        MemoryProjectCache) is used instead of one for cache_dir if given.
+        """
+        if options is None:
+            options = ConvertOptions()
+        if cache is None and options.cache_dir:
+            cache = ProjectCache(options.cache_dir)
+        config_graphs = cls.graphs(as_prj, config, outpath, output, flags, add_defs, del_defs, custom_toolchain,
+                                   cache, options)
+
+        changed = False
+        for __, config_outpath, graphs in config_graphs:
+            if cls.write_graphs(config_outpath, graphs, options):
+                changed = True
+
+        if options.top_ninja:
+            top_path = os.path.dirname(config_graphs[0][1])
+            graphs = {'build.ninja': cls.top_graph([os.path.basename(p) for __, p, __ in config_graphs])}
+            if cls.write_graphs(top_path, graphs, options):
+                changed = True
+        return changed
+
+    @classmethod
+    def graphs(cls, as_prj, config, outpath, output, flags, add_defs, del_defs, custom_toolchain=None, cache=None,
+               options=None):
+        """Build graphs of project for one or several configs without writing them.
+
+        Returns list of (config, outpath, graphs), graphs are file name (relative to outpath) -> BuildGraph or
+        content of generated source. Arguments are as of convert().
+        """
+        if options is None:
+            options = ConvertOptions()
+        with options.phase('parse'):
+            asp = cls.load_project(as_prj, output, cache, options.streaming)
+        with options.phase('toolchain'):
+            toolchain = cls.detect_toolchain(asp, custom_toolchain)
+
+        configs = cls.select_configs(asp, config)
+        if len(configs) == 1 and not cls.is_multi_config(config):
+            outpaths = [outpath if outpath else configs[0]]
         else:
-            toolchain = AtmelStudioGccToolchain.from_project(asp)
+            outpaths = [os.path.join(outpath if outpath else '', c) for c in configs]
+
+        config_graphs = []
+        lib_asps = {}
+        graph_options = options.resolved()
+        for config_name, config_outpath in zip(configs, outpaths):
+            config_graphs.append((config_name, config_outpath,
+                                  cls.config_graphs(asp, toolchain, as_prj, config_name, config_outpath, output,
+                                                    flags, add_defs, del_defs, custom_toolchain, lib_asps, cache,
+                                                    options, graph_options)))
+
+        if cache:
+            with options.phase('cache'):
+                cache.store(asp)
+                for lib_asp, __ in lib_asps.values():
+                    cache.store(lib_asp)
+        return config_graphs
+
+    @classmethod
+    def project_outdir(cls, prj_dir, outpath):
+        """Output dir of project (dir under project dir, like config dir) and project dir relative to outpath.
+
+        outpath is output dir itself or its subdir (like ones of solution projects sharing output dir), flags of
+        project are relative to output dir. outpath outside of project dir is taken as output dir.
+        """
+        rel_path = os.path.relpath(os.path.abspath(outpath), os.path.abspath(prj_dir)).replace('\\', '/')
+        parts = rel_path.split('/')
+        if parts[0] in ['.', '..']:
+            return os.path.basename(outpath), '..'
+        return parts[0], posixpath.join(*['..'] * len(parts))
+
+    @classmethod
+    def config_graphs(cls, asp, toolchain, as_prj, config, outpath, output, flags, add_defs, del_defs,
+                      custom_toolchain, lib_asps, cache, options, graph_options):
+        """Graphs of project config: file name (relative to outpath) -> BuildGraph or content of generated source"""
+        prj_dir = os.path.dirname(as_prj)
+        outdir, prj_path = cls.project_outdir(prj_dir, outpath)
+
+        subninjas = None
+        lib_files = None
+        graphs = collections.OrderedDict()
+        ref_prjs = set()
+        # files read by include path optimizer (optimized flags depend on them)
+        scanned_files = []
+        if options.unified:
+            lib_files = cls.convert_ref_libs(asp, prj_dir, prj_path, outdir, config, flags, add_defs, del_defs,
+                                             custom_toolchain, ref_prjs, graphs, lib_asps, cache, graph_options,
+                                             scanned_files)
+            subninjas = [file_name for file_name in graphs if file_name.endswith('.ninja')]
+        else:
+            ref_prjs.update(os.path.normpath(os.path.join(prj_dir, ref_lib.prj_file))
+                            for ref_lib in asp.ref_libs)
+
+        # generated sources are written as graphs (only when changed), so unchanged batches keep mtime
+        with graph_options.phase('sources'):
+            pch_header, unity_batches, files = cls.generated_sources(asp, prj_dir, graph_options, prj_path)
+        graphs.update(files)
+
+        regen_outputs = ['build.ninja'] + list(graphs)
+        with graph_options.phase('graph'):
+            graphs['build.ninja'] = cls.project_graph(asp, toolchain, config, outdir, flags, add_defs, del_defs,
+                                                      subninjas=subninjas, options=graph_options,
+                                                      pch_header=pch_header, unity_batches=unity_batches,
+                                                      prj_dir=prj_dir, scanned_files=scanned_files, prj_path=prj_path,
+                                                      lib_files=lib_files)
+
+        if options.regen:
+            # build.ninja (and library graphs) depends on project, other deps can be removed (referenced projects,
+            # files of asninja, scanned sources, headers and include dirs of optimized include paths), so they are
+            # listed in depfile
+            deps = [os.path.relpath(p, outpath) for p in sorted(p for p in ref_prjs if os.path.isfile(p))]
+            deps += cls.regen_deps()
+            deps += [os.path.relpath(p, outpath) for p in sorted(set(scanned_files))]
+            graphs[cls.REGEN_DEPFILE] = cls.depfile('build.ninja', deps)
+            cls.add_regen_edge(graphs['build.ninja'],
+                               cls.regen_command(as_prj, config, outpath, output, flags, add_defs, del_defs,
+                                                 custom_toolchain, options),
+                               regen_outputs + [cls.REGEN_DEPFILE],
+                               [os.path.relpath(as_prj, outpath).replace('\\', '/')], cls.REGEN_DEPFILE)
+        return graphs
+
+    @classmethod
+    def write_graphs(cls, outpath, graphs, options):
+        """Writes graphs (file name -> BuildGraph or content) to outpath, returns True if any file was changed"""
+        with options.phase('render'):
+            contents = [(file_name, graph.to_ninja() if isinstance(graph, BuildGraph) else graph)
+                        for file_name, graph in graphs.items()]
+
+        linker_script = graphs['build.ninja'].variables.get('lflags') if 'build.ninja' in graphs else None
+        linker_script = cls.detect_linker_script(ninja_syntax.as_list(linker_script))
+        if linker_script:
+            sys.stdout.write('linker_script = ' + linker_script + '\n')
+
+        # graphs are written only when rendered completely and only if differs from existing files (keeps mtime)
+        changed = False
+        with options.phase('output'):
+            for file_name, content in contents:
+                file_name = os.path.join(outpath, file_name)
+                os.makedirs(os.path.dirname(file_name) or '.', exist_ok=True)
+                if asninja.helpers.write_if_changed(file_name, content):
+                    changed = True
+        return changed
+
+    @classmethod
+    def convert_ref_libs(cls, asp, prj_dir, prj_path, outdir, config, flags, add_defs, del_defs, custom_toolchain,
+                         visited, graphs, lib_asps, cache, options, scanned_files=None):
+        """Adds graphs of all (transitively) referenced libraries to graphs (file name -> BuildGraph or content).
+
+        Graph of each library keeps own builddir (outdir of library relative to outpath, prj_path is project dir
+        relative to outpath), so it can be included with subninja. Returns archives built by added graphs (relative
+        to outpath).
+        """
+        lib_files = []
+        for ref_lib in asp.ref_libs:
+            lib_prj = os.path.normpath(os.path.join(prj_dir, ref_lib.prj_file))
+            if lib_prj in visited:
+                continue
+            visited.add(lib_prj)
+            if not os.path.isfile(lib_prj):
+                sys.stdout.write('Skipping missing library project {}\n'.format(lib_prj))
+                continue
+
+            if lib_prj not in lib_asps:
+                with options.phase('parse'):
+                    lib_asp = cls.load_project(lib_prj, ref_lib.raw_name, cache, options.streaming)
+                with options.phase('toolchain'):
+                    lib_asps[lib_prj] = lib_asp, cls.detect_toolchain(lib_asp, custom_toolchain)
+            lib_asp, lib_toolchain = lib_asps[lib_prj]
+            lib_path = posixpath.normpath(posixpath.join(prj_path, ref_lib.path))
+            lib_builddir = posixpath.join(lib_path, outdir)
+
+            lib_files += cls.convert_ref_libs(lib_asp, os.path.dirname(lib_prj), lib_path, outdir, config, flags,
+                                              add_defs, del_defs, custom_toolchain, visited, graphs, lib_asps, cache,
+                                              options, scanned_files)
+
+            with options.phase('sources'):
+                pch_header, unity_batches, files = cls.generated_sources(lib_asp, os.path.dirname(lib_prj),
+                                                                         options)
+            for file_name, content in files.items():
+                graphs[posixpath.join(lib_builddir, file_name)] = content
+
+            with options.phase('graph'):
+                lib_graph = cls.project_graph(lib_asp, lib_toolchain, config, outdir, flags, add_defs, del_defs,
+                                              builddir=lib_builddir, options=options, pch_header=pch_header,
+                                              unity_batches=unity_batches, prj_dir=os.path.dirname(lib_prj),
+                                              scanned_files=scanned_files)
+            graphs[ref_lib.raw_name + '.ninja'] = lib_graph
+            if lib_graph.producer('$builddir/' + lib_asp.output()):
+                lib_files.append(posixpath.join(lib_builddir, lib_asp.output()))
+        return lib_files
+
+    @classmethod
+    def optimize_include_paths(cls, asp, prj_dir, outdir, flags, src_ext, scanned_files=None):
+        """Flags with include paths optimized for sources with src_ext, prints probe counts before and after.
+
+        Files read by optimizer (sources and headers) are added to scanned_files.
+        """
+        src_files = [os.path.join(prj_dir, src_file) for src_file in asp.src_files() if src_file.endswith(src_ext)]
+        flags, report = optimize_include_flags(flags, src_files, os.path.join(prj_dir, outdir), scanned_files)
+        if report is not None and report.unreadable:
+            sys.stdout.write("include paths of {} ({}) are not optimized, {} scanned files can't be read\n"
+                             .format(asp.output(), src_ext, report.unreadable))
+        elif report is not None:
+            sys.stdout.write('include paths of {} ({}): {} -> {} dirs ({} duplicate, {} unused{}), probes {} -> {}\n'
+                             .format(asp.output(), src_ext, report.dirs_before, report.dirs_after, report.duplicates,
+                                     report.unused, ', reorder refused' if report.refused else '',
+                                     report.probes_before, report.probes_after))
+        return flags
+
+    @classmethod
+    def project_graph(cls, asp, toolchain, config, outdir, flags, add_defs, del_defs, builddir='.', subninjas=None,
+                      options=None, pch_header=None, unity_batches=None, prj_dir=None, scanned_files=None,
+                      prj_path='..', lib_files=None):
+        """Build graph (BuildGraph) of project, nothing is written to disk.
+
+        builddir is relative to directory where ninja runs, when not '.' the graph is a subninja of other project.
+        prj_path is project dir relative to builddir, relative paths of flags (relative to outdir in project dir)
+        are rebased to builddir.
+        options are resolved ConvertOptions.
+        pch_header is precompiled for C++ sources (its wrapper PCH_WRAPPER is written by caller).
+        unity_batches are (name, src_files) of unity sources in builddir (written by caller), compiled instead of
+        its sources.
+        prj_dir is dir of project, sources are scanned there when include paths are optimized (read files are added
+        to scanned_files).
+        lib_files are archives of (transitively) referenced libraries built by subninjas (relative to builddir), link
+        depends on them besides archives of referenced libraries, so all of them are built.
+        """
+        if options is None:
+            options = ConvertOptions()
+        graph = BuildGraph()
+
         cc = toolchain.cc()
         cxx = toolchain.cxx()
+        # compiler launcher (ccache, sccache) prefixes compile commands only
+        launcher = ''
+        if options.compiler_launcher:
+            launcher = asninja.helpers.quote_command([options.compiler_launcher]) + ' '
+        # distribution front-end (distcc, icecc) prefixes compile commands that may run on remote hosts
+        remote = launcher
+        if options.distributed:
+            remote = asninja.helpers.quote_command([options.distributed]) + ' '
+        local_preprocess = bool(options.distributed and options.local_preprocess)
         link_cc = cc
         link_cxx = cxx
         ar = toolchain.ar()
@@ -44,115 +665,400 @@ class Converter(object):
         lflags = [] + ninja_syntax.as_list(flags)
         arflags = []
 
-        if not outpath:
-            outpath = config
-        __, outdir = os.path.split(outpath)
-
-        if asp.select_config(config):
-            # ARM/GNU C Compiler
-            ccflags += asp.compiler_flags(True, add_defs, del_defs, [])
-            # ARM/GNU C++ Compiler
-            if asp.is_cpp:
-                cxxflags += asp.compiler_flags(False, add_defs, del_defs, [])
-            if asp.is_lib:
-                # ARM/GNU Archiver
-                arflags += asp.archiver_flags()
+        with options.phase('flags'):
+            if asp.select_config(config):
+                # ARM/GNU C Compiler
+                ccflags += asp.compiler_flags(True, add_defs, del_defs, [])
+                # ARM/GNU C++ Compiler
+                if asp.is_cpp:
+                    cxxflags += asp.compiler_flags(False, add_defs, del_defs, [])
+                if asp.is_lib:
+                    # ARM/GNU Archiver
+                    arflags += asp.archiver_flags()
+                else:
+                    # ARM/GNU Linker
+                    lflags += asp.linker_flags(outdir)
             else:
-                # ARM/GNU Linker
-                lflags += asp.linker_flags(outdir)
-        else:
-            raise Exception('Undefined config in project {0}'.format(config))
+                raise Exception('Undefined config in project {0}'.format(config))
+
+        if options.optimize_includes and prj_dir is not None:
+            with options.phase('includes'):
+                ccflags = cls.optimize_include_paths(asp, prj_dir, outdir, ccflags, '.c', scanned_files)
+                if asp.is_cpp:
+                    cxxflags = cls.optimize_include_paths(asp, prj_dir, outdir, cxxflags, '.cpp', scanned_files)
+
+        # linker script is relative to outdir, so it's detected before flags are rebased
+        linker_script = cls.detect_linker_script(lflags)
+        # outdir relative to dir where ninja runs (builddir is outdir or its subdir)
+        flags_dir = posixpath.normpath(posixpath.join(builddir, '.' if prj_path == '..' else
+                                                      posixpath.join(prj_path, outdir)))
+        if flags_dir != '.':
+            ccflags = asninja.helpers.rebase_include_paths(ccflags, flags_dir)
+            cxxflags = asninja.helpers.rebase_include_paths(cxxflags, flags_dir)
+            lflags = asninja.helpers.rebase_linker_paths(lflags, flags_dir)
 
-        os.makedirs(outpath, exist_ok=True)
-        nw = ninja_syntax.Writer(open(os.path.join(outpath, 'build.ninja'), 'w'), 120)
+        # rules are scoped to subninja since 1.6
+        graph.variable('ninja_required_version', '1.6' if subninjas else '1.3')
+        graph.newline()
 
-        nw.variable('ninja_required_version', '1.3')
-        nw.newline()
+        graph.variable('builddir', builddir)
+        graph.variable('src', '$builddir/' + prj_path)
+        graph.newline()
 
-        nw.variable('builddir', '.')
-        nw.variable('src', '$builddir/..')
-        nw.newline()
+        # pools are global in ninja, so only top-level graph declares them (before subninjas that use them)
+        pools = options.pools()
+        pool_names = {kind: name for kind, (name, __) in pools.items()}
+        if builddir == '.' and pools:
+            # kinds can share pool
+            for name, depth in collections.OrderedDict(pools.values()).items():
+                graph.pool(name, depth)
+            graph.newline()
 
-        if asp.ref_libs:
+        if subninjas is not None:
+            for subninja in subninjas:
+                graph.subninja('$builddir/' + subninja)
+            if subninjas:
+                graph.newline()
+        elif asp.ref_libs:
             for ref_lib in asp.ref_libs:
-                nw.comment('subninja $builddir/../{}/{}/build.ninja'.format(ref_lib.path, outdir))
-            nw.newline()
+                graph.comment('subninja $builddir/{}/build.ninja'.format(
+                    posixpath.normpath(posixpath.join(prj_path, ref_lib.path, outdir))))
+            graph.newline()
 
-        nw.variable('ccflags', ccflags)
-        nw.newline()
+        graph.variable('ccflags', ccflags)
+        graph.newline()
 
-        nw.rule('cc',
-                command=cc + ' -x c -c $ccflags -MD -MF $out.d -MT $out -o $out $in',
-                description='cc $out',
-                depfile='$out.d',
-                deps='gcc')
-        nw.newline()
+        if local_preprocess:
+            # sources are preprocessed locally (dependencies come from preprocessing), remote hosts get
+            # preprocessed sources and flags without preprocessor options
+            graph.variable('remote_ccflags', asninja.helpers.strip_preprocessor_flags(ccflags))
+            graph.newline()
+
+            graph.rule('cc_pp',
+                       command=cc + ' -x c -E $ccflags -MD -MF $out.d -MT $out -o $out $in',
+                       description='cc_pp $out',
+                       depfile='$out.d',
+                       deps='gcc',
+                       pool=pool_names.get('local'))
+            graph.newline()
+
+            graph.rule('cc',
+                       command=remote + cc + ' -x cpp-output -c $remote_ccflags -o $out $in',
+                       description='cc $out',
+                       pool=pool_names.get('compile'))
+        else:
+            graph.rule('cc',
+                       command=remote + cc + ' -x c -c $ccflags -MD -MF $out.d -MT $out -o $out $in',
+                       description='cc $out',
+                       depfile='$out.d',
+                       deps='gcc',
+                       pool=pool_names.get('compile'))
+        graph.newline()
 
         if asp.is_cpp:
-            nw.variable('cxxflags', cxxflags)
-            nw.newline()
+            graph.variable('cxxflags', cxxflags)
+            graph.newline()
+
+            if local_preprocess:
+                graph.variable('remote_cxxflags', asninja.helpers.strip_preprocessor_flags(cxxflags))
+                graph.newline()
 
-            nw.rule('cxx',
-                    command=cxx + ' -c $cxxflags -MD -MF $out.d -MT $out -o $out $in',
-                    description='cxx $out',
-                    depfile='$out.d',
-                    deps='gcc')
-            nw.newline()
+                graph.rule('cxx_pp',
+                           command=cxx + ' -x c++ -E $cxxflags -MD -MF $out.d -MT $out -o $out $in',
+                           description='cxx_pp $out',
+                           depfile='$out.d',
+                           deps='gcc',
+                           pool=pool_names.get('local'))
+                graph.newline()
+
+                graph.rule('cxx',
+                           command=remote + cxx + ' -x c++-cpp-output -c $remote_cxxflags -o $out $in',
+                           description='cxx $out',
+                           pool=pool_names.get('compile'))
+            else:
+                graph.rule('cxx',
+                           command=remote + cxx + ' -c $cxxflags -MD -MF $out.d -MT $out -o $out $in',
+                           description='cxx $out',
+                           depfile='$out.d',
+                           deps='gcc',
+                           pool=pool_names.get('compile'))
+            graph.newline()
+
+            if pch_header:
+                # precompiled header is used by local preprocessing of front-end, so it's built locally
+                graph.rule('pch',
+                           command=launcher + cxx + ' -x c++-header -c $cxxflags -MD -MF $out.d -MT $out -o $out $in',
+                           description='pch $out',
+                           depfile='$out.d',
+                           deps='gcc',
+                           pool=pool_names.get('local', pool_names.get('compile')))
+                graph.newline()
 
         if asp.is_lib:
-            nw.variable('arflags', arflags)
-            nw.newline()
+            ar_command = ar + ' $arflags -o $out $in'
+            if options.thin_archives:
+                # thin archive only references objects, it is recreated so removed objects don't stay members
+                arflags = cls.thin_archiver_flags(arflags)
+                ar_command = cls.remove_output_command() + ar_command
+
+            graph.variable('arflags', arflags)
+            graph.newline()
 
-            nw.rule('ar',
-                    command=ar + ' $arflags -o $out $in',
-                    description='ar $out')
+            graph.rule('ar',
+                       command=ar_command,
+                       description='ar $out',
+                       pool=pool_names.get('ar'))
         else:
-            nw.variable('lflags', lflags)
-            nw.newline()
+            graph.variable('lflags', lflags)
+            graph.newline()
 
             link = link_cxx if asp.is_cpp else link_cc
 
-            nw.rule('link',
-                    command=link + ' -o $out @$out.rsp $lflags',
-                    description='link $out',
-                    rspfile='$out.rsp',
-                    rspfile_content='$in')
-        nw.newline()
+            graph.rule('link',
+                       command=link + ' -o $out @$out.rsp $lflags',
+                       description='link $out',
+                       rspfile='$out.rsp',
+                       rspfile_content='$in',
+                       pool=pool_names.get('link'))
+        graph.newline()
+
+        cxx_implicit = None
+        cxx_variables = None
+        if pch_header:
+            # gch is compiled with same cxxflags, sources include it with -include (gcc picks .gch next to header)
+            pch_wrapper = '$builddir/' + cls.PCH_WRAPPER
+            cxx_implicit = graph.build(pch_wrapper + '.gch', 'pch', pch_wrapper)
+            cxx_variables = {'cxxflags': '-include ' + pch_wrapper + ' $cxxflags'}
+            graph.newline()
+
+        # batch is compiled in place of its first source
+        unity_sources = {}
+        for name, src_files in unity_batches or []:
+            unity_sources[src_files[0]] = '$builddir/' + name
+            unity_sources.update((src_file, None) for src_file in src_files[1:])
 
         obj_files = []
         for src_file in asp.src_files():
+            src = unity_sources.get(src_file, '$src/' + src_file)
+            if src is None:
+                continue
             filename, file_ext = os.path.splitext(src_file)
-            filename = asninja.helpers.strip_updir(filename)
-            filename = '$builddir/' + filename + '.o'
+            if src_file in unity_sources:
+                filename, __ = os.path.splitext(src)
+            else:
+                filename = '$builddir/' + asninja.helpers.strip_updir(filename)
             if file_ext == '.c':
-                obj_files += nw.build(filename, 'cc', '$src/' + src_file)
+                if local_preprocess:
+                    src = graph.build(filename + '.i', 'cc_pp', src)
+                obj_files += graph.build(filename + '.o', 'cc', src)
             elif file_ext == '.cpp':
                 assert asp.is_cpp
-                obj_files += nw.build(filename, 'cxx', '$src/' + src_file)
+                if local_preprocess:
+                    src = graph.build(filename + '.ii', 'cxx_pp', src)
+                obj_files += graph.build(filename + '.o', 'cxx', src, implicit=cxx_implicit,
+                                         variables=cxx_variables)
             # else:
             #     print('Skipping file {}'.format(src_file))
 
         if obj_files:
-            nw.newline()
+            graph.newline()
 
             if asp.is_lib:
-                def_target = nw.build('$builddir/' + asp.output(), 'ar', obj_files)
-                nw.newline()
+                ar_variables = cls.native_output(builddir, asp.output()) if options.thin_archives else None
+                def_target = graph.build('$builddir/' + asp.output(), 'ar', obj_files, variables=ar_variables)
+                graph.newline()
             else:
                 implicit_dep = []
                 #
-                linker_script = cls.detect_linker_script(lflags)
                 if linker_script:
-                    sys.stdout.write('linker_script = ' + linker_script)
                     implicit_dep.append('$src/' + linker_script)
                 #
                 for lib in asp.ref_libs:
-                    implicit_dep.append('$builddir/../' + lib.full_name(outdir))
+                    lib_file = posixpath.normpath(posixpath.join(prj_path, lib.full_name(outdir)))
+                    implicit_dep.append('$builddir/' + lib_file)
+                implicit_dep += ['$builddir/' + lib_file for lib_file in lib_files or []
+                                 if '$builddir/' + lib_file not in implicit_dep]
+
+                def_target = graph.build('$builddir/' + asp.output(), 'link', obj_files,
+                                         implicit=implicit_dep)
+                graph.newline()
+
+                if options.post_link:
+                    def_target += cls.add_post_link(graph, asp, toolchain, def_target[0], options.post_link)
+
+            if builddir == '.':
+                launcher_stats = options.launcher_stats_command()
+                if launcher_stats:
+                    # output is never created, so target isn't default (no-op build stays no-op), statistics are
+                    # printed by 'ninja launcher_stats' after build
+                    graph.rule('launcher_stats',
+                               command=ninja_syntax.escape(launcher_stats),
+                               description='compiler launcher statistics',
+                               pool='console')
+                    graph.newline()
+                    graph.build('launcher_stats', 'launcher_stats', def_target)
+                    graph.newline()
+
+                graph.default(def_target)
+        return graph
+
+    @classmethod
+    def add_regen_edge(cls, graph, command, outputs, inputs, depfile=None):
+        """Adds generator edge that regenerates graph (outputs) when inputs or deps listed in depfile change"""
+        graph.newline()
+        graph.rule('regen',
+                   command=ninja_syntax.escape(command),
+                   description='regen $out',
+                   depfile=depfile,
+                   generator=True,
+                   restat=True)
+        graph.newline()
+        graph.build(outputs, 'regen', inputs)
+
+    @classmethod
+    def add_post_link(cls, graph, asp, toolchain, elf, kinds):
+        """Adds edges of outputs made from linked elf (each depends only on elf), returns outputs"""
+        outputs = []
+        if 'hex' in kinds:
+            graph.rule('hex',
+                       command=toolchain.objcopy() + ' -O ihex -R .eeprom -R .fuse -R .lock -R .signature $in $out',
+                       description='hex $out')
+            outputs += graph.build('$builddir/' + asp.output_name + '.hex', 'hex', elf)
+            graph.newline()
+        if 'bin' in kinds:
+            graph.rule('bin',
+                       command=toolchain.objcopy() + ' -O binary $in $out',
+                       description='bin $out')
+            outputs += graph.build('$builddir/' + asp.output_name + '.bin', 'bin', elf)
+            graph.newline()
+        if 'lss' in kinds:
+            graph.rule('lss',
+                       command=cls.shell_command(toolchain.objdump() + ' -h -S $in > $out'),
+                       description='lss $out')
+            outputs += graph.build('$builddir/' + asp.output_name + '.lss', 'lss', elf)
+            graph.newline()
+        if 'size' in kinds:
+            # report is compared with previous one (read from $out before it is rewritten)
+            command = asninja.helpers.quote_command(cls.asninja_args() + ['size', '--tool', toolchain.size()])
+            graph.rule('size',
+                       command=ninja_syntax.escape(command) + ' --output $out $in',
+                       description='size $in')
+            outputs += graph.build('$builddir/' + asp.output_name + '.size.json', 'size', elf)
+            graph.newline()
+        return outputs
+
+    @classmethod
+    def top_graph(cls, outdirs):
+        """Top-level graph with phony target per config that runs ninja in config output dir"""
+        graph = BuildGraph()
+        graph.variable('ninja_required_version', '1.3')
+        graph.newline()
+
+        graph.rule('ninja_config',
+                   command='ninja -C $dir',
+                   description='ninja -C $dir',
+                   pool='console')
+        graph.newline()
+
+        # outputs of these edges are never created, so nested ninja decides what is dirty
+        targets = []
+        for outdir in outdirs:
+            graph.build('_' + outdir, 'ninja_config', variables={'dir': outdir})
+            targets += graph.build(outdir, 'phony', '_' + outdir)
+        graph.newline()
+
+        graph.build('all', 'phony', targets)
+        graph.newline()
+
+        graph.default('all')
+        return graph
+
+    @classmethod
+    def solution_tasks(cls, as_sln, config, outpath, flags, add_defs, del_defs, custom_toolchain=None, options=None):
+        """(name, kwargs of convert) for each project of solution.
+
+        Projects with same output path (like ones in same dir) get subdir named after project file in it, so they
+        don't overwrite build.ninja of each other.
+        """
+        sln = AtmelStudioSolution(as_sln)
+
+        if not outpath:
+            outpath = '' if cls.is_multi_config(config) else config
+
+        outpaths = collections.Counter(os.path.normcase(os.path.normpath(prj.outpath(outpath)))
+                                       for prj in sln.projects)
+        tasks = []
+        for prj in sln.projects:
+            # output is named after project file, like output of Atmel Studio
+            output, __ = os.path.splitext(os.path.basename(prj.file_name))
+            prj_outpath = prj.outpath(outpath)
+            if outpaths[os.path.normcase(os.path.normpath(prj_outpath))] > 1:
+                prj_outpath = os.path.join(prj_outpath, output)
+            tasks.append((prj.name, dict(as_prj=prj.file_name, config=config, outpath=prj_outpath,
+                                         output=output, flags=flags, add_defs=add_defs, del_defs=del_defs,
+                                         custom_toolchain=custom_toolchain, options=options)))
+        outpaths = collections.Counter(os.path.normcase(os.path.normpath(kwargs['outpath'])) for __, kwargs in tasks)
+        duplicates = [path for path, count in outpaths.items() if count > 1]
+        if duplicates:
+            raise Exception('Several projects of solution have output path {}'.format(', '.join(duplicates)))
+        return tasks
+
+    @classmethod
+    def convert_solution(cls, as_sln, config, outpath, flags, add_defs, del_defs, custom_toolchain=None, jobs=None,
+                         options=None, cache=None):
+        """Converts all projects of solution in parallel, returns list of (name, elapsed, changed, error) per project.
+
+        Projects are converted in worker processes, with cache (MemoryProjectCache) in threads that share it. Output
+        of each project is written by caller (in order of projects), so it goes where caller's output goes (like
+        per-request capture of server).
+        """
+        tasks = cls.solution_tasks(as_sln, config, outpath, flags, add_defs, del_defs, custom_toolchain, options)
+        executor_class = ProcessPoolExecutor
+        if cache is not None:
+            for __, kwargs in tasks:
+                kwargs['cache'] = cache
+            executor_class = ThreadPoolExecutor
+        with executor_class(max_workers=jobs) as executor:
+            results = list(executor.map(_convert_project, tasks))
+        for __, __, output in results:
+            sys.stdout.write(output)
+        # timings of worker processes are merged to timings of caller
+        if options is not None and options.timings is not None:
+            for __, phases, __ in results:
+                options.timings.merge(phases)
+        return [result for result, __, __ in results]
+
+
+def _capture_output(buffer, thread):
+    """Context that captures stdout of worker into buffer.
 
-                def_target = nw.build('$builddir/' + asp.output(), 'link', obj_files,
-                                      implicit=implicit_dep)
-                nw.newline()
+    Worker process runs one task at a time, so its sys.stdout is replaced. Worker thread shares sys.stdout with other
+    threads, its output is captured only by stream with per-thread capture (ThreadOutput of server).
+    """
+    if not thread:
+        return contextlib.redirect_stdout(buffer)
+    if hasattr(sys.stdout, 'capture'):
+        return sys.stdout.capture(buffer)
+    return contextlib.nullcontext()
 
-            nw.default(def_target)
 
-        nw.close()
+def _convert_project(task):
+    """Converts project in worker, returns ((name, elapsed, changed, error), phases of timings, output)"""
+    name, kwargs = task
+    options = kwargs['options']
+    if options is not None and options.timings is not None:
+        # workers may be threads, so options are not shared
+        options = copy.copy(options)
+        options.timings = PhaseTimings()
+        kwargs = dict(kwargs, options=options)
+    start = time.perf_counter()
+    changed = False
+    output = io.StringIO()
+    with _capture_output(output, kwargs.get('cache') is not None):
+        try:
+            changed = Converter.convert(**kwargs)
+            error = None
+        except Exception as e:
+            error = '{}: {}'.format(type(e).__name__, e)
+    phases = options.timings.phases if options is not None and options.timings is not None else {}
+    return (name, time.perf_counter() - start, changed, error), phases, output.getvalue()
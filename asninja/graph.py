@@ -0,0 +1,144 @@
+import collections
+import io
+
+import ninja_syntax
+
+Rule = collections.namedtuple('Rule', ['name', 'command', 'description', 'depfile', 'generator', 'pool', 'restat',
+                                       'rspfile', 'rspfile_content', 'deps'])
+Edge = collections.namedtuple('Edge', ['outputs', 'rule', 'inputs', 'implicit', 'order_only', 'variables',
+                                       'implicit_outputs'])
+
+
+class BuildGraph(object):
+    """In-memory build graph: file-scoped variables, pools, rules, edges, subninjas and defaults in order.
+
+    Graph is built with same calls as ninja_syntax.Writer (layout statements like newlines and comments are kept),
+    write() serializes it with Writer, so graph can be inspected and compared without rendering ninja file.
+    """
+
+    def __init__(self):
+        # (kind, value), kind is newline, comment, variable, pool, rule, build, include, subninja or default
+        self.statements = []
+
+    def __eq__(self, other):
+        return isinstance(other, BuildGraph) and self.statements == other.statements
+
+    __hash__ = None
+
+    def newline(self):
+        self.statements.append(('newline', None))
+
+    def comment(self, text):
+        self.statements.append(('comment', text))
+
+    def variable(self, key, value):
+        self.statements.append(('variable', (key, list(value) if isinstance(value, list) else value)))
+
+    def pool(self, name, depth):
+        self.statements.append(('pool', (name, depth)))
+
+    def rule(self, name, command, description=None, depfile=None, generator=False, pool=None, restat=False,
+             rspfile=None, rspfile_content=None, deps=None):
+        self.statements.append(('rule', Rule(name, command, description, depfile, generator, pool, restat, rspfile,
+                                             rspfile_content, deps)))
+
+    def build(self, outputs, rule, inputs=None, implicit=None, order_only=None, variables=None,
+              implicit_outputs=None):
+        """Adds edge, returns its outputs (as Writer.build)"""
+        # lists are copied, callers keep extending lists of outputs
+        edge = Edge(list(ninja_syntax.as_list(outputs)), rule, list(ninja_syntax.as_list(inputs)),
+                    list(ninja_syntax.as_list(implicit)), list(ninja_syntax.as_list(order_only)),
+                    collections.OrderedDict(variables or []), list(ninja_syntax.as_list(implicit_outputs)))
+        self.statements.append(('build', edge))
+        return list(edge.outputs)
+
+    def include(self, path):
+        self.statements.append(('include', path))
+
+    def subninja(self, path):
+        self.statements.append(('subninja', path))
+
+    def default(self, paths):
+        self.statements.append(('default', list(ninja_syntax.as_list(paths))))
+
+    def values(self, kind):
+        return [value for statement_kind, value in self.statements if statement_kind == kind]
+
+    @property
+    def variables(self):
+        """File-scoped variables (last assignment wins), variables with None value are not written"""
+        return collections.OrderedDict((key, value) for key, value in self.values('variable') if value is not None)
+
+    @property
+    def pools(self):
+        return collections.OrderedDict(self.values('pool'))
+
+    @property
+    def rules(self):
+        return collections.OrderedDict((rule.name, rule) for rule in self.values('rule'))
+
+    @property
+    def edges(self):
+        return self.values('build')
+
+    @property
+    def subninjas(self):
+        return self.values('subninja')
+
+    @property
+    def defaults(self):
+        return [path for paths in self.values('default') for path in paths]
+
+    def producer(self, output):
+        """Edge that builds output (None if there is no such edge)"""
+        for edge in self.edges:
+            if output in edge.outputs or output in edge.implicit_outputs:
+                return edge
+        return None
+
+    def write(self, nw):
+        """Writes graph with ninja_syntax.Writer"""
+        for kind, value in self.statements:
+            if kind == 'newline':
+                nw.newline()
+            elif kind == 'comment':
+                nw.comment(value)
+            elif kind == 'variable':
+                nw.variable(*value)
+            elif kind == 'pool':
+                nw.pool(*value)
+            elif kind == 'rule':
+                nw.rule(**value._asdict())
+            elif kind == 'build':
+                nw.build(value.outputs, value.rule, value.inputs, implicit=value.implicit,
+                         order_only=value.order_only, variables=value.variables,
+                         implicit_outputs=value.implicit_outputs)
+            elif kind == 'default':
+                nw.default(value)
+            else:
+                getattr(nw, kind)(value)
+
+    def to_ninja(self, width=120):
+        """Ninja file content of graph"""
+        f = io.StringIO()
+        self.write(ninja_syntax.Writer(f, width))
+        return f.getvalue()
+
+
+def diff_dicts(old, new):
+    """Keys added, removed and changed (with different values) from old to new"""
+    return {'added': [key for key in new if key not in old],
+            'removed': [key for key in old if key not in new],
+            'changed': [key for key in new if key in old and old[key] != new[key]]}
+
+
+def diff(old, new):
+    """Differences of two graphs: variables, pools and rules by name, edges by first output, defaults"""
+    def edges(graph):
+        return collections.OrderedDict((edge.outputs[0], edge) for edge in graph.edges if edge.outputs)
+
+    return {'variables': diff_dicts(old.variables, new.variables),
+            'pools': diff_dicts(old.pools, new.pools),
+            'rules': diff_dicts(old.rules, new.rules),
+            'edges': diff_dicts(edges(old), edges(new)),
+            'defaults_changed': old.defaults != new.defaults}
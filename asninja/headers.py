@@ -0,0 +1,274 @@
+"""asninja headers: rebuild impact of headers (translation units recompiled when header changes)"""
+import argparse
+import collections
+import json
+import os
+import posixpath
+import re
+import struct
+import sys
+
+from .parser import AtmelStudioProject
+from .report import BuildReport, NinjaGraph, NinjaLog
+
+INCLUDE_RE = re.compile(rb'^[ \t]*#[ \t]*include[ \t]*([<"])([^>"\r\n]+)[>"]', re.MULTILINE)
+INCLUDE_PATH_RE = re.compile(r'^-I"?(.*?)"?$')
+SOURCE_EXTS = ['.c', '.cpp']
+
+
+class NinjaDeps(object):
+    """Dependencies (headers from depfiles) of outputs from ninja deps log (.ninja_deps v3 and v4)"""
+    SIGNATURE = b'# ninjadeps\n'
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        # output -> inputs of last record
+        self.deps = {}
+        with open(file_name, 'rb') as f:
+            data = f.read()
+        assert data.startswith(self.SIGNATURE), 'Unsupported ninja deps log {}'.format(file_name)
+        pos = len(self.SIGNATURE)
+        version, = struct.unpack_from('<i', data, pos)
+        assert version in [3, 4], 'Unsupported ninja deps log version {}'.format(version)
+        pos += 4
+        # mtime is 32-bit in v3, 64-bit in v4
+        mtime_size = 4 if version == 3 else 8
+        paths = []
+        while pos + 4 <= len(data):
+            size, = struct.unpack_from('<I', data, pos)
+            pos += 4
+            is_deps = size & 0x80000000
+            size &= 0x7fffffff
+            record = data[pos:pos + size]
+            pos += size
+            if len(record) < size:
+                # truncated by interrupted build
+                break
+            if is_deps:
+                out_id, = struct.unpack_from('<i', record)
+                ids = struct.unpack_from('<{}i'.format((size - 4 - mtime_size) // 4), record, 4 + mtime_size)
+                if out_id < len(paths):
+                    self.deps[paths[out_id]] = [paths[i] for i in ids if i < len(paths)]
+            else:
+                # v4 path record ends with checksum (complement of id)
+                name = record[:-4] if version == 4 else record
+                paths.append(os.fsdecode(name.rstrip(b'\0')))
+
+
+class IncludeScanner(object):
+    """Resolves #include directives as gcc does (without conditional compilation).
+
+    Quoted includes are searched in directory of including file first, then in include_dirs, angle includes in
+    include_dirs only. Includes that are not found (system headers, computed includes) are skipped. Files that can't
+    be read are scanned as without includes and kept in unreadable.
+    """
+
+    def __init__(self, include_dirs):
+        self.include_dirs = [os.path.normpath(include_dir) for include_dir in include_dirs]
+        # file -> [(quoted, name)]
+        self.includes_cache = {}
+        self.unreadable = set()
+        # (dir of including file or None, quoted, name) -> resolved file or None
+        self.resolve_cache = {}
+
+    def includes(self, file_name):
+        """Include directives of file as [(quoted, name)]"""
+        if file_name not in self.includes_cache:
+            try:
+                with open(file_name, 'rb') as f:
+                    text = f.read()
+            except OSError:
+                self.unreadable.add(file_name)
+                text = b''
+            self.includes_cache[file_name] = [(m.group(1) == b'"', os.fsdecode(m.group(2).strip()))
+                                              for m in INCLUDE_RE.finditer(text)]
+        return self.includes_cache[file_name]
+
+    def scanned_files(self):
+        """Files read by scanner"""
+        return [file_name for file_name in self.includes_cache if file_name not in self.unreadable]
+
+    def candidates(self, quoted, name, file_dir):
+        """Paths probed for include in search order"""
+        if os.path.isabs(name):
+            return [name]
+        dirs = ([file_dir] if quoted else []) + self.include_dirs
+        return [os.path.normpath(os.path.join(include_dir, name)) for include_dir in dirs]
+
+    def resolve(self, quoted, name, file_dir):
+        key = (file_dir if quoted else None, quoted, name)
+        if key not in self.resolve_cache:
+            self.resolve_cache[key] = next((path for path in self.candidates(quoted, name, file_dir)
+                                            if os.path.isfile(path)), None)
+        return self.resolve_cache[key]
+
+    def lookups(self, src_file):
+        """Distinct include lookups made by source (transitively), (dir of including file or None, quoted, name) ->
+        resolved file or None, in first seen order"""
+        lookups = collections.OrderedDict()
+        seen = {src_file}
+        pending = [src_file]
+        while pending:
+            file_name = pending.pop()
+            file_dir = os.path.dirname(file_name)
+            for quoted, name in self.includes(file_name):
+                path = self.resolve(quoted, name, file_dir)
+                lookups.setdefault((file_dir if quoted else None, quoted, name), path)
+                if path is not None and path not in seen:
+                    seen.add(path)
+                    pending.append(path)
+        return lookups
+
+    def headers(self, src_file):
+        """Headers included by source (transitively), in first seen order"""
+        headers = collections.OrderedDict()
+        for path in self.lookups(src_file).values():
+            if path is not None and path != src_file:
+                headers[path] = None
+        return list(headers)
+
+
+def include_dirs(flags, builddir):
+    """Directories of -I flags (relative ones are relative to builddir)"""
+    dirs = []
+    for flag in flags:
+        m = INCLUDE_PATH_RE.match(flag)
+        if m and m.group(1):
+            dirs.append(os.path.join(builddir, m.group(1).replace('\\', '/')))
+    return dirs
+
+
+def relative_name(path, prj_dir):
+    """Path relative to project dir like Compile items"""
+    return posixpath.normpath(os.path.relpath(path, prj_dir).replace('\\', '/'))
+
+
+def deps_index(graph, deps, system=False):
+    """Translation units per header from deps log of built graph (header names are relative to project dir)"""
+    prj_dir = os.path.join(graph.build_dir, '..')
+    # graph paths are normalized, log paths are as ninja recorded them
+    outputs = {posixpath.normpath(output): output for output in deps.deps}
+    index = collections.defaultdict(set)
+    for edge in graph.edges:
+        if not edge.outputs or not edge.inputs or edge.outputs[0] not in outputs:
+            continue
+        src = edge.inputs[0]
+        tu = relative_name(os.path.join(graph.build_dir, src), prj_dir)
+        for dep in deps.deps[outputs[edge.outputs[0]]]:
+            if posixpath.normpath(dep) == src:
+                continue
+            if os.path.isabs(dep):
+                # system headers (of toolchain) are absolute
+                if system:
+                    index[dep.replace('\\', '/')].add(tu)
+                continue
+            index[relative_name(os.path.join(graph.build_dir, dep), prj_dir)].add(tu)
+    return index
+
+
+def scan_index(asp, prj_dir, builddir, add_defs=None, del_defs=None):
+    """Translation units per header of project (in selected config) by scanning #include directives"""
+    scanners = {}
+    index = collections.defaultdict(set)
+    for src_file in asp.src_files():
+        __, file_ext = os.path.splitext(src_file)
+        if file_ext not in SOURCE_EXTS:
+            continue
+        c_compiler = file_ext == '.c'
+        if c_compiler not in scanners:
+            flags = asp.compiler_flags(c_compiler, add_defs or [], del_defs or [], [])
+            scanners[c_compiler] = IncludeScanner(include_dirs(flags, builddir))
+        src = os.path.normpath(os.path.join(prj_dir, src_file.replace('\\', '/')))
+        tu = relative_name(src, prj_dir)
+        for header in scanners[c_compiler].headers(src):
+            index[relative_name(header, prj_dir)].add(tu)
+    unreadable = set()
+    for scanner in scanners.values():
+        unreadable.update(scanner.unreadable)
+    if unreadable:
+        sys.stderr.write("asninja headers: {} files can't be read (scanned as without includes), like {}\n"
+                         .format(len(unreadable), relative_name(min(unreadable), prj_dir)))
+    return index
+
+
+def rank(index, times=None):
+    """Headers by rebuild impact: [(header, number of translation units, their compile time)], highest first.
+
+    Without compile times (no ninja log) each translation unit weighs 1 second.
+    """
+    rows = []
+    for header, tus in index.items():
+        weight = sum(times.get(tu, 0.0) for tu in tus) if times else float(len(tus))
+        rows.append((header, len(tus), weight))
+    rows.sort(key=lambda row: (-row[2], -row[1], row[0]))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='asninja headers',
+                                     description='Headers ranked by recompilation they trigger (translation units'
+                                                 ' weighted by compile time)')
+    parser.add_argument('--builddir', type=str, help='Directory with build.ninja (and .ninja_deps)', default='.')
+    parser.add_argument('--prj', type=str,
+                        help='Atmel Studio project file, #include directives of its sources are scanned instead of'
+                             ' reading deps log', default=None)
+    parser.add_argument('--config', type=str, help='Project config (for include paths)', default='Debug')
+    parser.add_argument('--add_defs', type=str, help='Additional compiler defines (like __SAM4S8C__)', default=None)
+    parser.add_argument('--del_defs', type=str, help='Defines to remove from compiler defines', default=None)
+    parser.add_argument('--unity', type=str,
+                        help='Unity build of conversion (with --prj), compile time of unity source is split across'
+                             ' its sources', default=None)
+    parser.add_argument('--unity_exclude', type=str,
+                        help='Comma-separated patterns of sources compiled without unity build', default=None)
+    parser.add_argument('--log', type=str, help='Ninja log with compile times, .ninja_log of builddir if absent',
+                        default=None)
+    parser.add_argument('--system', action='store_true', help='Include headers with absolute paths (toolchain)')
+    parser.add_argument('--top', type=int, help='Number of rows in table', default=20)
+    parser.add_argument('--json', action='store_true', help='Write report as JSON')
+    args = parser.parse_args(argv)
+
+    if args.unity and args.unity != 'dir' and not (args.unity.isdigit() and int(args.unity) > 1):
+        parser.error('--unity must be dir or batch size greater than 1')
+
+    graph = None
+    unity_batches = None
+    if os.path.isfile(os.path.join(args.builddir, 'build.ninja')):
+        graph = NinjaGraph(os.path.join(args.builddir, 'build.ninja'))
+    if args.prj:
+        name, __ = os.path.splitext(os.path.basename(args.prj))
+        asp = AtmelStudioProject(args.prj, name)
+        if not asp.select_config(args.config):
+            parser.error('Undefined config in project {}'.format(args.config))
+        index = scan_index(asp, os.path.dirname(os.path.abspath(args.prj)), args.builddir,
+                           args.add_defs.split(' ') if args.add_defs else [],
+                           args.del_defs.split(' ') if args.del_defs else [])
+        source = args.prj
+        # converter imports include_paths that uses this module
+        from .converter import Converter, ConvertOptions
+        unity_batches = Converter.unity_batches(asp, ConvertOptions(
+            unity=args.unity, unity_exclude=args.unity_exclude.split(',') if args.unity_exclude else []))
+    else:
+        deps_log = os.path.join(args.builddir, '.ninja_deps')
+        if graph is None or not os.path.isfile(deps_log):
+            parser.error('no build.ninja and .ninja_deps in {} (build first or give --prj)'.format(args.builddir))
+        index = deps_index(graph, NinjaDeps(deps_log), args.system)
+        source = deps_log
+
+    times = None
+    log = args.log or os.path.join(args.builddir, '.ninja_log')
+    if graph is not None and os.path.isfile(log):
+        times = dict(BuildReport(graph, NinjaLog(log), unity_batches).compile_times())
+    rows = rank(index, times)
+
+    if args.json:
+        json.dump({'source': source, 'timed': times is not None,
+                   'headers': [{'header': header, 'units': units, 'weight': weight}
+                               for header, units, weight in rows]}, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return 0
+
+    sys.stdout.write('Headers by rebuild impact ({}, {}):\n'.format(
+        source, 'weighted by compile time' if times is not None else 'no ninja log, units weigh 1s'))
+    for header, units, weight in rows[:args.top]:
+        sys.stdout.write('{:10.3f}s {:6d}  {}\n'.format(weight, units, header))
+    return 0
@@ -1,3 +1,13 @@
+import hashlib
+import ntpath
+import os
+import posixpath
+import re
+import shlex
+import subprocess
+import tempfile
+
+
 def strip_empty_symbols(symbols):
     assert isinstance(symbols, list)
     new_symbols = []
@@ -7,9 +17,119 @@ def strip_empty_symbols(symbols):
     return new_symbols
 
 
+def quote_command(args):
+    """Joins args to command line for current platform shell"""
+    if os.name == 'nt':
+        return subprocess.list2cmdline(args)
+    return ' '.join(shlex.quote(arg) for arg in args)
+
+
+def rebase_path(path, base_dir):
+    """Prefixes relative path with base_dir (absolute paths and ones starting with variable are kept)"""
+    if posixpath.isabs(path) or ntpath.isabs(path) or path.startswith('$'):
+        return path
+    return posixpath.normpath(posixpath.join(base_dir, path.replace('\\', '/')))
+
+
+def rebase_include_paths(flags, base_dir):
+    """Prefixes relative paths in '-I"path"' flags with base_dir"""
+    new_flags = []
+    for flag in flags:
+        if flag.startswith('-I"') and flag.endswith('"'):
+            flag = '-I"{}"'.format(rebase_path(flag[3:-1], base_dir))
+        new_flags.append(flag)
+    return new_flags
+
+
+LINKER_SCRIPT_RE = re.compile(r'(^|\s)-T(\s*)("?)([^\s"]+)')
+
+
+def rebase_linker_paths(flags, base_dir):
+    """Prefixes relative paths in '-L"path"' flags and '-Tpath' options (in any flag) with base_dir"""
+    new_flags = []
+    for flag in flags:
+        if flag.startswith('-L"') and flag.endswith('"'):
+            flag = '-L"{}"'.format(rebase_path(flag[3:-1], base_dir))
+        else:
+            flag = LINKER_SCRIPT_RE.sub(lambda m: m.group(1) + '-T' + m.group(2) + m.group(3) +
+                                        rebase_path(m.group(4), base_dir), flag)
+        new_flags.append(flag)
+    return new_flags
+
+
+# preprocessor options with value (joined or as next argument), not needed to compile preprocessed source
+PREPROCESSOR_OPTIONS = ['-include', '-imacros', '-isystem', '-iquote', '-idirafter', '-I', '-D', '-U']
+
+
+def strip_preprocessor_flags(flags):
+    """Flags without preprocessor options (-I, -D, -U, -include and alike), for compile of preprocessed source.
+
+    Flags with several options (like OtherFlags of project) are split and joined back.
+    """
+    new_flags = []
+    for flag in flags:
+        try:
+            args = shlex.split(flag)
+        except ValueError:
+            # unbalanced quotes
+            args = flag.split()
+        kept = []
+        skip = False
+        for arg in args:
+            if skip:
+                skip = False
+            elif arg in PREPROCESSOR_OPTIONS:
+                skip = True
+            elif not any(arg.startswith(option) for option in PREPROCESSOR_OPTIONS) and arg != '-nostdinc':
+                kept.append(arg)
+        if len(kept) == len(args):
+            new_flags.append(flag)
+        elif kept:
+            new_flags.append(quote_command(kept))
+    return new_flags
+
+
 def strip_updir(file_name):
     """Strips all '../' from start of file_name"""
     fn = file_name
     while fn.find('..', 0) == 0:
         fn = fn[3:]
     return fn
+
+
+def available_memory():
+    """Available physical memory in bytes (None if unknown)"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def write_if_changed(file_name, content):
+    """Atomically replaces file with content (via temp file and rename) if its hash differs, returns True if written"""
+    data = content if isinstance(content, bytes) else content.encode('utf-8')
+    mode = 0o644
+    try:
+        with open(file_name, 'rb') as f:
+            if hashlib.sha1(f.read()).digest() == hashlib.sha1(data).digest():
+                return False
+        mode = os.stat(file_name).st_mode & 0o777
+    except FileNotFoundError:
+        pass
+    fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(file_name) or '.', prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_name, mode)
+        os.replace(tmp_name, file_name)
+    except BaseException:
+        os.remove(tmp_name)
+        raise
+    return True
@@ -0,0 +1,160 @@
+"""Include path optimizer: drops unused and duplicate include dirs, moves most used dirs first"""
+import collections
+import os
+
+from .headers import INCLUDE_PATH_RE, IncludeScanner
+
+IncludePathReport = collections.namedtuple('IncludePathReport', ['dirs_before', 'dirs_after', 'duplicates', 'unused',
+                                                                 'probes_before', 'probes_after', 'refused',
+                                                                 'unreadable'])
+
+
+class IncludePathOptimizer(object):
+    """Optimizes -I list for translation units (as gcc searches it, see IncludeScanner).
+
+    Every lookup of each translation unit probes include dirs in order until header is found, so unused dirs (no
+    header is found there), duplicates (same dir after normalization) and rarely used dirs listed first cost failed
+    probes. Dir is moved before other dir only if no header found in later one exists in earlier one, so every
+    lookup resolves to same file. Conditional compilation is ignored (all directives are scanned), computed
+    includes (#include MACRO) are not seen. gcc skips duplicates itself, they're dropped to shorten command line.
+    """
+
+    def __init__(self, include_dirs, base_dir):
+        # dirs as given in flags, relative ones start in base_dir
+        self.include_dirs = list(include_dirs)
+        self.base_dir = base_dir
+        # (normalized dir, name) -> header exists
+        self.exists = {}
+        # files read by last lookups and ones that can't be read
+        self.scanned_files = []
+        self.unreadable = []
+
+    def path(self, include_dir):
+        return os.path.normcase(os.path.normpath(os.path.join(self.base_dir, include_dir.replace('\\', '/'))))
+
+    def unique_dirs(self):
+        """Dirs without duplicates (first one is kept, later ones are never reached)"""
+        seen = set()
+        dirs = []
+        for include_dir in self.include_dirs:
+            path = self.path(include_dir)
+            if path not in seen:
+                seen.add(path)
+                dirs.append(include_dir)
+        return dirs
+
+    def lookups(self, src_files):
+        """Distinct lookups (dir of including file or None, quoted, name) -> number of translation units making it"""
+        scanner = IncludeScanner([self.path(include_dir) for include_dir in self.unique_dirs()])
+        counts = collections.Counter()
+        for src_file in src_files:
+            counts.update(scanner.lookups(os.path.normpath(src_file)).keys())
+        self.scanned_files = scanner.scanned_files()
+        self.unreadable = sorted(scanner.unreadable)
+        return counts
+
+    def found_in(self, dirs, lookup):
+        """Indexes of dirs (in order) where header of lookup exists, None if it's found without include dirs"""
+        file_dir, quoted, name = lookup
+        if os.path.isabs(name) or (quoted and os.path.isfile(os.path.join(file_dir, name))):
+            return None
+        found = []
+        for i, include_dir in enumerate(dirs):
+            key = self.path(include_dir), name
+            if key not in self.exists:
+                self.exists[key] = os.path.isfile(os.path.join(*key))
+            if self.exists[key]:
+                found.append(i)
+        return found
+
+    @classmethod
+    def probes(cls, dirs_count, found, quoted):
+        """Probes of one lookup: dir of including file (quoted include), then dirs until first one with header"""
+        if found is None:
+            return 1
+        return int(quoted) + (found[0] + 1 if found else dirs_count)
+
+    def resolution(self, dirs, lookups):
+        """Dir that resolves each lookup (None if header is not found in dirs or found without them)"""
+        resolved = {}
+        for lookup in lookups:
+            found = self.found_in(dirs, lookup)
+            resolved[lookup] = self.path(dirs[found[0]]) if found else None
+        return resolved
+
+    def probe_count(self, dirs, lookups):
+        return sum(count * self.probes(len(dirs), self.found_in(dirs, lookup), lookup[1])
+                   for lookup, count in lookups.items())
+
+    def optimize(self, src_files):
+        """Returns optimized dirs (as given in include_dirs) and IncludePathReport.
+
+        Reorder that changes resolution of any lookup is refused (unused dirs and duplicates are dropped anyway).
+        When some of scanned files can't be read (like missing source), their includes are unknown, so only
+        duplicates are dropped.
+        """
+        dirs = self.unique_dirs()
+        lookups = self.lookups(src_files)
+        if self.unreadable:
+            probes = self.probe_count(dirs, lookups)
+            return dirs, IncludePathReport(len(self.include_dirs), len(dirs), len(self.include_dirs) - len(dirs), 0,
+                                           probes, probes, True, len(self.unreadable))
+        hits = collections.Counter()
+        # dir must stay before dirs that also contain headers found in it
+        before = collections.defaultdict(set)
+        for lookup, count in lookups.items():
+            found = self.found_in(dirs, lookup)
+            if found:
+                hits[found[0]] += count
+                before[found[0]].update(found[1:])
+        used = [i for i in range(len(dirs)) if hits[i]]
+
+        # most used dir among ones that aren't required to follow remaining dirs, first given on tie
+        order = []
+        remaining = set(used)
+        while remaining:
+            ready = [i for i in remaining if not any(i in before[j] for j in remaining if j != i)]
+            i = min(ready, key=lambda i: (-hits[i], i))
+            order.append(i)
+            remaining.remove(i)
+
+        new_dirs = [dirs[i] for i in order]
+        refused = self.resolution(new_dirs, lookups) != self.resolution(dirs, lookups)
+        if refused:
+            new_dirs = [dirs[i] for i in used]
+        report = IncludePathReport(len(self.include_dirs), len(new_dirs), len(self.include_dirs) - len(dirs),
+                                   len(dirs) - len(used), self.probe_count(dirs, lookups),
+                                   self.probe_count(new_dirs, lookups), refused, 0)
+        return new_dirs, report
+
+
+def is_include_flag(flag):
+    """True for single -I flag (like ones of IncludePaths), not for flags with several options"""
+    return (flag.startswith('-I"') and flag.endswith('"') and flag.count('"') == 2) or \
+        (flag.startswith('-I') and '"' not in flag and ' ' not in flag and len(flag) > 2)
+
+
+def optimize_include_flags(flags, src_files, base_dir, scanned_files=None):
+    """Flags with optimized -I flags (in place of first one) and IncludePathReport.
+
+    Flags are returned as is (report is None) when there are no -I flags or translation units.
+    base_dir is dir where relative include paths start (where compiler runs).
+    Files read by optimizer and existing include dirs (result depends on them, new header in include dir can change
+    resolution) are added to scanned_files.
+    """
+    indexes = [i for i, flag in enumerate(flags) if is_include_flag(flag)]
+    if not indexes or not src_files:
+        return flags, None
+    include_dirs = [INCLUDE_PATH_RE.match(flags[i]).group(1) for i in indexes]
+    optimizer = IncludePathOptimizer(include_dirs, base_dir)
+    new_dirs, report = optimizer.optimize(src_files)
+    if scanned_files is not None:
+        scanned_files.extend(optimizer.scanned_files)
+        scanned_files.extend(path for path in map(optimizer.path, optimizer.unique_dirs()) if os.path.isdir(path))
+    new_flags = []
+    for i, flag in enumerate(flags):
+        if i == indexes[0]:
+            new_flags.extend('-I"{}"'.format(include_dir) for include_dir in new_dirs)
+        elif i not in indexes:
+            new_flags.append(flag)
+    return new_flags, report
@@ -0,0 +1,237 @@
+"""asninja map: flash and RAM usage per object, folder and library from GNU ld map file (read in one pass)"""
+import argparse
+import collections
+import json
+import os
+import posixpath
+import re
+import sys
+
+from .parser import AtmelStudioProject
+
+
+class LinkerMap(object):
+    """Flash and RAM usage of GNU ld map file.
+
+    File is streamed line by line, only memory regions and usage per input file are kept. Output section in RAM
+    region with load address in flash region (like .data) is counted in both.
+    """
+    REGION_RE = re.compile(r'^(\S+)\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)(?:\s+(\S+))?\s*$')
+    SECTION_RE = re.compile(r'^(\S+)?\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)'
+                            r'(?:\s+load address 0x([0-9a-fA-F]+))?\s*$')
+    INPUT_RE = re.compile(r'^ (\S+)?\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)(?:\s+(.*\S))?\s*$')
+    # section name that is alone on line (addresses follow on next line)
+    NAME_RE = re.compile(r'^ ?(\.\S+|COMMON)$')
+    ADDRESSES_RE = re.compile(r'^\s+0x[0-9a-fA-F]+\s+0x[0-9a-fA-F]+')
+    # sections without memory footprint
+    NON_ALLOC_PREFIXES = ('.debug', '.comment', '.ARM.attributes', '.stab', '.note', '.gnu.attributes', '.ident')
+    FILL = '*fill*'
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        # name -> (origin, length, kind)
+        self.regions = collections.OrderedDict()
+        self.totals = {'flash': 0, 'ram': 0}
+        # input file -> {'flash': bytes, 'ram': bytes}
+        self.objects = collections.defaultdict(lambda: {'flash': 0, 'ram': 0})
+        self.parse()
+
+    @classmethod
+    def region_kind(cls, name, attributes):
+        name = name.lower()
+        if 'rom' in name or 'flash' in name or name == 'text':
+            return 'flash'
+        if 'ram' in name or name == 'data':
+            return 'ram'
+        return 'ram' if 'w' in attributes else 'flash'
+
+    def kind_of(self, address):
+        for origin, length, kind in self.regions.values():
+            if origin <= address < origin + length:
+                return kind
+        return None
+
+    def section_kinds(self, name, address, load_address):
+        """Kinds of memory (flash, ram) used by output section"""
+        if name.startswith(self.NON_ALLOC_PREFIXES):
+            return []
+        kind = self.kind_of(address)
+        if kind is None:
+            return []
+        kinds = [kind]
+        if kind == 'ram' and load_address is not None and load_address != address \
+                and self.kind_of(load_address) == 'flash':
+            kinds.append('flash')
+        return kinds
+
+    def parse(self):
+        state = None
+        kinds = []
+        pending = None
+        with open(self.file_name, 'r', errors='replace') as f:
+            for line in f:
+                line = line.rstrip('\r\n')
+                if state is None:
+                    if line.startswith('Memory Configuration'):
+                        state = 'regions'
+                    continue
+                if state == 'regions':
+                    if line.startswith('Linker script and memory map'):
+                        state = 'sections'
+                        continue
+                    m = self.REGION_RE.match(line)
+                    if m and m.group(1) not in ['Name', '*default*']:
+                        self.regions[m.group(1)] = (int(m.group(2), 16), int(m.group(3), 16),
+                                                    self.region_kind(m.group(1), m.group(4) or ''))
+                    continue
+
+                if not line.strip():
+                    continue
+                # long section names are on own line, addresses are on next line
+                if pending is not None and self.ADDRESSES_RE.match(line):
+                    line = pending + line
+                pending = None
+                if self.NAME_RE.match(line):
+                    pending = line
+                    continue
+                if not line.startswith(' '):
+                    m = self.SECTION_RE.match(line)
+                    if m and m.group(1):
+                        size = int(m.group(3), 16)
+                        load_address = int(m.group(4), 16) if m.group(4) else None
+                        kinds = self.section_kinds(m.group(1), int(m.group(2), 16), load_address)
+                        for kind in kinds:
+                            self.totals[kind] += size
+                    else:
+                        kinds = []
+                    continue
+                if not kinds:
+                    continue
+                m = self.INPUT_RE.match(line)
+                if m and m.group(1):
+                    size = int(m.group(3), 16)
+                    if size == 0:
+                        continue
+                    input_file = self.FILL if m.group(1) == self.FILL else (m.group(4) or m.group(1))
+                    for kind in kinds:
+                        self.objects[input_file][kind] += size
+
+    @classmethod
+    def split_archive(cls, input_file):
+        """(archive, member) of 'archive(member)' input file, (None, input_file) for object file"""
+        m = re.match(r'^(.*\.a)\((.*)\)$', input_file)
+        if m:
+            return m.group(1), m.group(2)
+        return None, input_file
+
+    def aggregate(self, key_func):
+        usage = collections.defaultdict(lambda: {'flash': 0, 'ram': 0})
+        for input_file, sizes in self.objects.items():
+            key = key_func(input_file)
+            for kind, size in sizes.items():
+                usage[key][kind] += size
+        return dict(usage)
+
+    def folders(self):
+        """Usage per source folder (archive path for archive members)"""
+        def folder(input_file):
+            if input_file == self.FILL:
+                return self.FILL
+            archive, member = self.split_archive(input_file.replace('\\', '/'))
+            return archive if archive else posixpath.dirname(member)
+
+        return self.aggregate(folder)
+
+    def libraries(self, ref_libs=None):
+        """Usage per archive (by file name), objects outside of archives are '(objects)'.
+
+        With ref_libs (RefLibrary of project) other archives are summed up as '(toolchain)'.
+        """
+        names = set('lib' + ref_lib.raw_name + '.a' for ref_lib in ref_libs) if ref_libs is not None else None
+
+        def library(input_file):
+            if input_file == self.FILL:
+                return self.FILL
+            archive, __ = self.split_archive(input_file.replace('\\', '/'))
+            if archive is None:
+                return '(objects)'
+            name = posixpath.basename(archive)
+            if names is not None and name not in names:
+                return '(toolchain)'
+            return name
+
+        return self.aggregate(library)
+
+    def as_dict(self, ref_libs=None):
+        return {'file': self.file_name,
+                'regions': {name: {'origin': origin, 'length': length, 'kind': kind}
+                            for name, (origin, length, kind) in self.regions.items()},
+                'totals': self.totals,
+                'objects': dict(self.objects),
+                'folders': self.folders(),
+                'libraries': self.libraries(ref_libs)}
+
+
+def diff_usage(old, new):
+    """Changes of usage (dicts of name -> {'flash', 'ram'}), only changed names"""
+    changes = {}
+    for name in sorted(set(old) | set(new)):
+        before = old.get(name, {'flash': 0, 'ram': 0})
+        after = new.get(name, {'flash': 0, 'ram': 0})
+        delta = {kind: after[kind] - before[kind] for kind in ['flash', 'ram']}
+        if any(delta.values()):
+            changes[name] = delta
+    return changes
+
+
+def diff(old, new):
+    """Changes between two reports (as_dict() of LinkerMap)"""
+    return {'old': old['file'],
+            'new': new['file'],
+            'totals': {kind: new['totals'][kind] - old['totals'][kind] for kind in ['flash', 'ram']},
+            'objects': diff_usage(old['objects'], new['objects']),
+            'folders': diff_usage(old['folders'], new['folders']),
+            'libraries': diff_usage(old['libraries'], new['libraries'])}
+
+
+def write_table(title, usage, top):
+    sys.stdout.write('\n{:>10} {:>10}  {}\n'.format('flash', 'ram', title))
+    rows = sorted(usage.items(), key=lambda item: abs(item[1]['flash']) + abs(item[1]['ram']), reverse=True)
+    for name, sizes in rows[:top]:
+        sys.stdout.write('{:>10} {:>10}  {}\n'.format(sizes['flash'], sizes['ram'], name or '.'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='asninja map', description='Flash and RAM usage from GNU ld map file')
+    parser.add_argument('--prj', type=str, help='Atmel Studio project file (to tell referenced libraries)',
+                        default=None)
+    parser.add_argument('--top', type=int, help='Number of rows in tables', default=20)
+    parser.add_argument('--json', action='store_true', help='Write report as JSON')
+    parser.add_argument('map', type=str, help='Map file')
+    parser.add_argument('new_map', type=str, nargs='?', help='Map file to compare with first one', default=None)
+    args = parser.parse_args(argv)
+
+    ref_libs = None
+    if args.prj:
+        name, __ = os.path.splitext(os.path.basename(args.prj))
+        ref_libs = AtmelStudioProject(args.prj, name).ref_libs
+
+    data = LinkerMap(args.map).as_dict(ref_libs)
+    if args.new_map:
+        data = diff(data, LinkerMap(args.new_map).as_dict(ref_libs))
+
+    if args.json:
+        json.dump(data, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return 0
+
+    if args.new_map:
+        sys.stdout.write('{} -> {}: flash {:+d}, ram {:+d}\n'.format(data['old'], data['new'],
+                                                                     data['totals']['flash'], data['totals']['ram']))
+    else:
+        sys.stdout.write('{}: flash {}, ram {}\n'.format(data['file'], data['totals']['flash'],
+                                                         data['totals']['ram']))
+    write_table('Libraries', data['libraries'], args.top)
+    write_table('Folders', data['folders'], args.top)
+    write_table('Objects', data['objects'], args.top)
+    return 0
@@ -7,10 +7,13 @@ import asninja.helpers
 
 class AtmelStudioProject(object):
     NSMAP = {'msb': 'http://schemas.microsoft.com/developer/msbuild/2003'}
+    CONFIG_CONDITION_RE = re.compile(r"^'\$\(Configuration\)' == '([^']*)'$")
 
     def __init__(self, file_name, output):
         self.prj = ElementTree.parse(file_name)
         self.config_group = None
+        self.config_keys = None
+        self.config_lists = None
         self.is_cpp = None
         self.is_lib = None
         self.output_name = None
@@ -35,9 +38,7 @@ class AtmelStudioProject(object):
         self.toolchain_settings = 'ArmGccCpp' if self.is_cpp else 'ArmGcc'
         self.ref_libs = []
         for node in self.prj.findall('.//msb:ItemGroup/msb:ProjectReference', self.NSMAP):
-            path, prj_name = os.path.split(node.attrib['Include'])
-            raw_name, __ = os.path.splitext(prj_name)
-            self.ref_libs.append(RefLibrary(path.replace('\\', '/'), raw_name))
+            self.ref_libs.append(RefLibrary.from_include(node.attrib['Include']))
 
     def output(self):
         assert self.output_name is not None
@@ -54,18 +55,53 @@ class AtmelStudioProject(object):
 
         return prj_version, toolchain_name, toolchain_flavour
 
+    def config_groups(self):
+        """Top-level PropertyGroup nodes (candidates for config)"""
+        return self.prj.findall('msb:PropertyGroup', self.NSMAP)
+
+    def configs(self):
+        """Names of all configs (PropertyGroup with Configuration condition)"""
+        configs = []
+        for group in self.config_groups():
+            m = self.CONFIG_CONDITION_RE.match(group.attrib.get('Condition', '').strip())
+            if m:
+                configs.append(m.group(1))
+        return configs
+
     def select_config(self, config_name):
         self.config_group = None
-        for group in self.prj.findall('msb:PropertyGroup', self.NSMAP):
+        for group in self.config_groups():
             if group.attrib.get('Condition', '__').strip() == "'$(Configuration)' == '{}'".format(config_name):
                 self.config_group = group
                 break
+        self.index_config()
         return self.config_group is not None
 
+    def index_config(self):
+        """Walks toolchain settings of selected config once and indexes keys (and their ListValues) by name"""
+        self.config_keys = {}
+        self.config_lists = {}
+        if self.config_group is None:
+            return
+        ns_prefix = '{' + self.NSMAP['msb'] + '}'
+        list_tag = ns_prefix + 'ListValues'
+        value_tag = ns_prefix + 'Value'
+        for settings in self.config_group.iter(ns_prefix + self.toolchain_settings):
+            for key in settings:
+                if not isinstance(key.tag, str) or not key.tag.startswith(ns_prefix):
+                    continue
+                name = key.tag[len(ns_prefix):]
+                # same as find(): first key in document order wins
+                self.config_keys.setdefault(name, key)
+                # same as findall(): values from all keys with that name are collected
+                values = self.config_lists.setdefault(name, [])
+                for list_values in key:
+                    if list_values.tag == list_tag:
+                        values.extend(value.text for value in list_values if value.tag == value_tag)
+
     def key_raw(self, name):
         assert self.config_group is not None
-        key_xpath = './/msb:{}/msb:{}'.format(self.toolchain_settings, name)
-        return self.config_group.find(key_xpath, self.NSMAP)
+        return self.config_keys.get(name)
 
     def key_as_bool(self, name, default=False):
         assert self.config_group is not None
@@ -79,11 +115,7 @@ class AtmelStudioProject(object):
 
     def key_as_strlist(self, name, fmt):
         assert self.config_group is not None
-        s = []
-        key_xpath = './/msb:{}/msb:{}/msb:ListValues/msb:Value'.format(self.toolchain_settings, name)
-        for key in self.config_group.findall(key_xpath, self.NSMAP):
-            s.append(fmt.format(key.text))
-        return s
+        return [fmt.format(value) for value in self.config_lists.get(name, [])]
 
     def src_files(self):
         src_files = []
@@ -245,15 +277,108 @@ class AtmelStudioProject(object):
         return flags
 
 
+class StreamingAtmelStudioProject(AtmelStudioProject):
+    """AtmelStudioProject loaded with iterparse in one pass, for very large project files.
+
+    Only header properties, ProjectReference and Compile items and config groups are kept, all other nodes are
+    discarded while parsing. Results are the same as of AtmelStudioProject.
+    """
+
+    def __init__(self, file_name, output):
+        self.prj = None
+        self.props = None
+        self.src_items = None
+        self.ref_items = None
+        self.groups = None
+        self.config_group = None
+        self.config_keys = None
+        self.config_lists = None
+        self.is_cpp = None
+        self.is_lib = None
+        self.output_name = None
+        self.output_ext = None
+        self.toolchain_settings = None
+        self.ref_libs = None
+        self.load(file_name)
+        self.detect(output)
+
+    def load(self, file_name):
+        ns_prefix = '{' + self.NSMAP['msb'] + '}'
+        property_group_tag = ns_prefix + 'PropertyGroup'
+        item_group_tag = ns_prefix + 'ItemGroup'
+        compile_tag = ns_prefix + 'Compile'
+        reference_tag = ns_prefix + 'ProjectReference'
+
+        self.props = {}
+        self.src_items = []
+        self.ref_items = []
+        self.groups = []
+        stack = []
+        keep_depth = None
+        for event, node in ElementTree.iterparse(file_name, events=('start', 'end')):
+            if event == 'start':
+                # top-level PropertyGroups with Condition (config candidates) are kept as whole subtrees
+                if keep_depth is None and len(stack) == 1 and node.tag == property_group_tag and \
+                        'Condition' in node.attrib:
+                    keep_depth = len(stack)
+                stack.append(node)
+                continue
+
+            stack.pop()
+            parent = stack[-1] if stack else None
+            if parent is None:
+                continue
+            if parent.tag == property_group_tag and node.tag.startswith(ns_prefix):
+                self.props.setdefault(node.tag[len(ns_prefix):], node.text)
+            elif parent.tag == item_group_tag:
+                if node.tag == compile_tag:
+                    self.src_items.append(node.attrib['Include'])
+                elif node.tag == reference_tag:
+                    self.ref_items.append(node.attrib['Include'])
+            if keep_depth is None:
+                parent.remove(node)
+            elif len(stack) == keep_depth:
+                keep_depth = None
+                self.groups.append(node)
+                parent.remove(node)
+
+    def detect(self, output):
+        assert self.props.get('SchemaVersion') == '2.0', 'Unsupported project schema version'
+        self.is_cpp = self.props['Language'] == 'CPP'
+        self.is_lib = self.props['OutputType'] == 'StaticLibrary'
+        self.output_name = self.props['OutputFileName'].replace('$(MSBuildProjectName)', output)
+        self.output_ext = self.props['OutputFileExtension']
+        self.toolchain_settings = 'ArmGccCpp' if self.is_cpp else 'ArmGcc'
+        self.ref_libs = [RefLibrary.from_include(include) for include in self.ref_items]
+
+    def toolchain_id(self):
+        return self.props['ProjectVersion'], self.props['ToolchainName'], self.props['ToolchainFlavour']
+
+    def config_groups(self):
+        return self.groups
+
+    def src_files(self):
+        return [include.replace('\\', '/') for include in self.src_items]
+
+
 class RefLibrary(object):
     LIB_PREFIX = 'lib'
     LIB_EXT = '.a'
 
-    def __init__(self, path, raw_name):
+    def __init__(self, path, raw_name, prj_file=None):
         assert raw_name.find(self.LIB_PREFIX) == -1
         assert raw_name.find(self.LIB_EXT) == -1
         self.path = path
         self.raw_name = raw_name
+        self.prj_file = prj_file
+
+    @classmethod
+    def from_include(cls, include):
+        """From Include attribute of ProjectReference"""
+        prj_file = include.replace('\\', '/')
+        path, prj_name = os.path.split(prj_file)
+        raw_name, __ = os.path.splitext(prj_name)
+        return RefLibrary(path, raw_name, prj_file)
 
     def lib_name(self, with_ext=False):
         if with_ext:
@@ -0,0 +1,269 @@
+"""asninja report: compile hotspots, per-folder times, critical path and trends from .ninja_log"""
+import argparse
+import collections
+import json
+import os
+import posixpath
+import re
+import sys
+
+COMPILE_RULES = ['cc', 'cxx', 'pch', 'cc_pp', 'cxx_pp']
+# rules of local preprocessing (distributed compile), their outputs (.i, .ii) are compiled by cc and cxx
+PREPROCESS_RULES = ['cc_pp', 'cxx_pp']
+
+Edge = collections.namedtuple('Edge', ['rule', 'outputs', 'inputs', 'deps'])
+
+
+class NinjaLog(object):
+    """Times (start, end in ms) of last run of each output from .ninja_log (v5 and later)"""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.times = {}
+        with open(file_name, 'r', errors='replace') as f:
+            header = f.readline()
+            assert header.startswith('# ninja log v'), 'Unsupported ninja log {}'.format(file_name)
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 4:
+                    continue
+                # later entries are later runs
+                self.times[fields[3]] = int(fields[0]), int(fields[1])
+
+    def duration(self, output):
+        """Duration of edge (in seconds) that made output, None if output is not in log"""
+        if output not in self.times:
+            return None
+        start, end = self.times[output]
+        return (end - start) / 1000
+
+
+class NinjaGraph(object):
+    """Build edges of ninja file (with its subninja and include files).
+
+    Supports syntax written by asninja: file-scoped variables, rule/pool blocks (skipped), build statements.
+    Paths are normalized and relative to directory where ninja runs.
+    """
+    VAR_RE = re.compile(r'\$(\$|:| |\{[a-zA-Z0-9_.-]+\}|[a-zA-Z0-9_-]+)')
+
+    def __init__(self, file_name):
+        self.build_dir = os.path.dirname(file_name)
+        self.edges = []
+        self.read(os.path.basename(file_name), {})
+
+    @classmethod
+    def expand(cls, text, scope):
+        def repl(m):
+            name = m.group(1)
+            if name in ['$', ':', ' ']:
+                return name
+            return scope.get(name.strip('{}'), '')
+
+        return cls.VAR_RE.sub(repl, text)
+
+    @classmethod
+    def split_paths(cls, text):
+        """Splits on unescaped spaces (paths are not expanded)"""
+        return [p for p in re.split(r'(?<!\$) ', text) if p]
+
+    @classmethod
+    def logical_lines(cls, f):
+        """Lines with '$' continuations joined"""
+        line = ''
+        for raw in f:
+            raw = raw.rstrip('\r\n')
+            if line:
+                raw = raw.lstrip(' ')
+            stripped = raw.rstrip('$')
+            if (len(raw) - len(stripped)) % 2 == 1:
+                line += raw[:-1]
+                continue
+            yield line + raw
+            line = ''
+        if line:
+            yield line
+
+    def read(self, file_name, scope):
+        with open(os.path.join(self.build_dir, file_name), 'r', errors='replace') as f:
+            for line in self.logical_lines(f):
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+                if line.startswith(' '):
+                    # indented variables of rule, build or pool
+                    continue
+                keyword, __, rest = line.partition(' ')
+                if keyword in ['rule', 'pool', 'default']:
+                    continue
+                if keyword == 'build':
+                    self.read_build(rest, scope)
+                elif keyword in ['subninja', 'include']:
+                    # subninja has own scope, include shares scope
+                    path = self.expand(rest.strip(), scope)
+                    self.read(path, dict(scope) if keyword == 'subninja' else scope)
+                else:
+                    name, __, value = line.partition('=')
+                    scope[name.strip()] = self.expand(value.strip(), scope)
+
+    def read_build(self, text, scope):
+        m = re.match(r'((?:[^:$]|\$.)*):\s*(\S+)(.*)$', text)
+        if not m:
+            return
+        outputs, rule, rest = m.group(1), m.group(2), m.group(3)
+
+        def paths(part):
+            return [posixpath.normpath(self.expand(p, scope)) for p in self.split_paths(part)]
+
+        # explicit | implicit || order-only, first group of outputs is explicit (implicit outputs are ignored)
+        outputs = paths(outputs.split(' | ')[0])
+        order_only = ''
+        if ' || ' in rest:
+            rest, order_only = rest.split(' || ', 1)
+        implicit = ''
+        if ' | ' in rest:
+            rest, implicit = rest.split(' | ', 1)
+        inputs = paths(rest)
+        self.edges.append(Edge(rule, outputs, inputs, inputs + paths(implicit) + paths(order_only)))
+
+
+class BuildReport(object):
+    """Edge times of build graph (ninja log mapped to edges).
+
+    unity_batches are (name, src_files) of Converter.unity_batches for project of build dir, compile time of unity
+    source is split equally across its sources.
+    """
+
+    def __init__(self, graph, log, unity_batches=None):
+        self.graph = graph
+        self.log = log
+        self.unity_batches = {self.source_name(name): [posixpath.normpath(src_file.replace('\\', '/'))
+                                                       for src_file in src_files]
+                              for name, src_files in unity_batches or []}
+
+    def source_name(self, path):
+        """Source path relative to project dir (parent of build dir), like Compile items"""
+        prj_dir = os.path.join(self.graph.build_dir, '..')
+        return os.path.relpath(os.path.join(self.graph.build_dir, path), prj_dir).replace('\\', '/')
+
+    def compile_times(self):
+        """Compile time per source (translation unit), slowest first.
+
+        Preprocessed sources (.i, .ii) are mapped back to their sources, so time of source includes preprocessing.
+        Time of unity source is split across sources of its batch.
+        """
+        sources = {edge.outputs[0]: edge.inputs[0] for edge in self.graph.edges
+                   if edge.rule in PREPROCESS_RULES and edge.outputs and edge.inputs}
+        times = collections.Counter()
+        for edge in self.graph.edges:
+            if edge.rule not in COMPILE_RULES or not edge.inputs:
+                continue
+            duration = self.log.duration(edge.outputs[0])
+            if duration is None:
+                continue
+            source = self.source_name(sources.get(edge.inputs[0], edge.inputs[0]))
+            src_files = self.unity_batches.get(source, [source])
+            for src_file in src_files:
+                times[src_file] += duration / len(src_files)
+        return times.most_common()
+
+    def folder_times(self):
+        """Compile time per source folder, slowest first"""
+        times = collections.Counter()
+        for source, duration in self.compile_times():
+            times[posixpath.dirname(source)] += duration
+        return times.most_common()
+
+    def critical_path(self):
+        """Longest chain of edges (by logged durations), returns (total seconds, [(output, rule, seconds)])"""
+        producers = {}
+        for edge in self.graph.edges:
+            for output in edge.outputs:
+                producers[output] = edge
+
+        longest = {}
+
+        def visit(edge):
+            key = id(edge)
+            if key not in longest:
+                longest[key] = (0.0, None)
+                best = (0.0, None)
+                for dep in edge.deps:
+                    producer = producers.get(dep)
+                    if producer is not None and producer is not edge:
+                        total = visit(producer)[0]
+                        if total > best[0] or best[1] is None:
+                            best = (total, producer)
+                longest[key] = (best[0] + (self.log.duration(edge.outputs[0]) or 0.0), best[1])
+            return longest[key]
+
+        end = None
+        for edge in self.graph.edges:
+            if not edge.outputs or edge.rule in ['phony', 'regen']:
+                continue
+            if end is None or visit(edge)[0] > visit(end)[0]:
+                end = edge
+        if end is None:
+            return 0.0, []
+
+        path = []
+        edge = end
+        while edge is not None:
+            path.append((edge.outputs[0], edge.rule, self.log.duration(edge.outputs[0]) or 0.0))
+            edge = longest[id(edge)][1]
+        path.reverse()
+        return longest[id(end)][0], path
+
+
+def trends(graph, logs):
+    """Compile time of each source in every log (None if absent), sorted by growth from first to last log"""
+    table = collections.defaultdict(lambda: [None] * len(logs))
+    for i, log in enumerate(logs):
+        for source, duration in BuildReport(graph, log).compile_times():
+            table[source][i] = duration
+
+    def growth(item):
+        times = [t for t in item[1] if t is not None]
+        return times[-1] - times[0] if times else 0.0
+
+    return sorted(table.items(), key=growth, reverse=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='asninja report',
+                                     description='Compile hotspots and critical path from ninja log')
+    parser.add_argument('--builddir', type=str, help='Directory with build.ninja', default='.')
+    parser.add_argument('--log', type=str, action='append',
+                        help='Ninja log (several logs, oldest first, show trends), .ninja_log of builddir if absent')
+    parser.add_argument('--top', type=int, help='Number of rows in tables', default=20)
+    parser.add_argument('--json', action='store_true', help='Write report as JSON')
+    args = parser.parse_args(argv)
+
+    graph = NinjaGraph(os.path.join(args.builddir, 'build.ninja'))
+    logs = [NinjaLog(file_name) for file_name in (args.log or [os.path.join(args.builddir, '.ninja_log')])]
+    report = BuildReport(graph, logs[-1])
+    total, path = report.critical_path()
+    data = {'compile_times': report.compile_times(),
+            'folder_times': report.folder_times(),
+            'critical_path': {'total': total, 'edges': path}}
+    if len(logs) > 1:
+        data['trends'] = {'logs': [log.file_name for log in logs], 'sources': trends(graph, logs)}
+
+    if args.json:
+        json.dump(data, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return 0
+
+    sys.stdout.write('Slowest translation units:\n')
+    for source, duration in data['compile_times'][:args.top]:
+        sys.stdout.write('{:10.3f}s  {}\n'.format(duration, source))
+    sys.stdout.write('\nCompile time per folder:\n')
+    for folder, duration in data['folder_times'][:args.top]:
+        sys.stdout.write('{:10.3f}s  {}\n'.format(duration, folder or '.'))
+    sys.stdout.write('\nCritical path ({:.3f}s):\n'.format(total))
+    for output, rule, duration in path:
+        sys.stdout.write('{:10.3f}s  {:<8} {}\n'.format(duration, rule, output))
+    if 'trends' in data:
+        sys.stdout.write('\nTrends ({}):\n'.format(', '.join(data['trends']['logs'])))
+        for source, times in data['trends']['sources'][:args.top]:
+            sys.stdout.write('{}  {}\n'.format(' '.join('{:9.3f}s'.format(t) if t is not None else '{:>10}'.format('-')
+                                                        for t in times), source))
+    return 0
@@ -0,0 +1,146 @@
+"""asninja serve: runs conversions requested by clients (asninja client) on Unix socket, keeps caches warm"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+
+import asninja.asninja
+from .cache import MemoryProjectCache
+from .client import connect, conversion_env, default_socket_path, is_served
+
+
+class ThreadOutput(object):
+    """Replaces sys.stdout or sys.stderr, writes of thread with capture go to its buffer, others to original stream"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def target(self):
+        buffer = getattr(self.local, 'buffer', None)
+        return buffer if buffer is not None else self.stream
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    @contextlib.contextmanager
+    def capture(self, buffer):
+        self.local.buffer = buffer
+        try:
+            yield
+        finally:
+            self.local.buffer = None
+
+
+class ConversionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves each request (JSON line with argv, cwd and conversion_env of client) in own thread.
+
+    Parsed projects are kept in LRU MemoryProjectCache shared by requests (invalidated by mtime of project files),
+    results of toolchain discovery are kept by ToolchainDiscovery. Output of each request is captured separately.
+    Conversion looks up tools and Python in environment of server, so requests of clients with other environment are
+    refused (client converts in-process).
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, max_projects=256):
+        self.cache = MemoryProjectCache(max_projects=max_projects)
+        self.env = conversion_env()
+        super().__init__(socket_path, RequestHandler)
+        os.chmod(socket_path, 0o600)
+        self.stdout, self.stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = ThreadOutput(sys.stdout), ThreadOutput(sys.stderr)
+
+    def server_close(self):
+        super().server_close()
+        sys.stdout, sys.stderr = self.stdout, self.stderr
+
+    def run(self, argv, cwd, env=None):
+        """Runs asninja with argv as if from cwd, returns (exit code, stdout, stderr).
+
+        Call with env (conversion_env of client) that differs from one of server isn't run, exit code is None.
+        """
+        if env != self.env:
+            env = env or {}
+            names = sorted(name for name in set(self.env) | set(env) if env.get(name) != self.env.get(name))
+            self.stderr.write('asninja serve: refused call with other {}\n'.format(', '.join(names)))
+            self.stderr.flush()
+            return None, '', ''
+        out = io.StringIO()
+        err = io.StringIO()
+        with sys.stdout.capture(out), sys.stderr.capture(err):
+            if not is_served(argv):
+                sys.stderr.write('asninja serve: call is not served: {}\n'.format(' '.join(argv)))
+                exit_code = 2
+            else:
+                try:
+                    exit_code = asninja.asninja.main(argv, cwd, self.cache)
+                except SystemExit as e:
+                    # argparse errors (message is already written)
+                    exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                except Exception:
+                    traceback.print_exc()
+                    exit_code = 1
+        return exit_code, out.getvalue(), err.getvalue()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line.decode('utf-8'))
+            argv, cwd, env = list(request['argv']), request['cwd'], request.get('env')
+        except (ValueError, KeyError, TypeError):
+            response = {'exit_code': 2, 'stdout': '', 'stderr': 'asninja serve: malformed request\n'}
+        else:
+            exit_code, out, err = self.server.run(argv, cwd, env)
+            response = {'exit_code': exit_code, 'stdout': out, 'stderr': err}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='asninja serve',
+                                     description='Conversion server for asninja client (keeps caches warm)')
+    parser.add_argument('--socket', type=str,
+                        help='Unix socket (ASNINJA_SOCKET or asninja.sock in XDG_RUNTIME_DIR if absent)', default=None)
+    parser.add_argument('--max_projects', type=int, help='Number of parsed projects kept in memory', default=256)
+    args = parser.parse_args(argv)
+
+    if not hasattr(socket, 'AF_UNIX'):
+        sys.stderr.write('asninja serve: Unix sockets are not supported on this platform\n')
+        return 1
+    socket_path = args.socket or default_socket_path()
+    if os.path.exists(socket_path):
+        sock = connect(socket_path)
+        if sock is not None:
+            sock.close()
+            sys.stderr.write('asninja serve: server already listens on {}\n'.format(socket_path))
+            return 1
+        # left by server that didn't stop cleanly
+        os.remove(socket_path)
+
+    server = ConversionServer(socket_path, args.max_projects)
+    sys.stdout.write('Listening on {}, press Ctrl+C to stop\n'.format(socket_path))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+    return 0
@@ -0,0 +1,53 @@
+"""asninja size: machine-readable size report of linked output, compared with previous report"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+SECTIONS = ['text', 'data', 'bss']
+
+
+def read_size(size_tool, file_name):
+    """text, data and bss of file (from Berkeley format of size), flash and ram usage"""
+    output = subprocess.check_output([size_tool, '-B', '-d', file_name], universal_newlines=True)
+    fields = output.splitlines()[1].split()
+    report = {'file': os.path.basename(file_name)}
+    for section, value in zip(SECTIONS, fields):
+        report[section] = int(value)
+    report['flash'] = report['text'] + report['data']
+    report['ram'] = report['data'] + report['bss']
+    return report
+
+
+def format_report(report, previous=None):
+    """One line with sizes and (if previous report exists) their changes"""
+    parts = []
+    for key in SECTIONS + ['flash', 'ram']:
+        part = '{} {}'.format(key, report[key])
+        if previous and key in previous:
+            part += ' ({:+d})'.format(report[key] - previous[key])
+        parts.append(part)
+    return '{}: {}'.format(report['file'], ', '.join(parts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='asninja size', description='Size report of linked output')
+    parser.add_argument('--tool', type=str, help='size tool of toolchain', default='size')
+    parser.add_argument('--output', type=str, help='JSON report (previous report is read from it)', required=True)
+    parser.add_argument('file', type=str, help='Linked output (elf)')
+    args = parser.parse_args(argv)
+
+    previous = None
+    try:
+        with open(args.output) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    report = read_size(args.tool, args.file)
+    sys.stdout.write(format_report(report, previous) + '\n')
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
+    return 0
@@ -0,0 +1,37 @@
+import os
+import re
+
+
+class AtmelStudioSolution(object):
+    PROJECT_EXTS = ['.cproj', '.cppproj']
+    PROJECT_RE = re.compile(r'^Project\("\{[^}]*\}"\)\s*=\s*"([^"]*)"\s*,\s*"([^"]*)"')
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.projects = None
+        self.detect()
+
+    def detect(self):
+        """Reads all projects (with supported extension) from solution file"""
+        sln_dir = os.path.dirname(self.file_name)
+        self.projects = []
+        with open(self.file_name, 'r', encoding='utf-8-sig') as f:
+            for line in f:
+                m = self.PROJECT_RE.match(line.strip())
+                if not m:
+                    continue
+                name, path = m.group(1), m.group(2).replace('\\', '/')
+                __, ext = os.path.splitext(path)
+                if ext not in self.PROJECT_EXTS:
+                    continue
+                self.projects.append(SolutionProject(name, os.path.join(sln_dir, path)))
+
+
+class SolutionProject(object):
+    def __init__(self, name, file_name):
+        self.name = name
+        self.file_name = file_name
+
+    def outpath(self, outpath):
+        """Output path of project is relative to project directory"""
+        return os.path.join(os.path.dirname(self.file_name), outpath)
@@ -0,0 +1,81 @@
+import collections
+import contextlib
+import json
+import time
+import tracemalloc
+
+
+class PhaseTimings(object):
+    """Wall time and memory allocated (traced with tracemalloc) per named phase of conversion.
+
+    Nested phase is excluded from outer one, so phases sum up to total time and size. size is net size (bytes) of
+    memory allocated by phase (negative when phase frees more than allocates), peak is maximal size of memory
+    allocated above start of phase (nested phases included). tracemalloc is started by outermost phase (if not
+    tracing yet) and stopped at its end. callback(name, time, size) is called at end of each phase (in current
+    process only).
+    """
+
+    def __init__(self, callback=None):
+        self.phases = collections.OrderedDict()
+        self.callback = callback
+        # [start time, start size, nested time, nested size, peak] of active phases
+        self.stack = []
+        self.started_tracing = False
+
+    def __getstate__(self):
+        # sent to worker processes without callback, phases of workers are merged by caller
+        state = self.__dict__.copy()
+        state['callback'] = None
+        state['stack'] = []
+        state['started_tracing'] = False
+        return state
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.stack and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        size, peak = tracemalloc.get_traced_memory()
+        if self.stack:
+            self.stack[-1][4] = max(self.stack[-1][4], peak)
+        tracemalloc.reset_peak()
+        frame = [time.perf_counter(), size, 0.0, 0, size]
+        self.stack.append(frame)
+        try:
+            yield
+        finally:
+            self.stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            size, peak = tracemalloc.get_traced_memory()
+            peak = max(frame[4], peak)
+            size -= frame[1]
+            if self.stack:
+                self.stack[-1][2] += elapsed
+                self.stack[-1][3] += size
+                self.stack[-1][4] = max(self.stack[-1][4], peak)
+            elif self.started_tracing:
+                tracemalloc.stop()
+                self.started_tracing = False
+            self.add(name, elapsed - frame[2], size - frame[3], peak - frame[1])
+            if self.callback:
+                self.callback(name, elapsed - frame[2], size - frame[3])
+
+    def add(self, name, elapsed, size, peak=0, calls=1):
+        entry = self.phases.setdefault(name, {'time': 0.0, 'calls': 0, 'size': 0, 'peak': 0})
+        entry['time'] += elapsed
+        entry['calls'] += calls
+        entry['size'] += size
+        entry['peak'] = max(entry['peak'], peak)
+
+    def merge(self, phases):
+        """Adds phases (as_dict()['phases'] of other timings)"""
+        for name, entry in phases.items():
+            self.add(name, entry['time'], entry['size'], entry['peak'], entry['calls'])
+
+    def as_dict(self):
+        return {'phases': self.phases,
+                'total_time': sum(entry['time'] for entry in self.phases.values())}
+
+    def dump(self, f):
+        json.dump(self.as_dict(), f, indent=2)
+        f.write('\n')
@@ -0,0 +1,154 @@
+import glob
+import json
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import asninja.helpers
+from ..toolchains.gcc import GccToolchain
+
+
+class ToolchainDiscovery(object):
+    """Finds GCC toolchains in PATH and common install prefixes.
+
+    Compilers are probed in parallel (-dumpversion, -dumpmachine), found toolchains are cached in cache_file keyed
+    by mtimes of searched dirs, so probing is repeated only when some of dirs changes.
+    """
+    PREFIXES = ['/usr/bin', '/usr/local/bin', '/opt/*/bin', '/opt/*/*/bin', '/usr/local/*/bin', '~/.local/bin',
+                '~/opt/*/bin', '~/.local/*/bin']
+    TOOL_TYPES = ['arm', 'avr32', 'avr8']
+    # expected start of -dumpmachine output for tool type
+    MACHINES = {'arm': 'arm-none-eabi', 'avr32': 'avr32', 'avr8': 'avr'}
+    # prefix of tool names of installed toolchains, if it differs from one of tool type (avr-gcc of AVR 8-bit)
+    TOOL_PREFIXES = {'avr8': 'avr'}
+    # tool type of Atmel Studio toolchain name
+    TOOLCHAIN_NAMES = {'ARMGCC': 'arm', 'AVR32GCC': 'avr32', 'AVR8GCC': 'avr8', 'AVRGCC8': 'avr8'}
+    # cache file -> (key, toolchains) of discoveries in this process (long running server skips reading cache file)
+    discovered = {}
+
+    def __init__(self, cache_file=None, search_dirs=None):
+        self.cache_file = cache_file if cache_file is not None else self.default_cache_file()
+        self._search_dirs = search_dirs
+
+    @classmethod
+    def default_cache_file(cls):
+        cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.join(cache_home, 'asninja', 'toolchains.json')
+
+    def search_dirs(self):
+        """Existing dirs from PATH and PREFIXES (without duplicates)"""
+        if self._search_dirs is not None:
+            patterns = self._search_dirs
+        else:
+            patterns = os.environ.get('PATH', '').split(os.pathsep) + self.PREFIXES
+        dirs = []
+        seen = set()
+        for pattern in patterns:
+            if not pattern:
+                continue
+            for path in sorted(glob.glob(os.path.expanduser(pattern))):
+                real_path = os.path.realpath(path)
+                if os.path.isdir(path) and real_path not in seen:
+                    seen.add(real_path)
+                    dirs.append(path)
+        return dirs
+
+    @classmethod
+    def cache_key(cls, dirs):
+        key = {}
+        for path in dirs:
+            try:
+                key[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                pass
+        return key
+
+    @classmethod
+    def toolchain(cls, path, tool_type):
+        return GccToolchain(path, tool_type, cls.TOOL_PREFIXES.get(tool_type))
+
+    @classmethod
+    def candidates(cls, dirs):
+        """(dir, tool_type) of dirs with executable C compiler of tool type"""
+        candidates = []
+        for path in dirs:
+            for tool_type in cls.TOOL_TYPES:
+                cc = cls.toolchain(path, tool_type).cc()
+                if os.path.isfile(cc) and os.access(cc, os.X_OK):
+                    candidates.append((path, tool_type))
+        return candidates
+
+    @classmethod
+    def probe(cls, candidate):
+        """Dict with path, tool_type, version and machine of candidate (None if compiler fails or is foreign)"""
+        path, tool_type = candidate
+        cc = cls.toolchain(path, tool_type).cc()
+        try:
+            version = subprocess.check_output([cc, '-dumpversion'], stderr=subprocess.DEVNULL, timeout=10,
+                                              universal_newlines=True).strip()
+            machine = subprocess.check_output([cc, '-dumpmachine'], stderr=subprocess.DEVNULL, timeout=10,
+                                              universal_newlines=True).strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+        if not machine.startswith(cls.MACHINES[tool_type]):
+            return None
+        return {'path': path, 'tool_type': tool_type, 'version': version, 'machine': machine}
+
+    def discover(self):
+        """All found toolchains (from cache when searched dirs are unchanged)"""
+        dirs = self.search_dirs()
+        key = self.cache_key(dirs)
+        discovered = self.discovered.get(self.cache_file)
+        if discovered is not None and discovered[0] == key:
+            return discovered[1]
+        try:
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+            if data.get('key') == key:
+                self.discovered[self.cache_file] = key, data['toolchains']
+                return data['toolchains']
+        except (OSError, ValueError):
+            pass
+
+        candidates = self.candidates(dirs)
+        with ThreadPoolExecutor(max_workers=max(1, min(8, len(candidates)))) as executor:
+            toolchains = [info for info in executor.map(self.probe, candidates) if info is not None]
+        self.discovered[self.cache_file] = key, toolchains
+
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            asninja.helpers.write_if_changed(self.cache_file, json.dumps({'key': key, 'toolchains': toolchains},
+                                                                         indent=2))
+        except OSError:
+            pass
+        return toolchains
+
+    @classmethod
+    def version_key(cls, version):
+        return tuple(int(part) if part.isdigit() else 0 for part in version.split('.'))
+
+    @classmethod
+    def tool_type_of(cls, toolchain_id):
+        __, name, __ = toolchain_id
+        for marker, tool_type in cls.TOOLCHAIN_NAMES.items():
+            if marker in name:
+                return tool_type
+        return None
+
+    def find(self, toolchain_id):
+        """Best (newest) toolchain for toolchain_id of project (as returned by asp.toolchain_id())"""
+        tool_type = self.tool_type_of(toolchain_id)
+        if tool_type is None:
+            raise Exception('Unsupported toolchain name {0}. You can set toolchain explicitly with --gcc_toolchain'
+                            .format(toolchain_id[1]))
+        # first found (in search order) wins among same versions
+        best = None
+        for info in self.discover():
+            if info['tool_type'] != tool_type:
+                continue
+            if best is None or self.version_key(info['version']) > self.version_key(best['version']):
+                best = info
+        if best is None:
+            raise Exception('No {0} toolchain found in PATH and {1}. You can set toolchain explicitly with'
+                            ' --gcc_toolchain'.format(tool_type, ', '.join(self.PREFIXES)))
+        return self.toolchain(best['path'], best['tool_type'])
@@ -2,9 +2,11 @@ import os
 
 
 class GccToolchain(object):
-    def __init__(self, path, tool_type=None):
+    def __init__(self, path, tool_type=None, prefix=None):
         self.path = path
         self.tool_type = tool_type if tool_type else self.tool_type(path)
+        # prefix of tool names, default one of tool type if absent
+        self.prefix = prefix
 
     @classmethod
     def tool_type(cls, path) -> str:
@@ -19,6 +21,8 @@ class GccToolchain(object):
         return tool_type
 
     def tool_prefix(self) -> str:
+        if self.prefix:
+            return self.prefix
         prefixes = {'arm': 'arm-none-eabi',
                     'avr32': 'avr32',
                     'avr8': 'avr8'}
@@ -36,6 +40,10 @@ class GccToolchain(object):
         tool = self.tool_prefix() + '-g++'
         return os.path.join(self.path, tool)
 
+    def objcopy(self) -> str:
+        tool = self.tool_prefix() + '-objcopy'
+        return os.path.join(self.path, tool)
+
     def objdump(self) -> str:
         tool = self.tool_prefix() + '-objdump'
         return os.path.join(self.path, tool)
@@ -0,0 +1,235 @@
+"""Watch mode: keeps build graphs up to date while project files change"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from .cache import MemoryProjectCache
+from .converter import Converter
+
+
+class PollingWatcher(object):
+    """Detects changes of files by polling their stats (sees changes made by other hosts on network drives)"""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        # absolute file name -> stat key (None for missing file)
+        self.stats = {}
+
+    @classmethod
+    def stat(cls, file_name):
+        try:
+            st = os.stat(file_name)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def watch(self, file_names):
+        """Sets watched files (already watched files keep their last seen stats)"""
+        file_names = set(os.path.abspath(file_name) for file_name in file_names)
+        self.stats = {file_name: self.stats[file_name] if file_name in self.stats else self.stat(file_name)
+                      for file_name in file_names}
+
+    def poll(self):
+        changed = set()
+        for file_name, stat in self.stats.items():
+            new_stat = self.stat(file_name)
+            if new_stat != stat:
+                self.stats[file_name] = new_stat
+                changed.add(file_name)
+        return changed
+
+    def wait(self, timeout=None):
+        """Changed files (absolute paths), empty set if nothing changed within timeout (None waits forever)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self.poll()
+            if changed:
+                return changed
+            delay = self.interval
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return set()
+                delay = min(delay, remaining)
+            time.sleep(delay)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """Detects changes of files with Linux inotify.
+
+    Directories of files are watched, so files replaced by rename (as editors save them) are seen too.
+    """
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    # struct inotify_event without name: wd, mask, cookie, len
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is available on Linux only')
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        # watched dir -> watch descriptor and back
+        self.dirs = {}
+        self.wds = {}
+        self.files = set()
+
+    def watch(self, file_names):
+        """Sets watched files (files in missing dirs are not watched)"""
+        self.files = set(os.path.abspath(file_name) for file_name in file_names)
+        dirs = set(os.path.dirname(file_name) for file_name in self.files)
+        for path in set(self.dirs) - dirs:
+            wd = self.dirs.pop(path)
+            del self.wds[wd]
+            self.libc.inotify_rm_watch(self.fd, wd)
+        for path in sorted(dirs - set(self.dirs)):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+            if wd < 0:
+                # missing dir (of missing library project) is retried on next watch()
+                continue
+            self.dirs[path] = wd
+            self.wds[wd] = path
+
+    def read_events(self):
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos + self.EVENT.size <= len(data):
+                wd, __, __, length = self.EVENT.unpack_from(data, pos)
+                pos += self.EVENT.size
+                name = data[pos:pos + length].rstrip(b'\0')
+                pos += length
+                # events of removed watches and of dirs themselves have no known dir or name
+                if wd not in self.wds or not name:
+                    continue
+                file_name = os.path.join(self.wds[wd], os.fsdecode(name))
+                if file_name in self.files:
+                    changed.add(file_name)
+        return changed
+
+    def wait(self, timeout=None):
+        """Changed files (absolute paths), empty set if nothing changed within timeout (None waits forever)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            readable, __, __ = select.select([self.fd], [], [], remaining)
+            if readable:
+                changed = self.read_events()
+                if changed:
+                    return changed
+            elif deadline is not None:
+                return set()
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(poll_interval=None):
+    """PollingWatcher when poll_interval is given or inotify isn't available, InotifyWatcher otherwise"""
+    if poll_interval is None:
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError):
+            # no inotify (other OS, no libc symbols, limit of instances reached)
+            poll_interval = 1.0
+    return PollingWatcher(poll_interval)
+
+
+class ProjectWatch(object):
+    """Reruns conversions (name, kwargs of Converter.convert) when their project files change.
+
+    Projects are kept in memory between runs (MemoryProjectCache), after a burst of changes settles (nothing changed
+    within debounce seconds) only conversions that depend on changed files (project and transitively referenced
+    library projects) are rerun.
+    """
+
+    def __init__(self, tasks, watcher, debounce=0.3, cache=None):
+        self.tasks = tasks
+        self.watcher = watcher
+        self.debounce = debounce
+        self.cache = cache if cache is not None else MemoryProjectCache()
+        # name of conversion -> project files (absolute) it depends on
+        self.deps = {}
+
+    def project_files(self, as_prj, output, streaming=False):
+        """Project file and transitively referenced library project files (absolute paths)"""
+        files = set()
+        pending = [(as_prj, output)]
+        while pending:
+            file_name, name = pending.pop()
+            file_name = os.path.abspath(file_name)
+            if file_name in files:
+                continue
+            files.add(file_name)
+            # missing library project is watched, so its creation triggers conversion
+            if not os.path.isfile(file_name):
+                continue
+            asp = Converter.load_project(file_name, name, self.cache, streaming)
+            for ref_lib in asp.ref_libs:
+                pending.append((os.path.join(os.path.dirname(file_name), ref_lib.prj_file), ref_lib.raw_name))
+        return files
+
+    def run(self, names=None):
+        """Runs conversions (all or with given names), returns list of (name, elapsed, changed, error)"""
+        results = []
+        for name, kwargs in self.tasks:
+            if names is not None and name not in names:
+                continue
+            start = time.perf_counter()
+            changed = False
+            try:
+                changed = Converter.convert(cache=self.cache, **kwargs)
+                error = None
+            except Exception as e:
+                error = '{}: {}'.format(type(e).__name__, e)
+            options = kwargs.get('options')
+            try:
+                self.deps[name] = self.project_files(kwargs['as_prj'], kwargs['output'],
+                                                     options.streaming if options else False)
+            except Exception:
+                # project can't be parsed (like partially saved one), previously known deps are kept
+                self.deps[name] = self.deps.get(name, set()) | {os.path.abspath(kwargs['as_prj'])}
+            results.append((name, time.perf_counter() - start, changed, error))
+        self.watcher.watch(set().union(*self.deps.values()))
+        return results
+
+    def affected(self, changed):
+        """Names of conversions that depend on any of changed files"""
+        return [name for name, __ in self.tasks if self.deps.get(name, set()) & changed]
+
+    def wait_changes(self, timeout=None):
+        """Changed files after burst of changes settles, empty set if nothing changed within timeout"""
+        changed = self.watcher.wait(timeout)
+        while changed:
+            more = self.watcher.wait(self.debounce)
+            if not more:
+                break
+            changed |= more
+        return changed
+
+    def step(self, timeout=None):
+        """Waits for changes and reruns affected conversions, returns their results (None if nothing changed)"""
+        changed = self.wait_changes(timeout)
+        if not changed:
+            return None
+        self.cache.invalidate(changed)
+        return self.run(set(self.affected(changed)))
@@ -0,0 +1,135 @@
+"""Benchmarks of asninja on synthetic projects.
+
+Usage: python -m benchmarks.bench --sources 10,1000,100000 --output results.json --baseline baseline.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import asninja
+from asninja.converter import Converter, ConvertOptions
+from asninja.parser import AtmelStudioProject
+from benchmarks.synthetic import config_names, write_project
+
+
+def measure(func, repeat):
+    """Best wall time of repeat runs of func and peak of traced memory of one run"""
+    best = None
+    for __ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        func()
+        __, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def bench_case(tmp_dir, src_count, configs, ref_libs_depth, settings_keys, repeat):
+    """Measures phases on generated project, returns dict of results (times in seconds, memory in bytes)"""
+    name = 'Bench{}'.format(src_count)
+    as_prj = write_project(tmp_dir, name, src_count, configs, ref_libs_depth, settings_keys)
+    config = config_names(configs)[0]
+    asp = AtmelStudioProject(as_prj, name)
+
+    def derive_flags():
+        asp.select_config(config)
+        asp.compiler_flags(True, [], [], [])
+        asp.linker_flags(config)
+
+    def convert():
+        # fresh output dir for each run, graphs are written only when changed, so rerun into same dir writes nothing
+        outpath = tempfile.mkdtemp(prefix='out', dir=tmp_dir)
+        with contextlib.redirect_stdout(io.StringIO()):
+            Converter.convert(as_prj, config, outpath, name, [], [], [], custom_toolchain='arm-',
+                              options=ConvertOptions(unified=ref_libs_depth > 0))
+
+    result = {'name': 'src{}-cfg{}-depth{}-keys{}'.format(src_count, configs, ref_libs_depth, settings_keys),
+              'src_count': src_count,
+              'configs': configs,
+              'ref_libs_depth': ref_libs_depth,
+              'settings_keys': settings_keys,
+              'project_size': os.path.getsize(as_prj)}
+    for phase, func in [('parse', lambda: AtmelStudioProject(as_prj, name)),
+                        ('flags', derive_flags),
+                        ('convert', convert)]:
+        result[phase + '_time'], result[phase + '_peak_mem'] = measure(func, repeat)
+    return result
+
+
+def compare(results, baseline, threshold):
+    """Lines of comparison with baseline and count of time regressions (slower than baseline by threshold)"""
+    base_cases = {case['name']: case for case in baseline['cases']}
+    lines = []
+    regressions = 0
+    for case in results['cases']:
+        base = base_cases.get(case['name'])
+        if base is None:
+            continue
+        for key in sorted(case):
+            if not key.endswith('_time') or not base.get(key):
+                continue
+            ratio = case[key] / base[key]
+            mark = ''
+            if ratio > 1 + threshold:
+                mark = ' REGRESSION'
+                regressions += 1
+            lines.append('{:<36} {:<14} {:10.4f}s {:10.4f}s {:7.2f}x{}'.format(case['name'], key, base[key],
+                                                                               case[key], ratio, mark))
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='asninja benchmarks')
+    parser.add_argument('--sources', type=str, help='Comma-separated source counts', default='10,1000,10000')
+    parser.add_argument('--configs', type=int, help='Number of configs', default=2)
+    parser.add_argument('--ref_libs_depth', type=int, help='Depth of referenced libraries chain', default=0)
+    parser.add_argument('--settings_keys', type=int, help='Number of additional settings keys', default=0)
+    parser.add_argument('--repeat', type=int, help='Number of timed runs (best is reported)', default=3)
+    parser.add_argument('--output', type=str, help='JSON file for results', default=None)
+    parser.add_argument('--baseline', type=str, help='JSON file with results to compare with', default=None)
+    parser.add_argument('--threshold', type=float, help='Allowed slowdown against baseline', default=0.1)
+    args = parser.parse_args(argv)
+
+    results = {'asninja_version': asninja.__version__,
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'cases': []}
+    for src_count in [int(s) for s in args.sources.split(',')]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            case = bench_case(tmp_dir, src_count, args.configs, args.ref_libs_depth, args.settings_keys,
+                              args.repeat)
+        results['cases'].append(case)
+        sys.stdout.write('{:<36} parse {:8.4f}s  flags {:8.4f}s  convert {:8.4f}s  peak {:8.1f} MB\n'.format(
+            case['name'], case['parse_time'], case['flags_time'], case['convert_time'],
+            max(case['parse_peak_mem'], case['convert_peak_mem']) / 1024 / 1024))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        lines, regressions = compare(results, baseline, args.threshold)
+        for line in lines:
+            sys.stdout.write(line + '\n')
+        if regressions:
+            sys.stdout.write('{} regression(s)\n'.format(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Micro-benchmark of config settings lookups: index built by select_config against XPath query per key.
+
+Usage: python -m benchmarks.index_config --settings_keys 2000 --number 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from asninja.parser import AtmelStudioProject
+from benchmarks.synthetic import write_project
+
+KORSAR3 = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'Korsar3.cproj')
+
+
+class XPathProject(AtmelStudioProject):
+    """AtmelStudioProject that queries keys with XPath from config group (as before config index)"""
+
+    def index_config(self):
+        pass
+
+    def key_raw(self, name):
+        assert self.config_group is not None
+        key_xpath = './/msb:{}/msb:{}'.format(self.toolchain_settings, name)
+        return self.config_group.find(key_xpath, self.NSMAP)
+
+    def key_as_strlist(self, name, fmt):
+        assert self.config_group is not None
+        s = []
+        key_xpath = './/msb:{}/msb:{}/msb:ListValues/msb:Value'.format(self.toolchain_settings, name)
+        for key in self.config_group.findall(key_xpath, self.NSMAP):
+            s.append(fmt.format(key.text))
+        return s
+
+
+def derive_flags(asp, config):
+    """Selects config and derives compiler (C and C++) and linker flags"""
+    asp.select_config(config)
+    return asp.compiler_flags(True, [], [], []), asp.compiler_flags(False, [], [], []), asp.linker_flags(config)
+
+
+def time_flags(asp, config, number, repeat):
+    """Best time of one derive_flags call (of repeat runs of number calls)"""
+    best = None
+    for __ in range(repeat):
+        start = time.perf_counter()
+        for __ in range(number):
+            derive_flags(asp, config)
+        elapsed = (time.perf_counter() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_project(name, as_prj, config, number, repeat):
+    """Times of XPath and indexed lookups on project, returns dict of results (times in seconds)"""
+    output, __ = os.path.splitext(os.path.basename(as_prj))
+    xpath_asp = XPathProject(as_prj, output)
+    index_asp = AtmelStudioProject(as_prj, output)
+    # index must give same flags as queries
+    assert derive_flags(xpath_asp, config) == derive_flags(index_asp, config), 'Flags of {} differ'.format(name)
+    xpath_time = time_flags(xpath_asp, config, number, repeat)
+    index_time = time_flags(index_asp, config, number, repeat)
+    return {'name': name, 'xpath_time': xpath_time, 'index_time': index_time, 'speedup': xpath_time / index_time}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='asninja config index micro-benchmark')
+    parser.add_argument('--prj', type=str, help='Atmel Studio project file', default=KORSAR3)
+    parser.add_argument('--config', type=str, help='Config of project', default='Debug')
+    parser.add_argument('--settings_keys', type=int, help='Number of settings keys of synthetic project',
+                        default=2000)
+    parser.add_argument('--number', type=int, help='Number of calls in timed run', default=200)
+    parser.add_argument('--repeat', type=int, help='Number of timed runs (best is reported)', default=3)
+    args = parser.parse_args(argv)
+
+    cases = [bench_project(os.path.basename(args.prj), args.prj, args.config, args.number, args.repeat)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        as_prj = write_project(tmp_dir, 'Large', 10, 2, 0, args.settings_keys)
+        cases.append(bench_project('synthetic-keys{}'.format(args.settings_keys), as_prj, 'Debug',
+                                   max(1, args.number // 10), args.repeat))
+
+    for case in cases:
+        sys.stdout.write('{:<24} xpath {:10.1f}us  index {:10.1f}us  {:7.2f}x\n'.format(
+            case['name'], case['xpath_time'] * 1e6, case['index_time'] * 1e6, case['speedup']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import os
+from xml.sax.saxutils import escape
+
+PROJECT_HEADER = '''<?xml version="1.0" encoding="utf-8"?>
+<Project DefaultTargets="Build" xmlns="http://schemas.microsoft.com/developer/msbuild/2003">
+  <PropertyGroup>
+    <SchemaVersion>2.0</SchemaVersion>
+    <ProjectVersion>7.0</ProjectVersion>
+    <ToolchainName>com.Atmel.ARMGCC.{toolchain}</ToolchainName>
+    <avrdevice>ATSAM4S8C</avrdevice>
+    <OutputType>{output_type}</OutputType>
+    <Language>{language}</Language>
+    <OutputFileName>{output_name}</OutputFileName>
+    <OutputFileExtension>{output_ext}</OutputFileExtension>
+    <AssemblyName>{name}</AssemblyName>
+    <Name>{name}</Name>
+    <ToolchainFlavour>Native</ToolchainFlavour>
+  </PropertyGroup>
+'''
+
+
+def list_values(values):
+    return '<ListValues>' + ''.join('<Value>{}</Value>'.format(escape(value)) for value in values) + '</ListValues>'
+
+
+def config_group(config, settings, prefixes, settings_keys, include_paths):
+    """PropertyGroup of config with common compiler/linker keys and settings_keys dummy keys"""
+    keys = []
+    for prefix in prefixes:
+        keys += [(prefix + '.compiler.directories.IncludePaths', list_values(include_paths)),
+                 (prefix + '.compiler.symbols.DefSymbols', list_values([config.upper(), 'BOARD=SAM4S_EK'])),
+                 (prefix + '.compiler.optimization.level', 'Optimize (-O1)'),
+                 (prefix + '.compiler.optimization.DebugLevel', 'Maximum (-g3)'),
+                 (prefix + '.compiler.warnings.AllWarnings', 'True'),
+                 (prefix + '.linker.libraries.Libraries', list_values(['libm'])),
+                 (prefix + '.linker.optimization.GarbageCollectUnusedSections', 'True'),
+                 (prefix + '.linker.miscellaneous.LinkerFlags', '-T../src/sam4s8c_flash.ld')]
+    keys += [('armgcc.synthetic.key{}'.format(i), 'value{}'.format(i)) for i in range(settings_keys)]
+
+    lines = ['  <PropertyGroup Condition=" \'$(Configuration)\' == \'{}\' ">'.format(config),
+             '    <ToolchainSettings>',
+             '      <{}>'.format(settings)]
+    lines += ['  <{0}>{1}</{0}>'.format(name, value) for name, value in keys]
+    lines += ['</{}>'.format(settings),
+              '    </ToolchainSettings>',
+              '  </PropertyGroup>']
+    return '\n'.join(lines) + '\n'
+
+
+def src_file_names(src_count, is_cpp, files_per_dir=50):
+    """Sources (with headers) in dirs of files_per_dir sources, paths are relative to project dir"""
+    file_ext = '.cpp' if is_cpp else '.c'
+    src_files = []
+    for i in range(src_count):
+        base = 'src/dir{}/file{}'.format(i // files_per_dir, i)
+        src_files += [base + file_ext, base + '.h']
+    return src_files
+
+
+def config_names(configs):
+    return (['Debug', 'Release'] + ['Config{}'.format(i) for i in range(2, configs)])[:configs]
+
+
+def write_project(root_dir, name, src_count=100, configs=2, ref_libs_depth=0, settings_keys=0, is_cpp=False):
+    """Writes synthetic project (and chain of ref_libs_depth library projects) to root_dir/name.
+
+    Returns file name of project. Library projects are named name_dep1 .. name_depN, each references next one.
+    """
+    names = [name] + ['{}_dep{}'.format(name, i) for i in range(1, ref_libs_depth + 1)]
+    file_ext = '.cppproj' if is_cpp else '.cproj'
+    for i, prj_name in enumerate(names):
+        ref_name = names[i + 1] if i + 1 < len(names) else None
+        write_project_file(os.path.join(root_dir, prj_name, prj_name + file_ext), prj_name, src_count, configs,
+                           settings_keys, is_cpp, i > 0, ref_name)
+    return os.path.join(root_dir, name, name + file_ext)
+
+
+def write_project_file(prj_file, name, src_count, configs, settings_keys, is_cpp, is_lib, ref_name):
+    os.makedirs(os.path.dirname(prj_file), exist_ok=True)
+    settings = 'ArmGccCpp' if is_cpp else 'ArmGcc'
+    prefixes = ['armgcc', 'armgcccpp'] if is_cpp else ['armgcc']
+    parts = [PROJECT_HEADER.format(toolchain='CPP' if is_cpp else 'C',
+                                   output_type='StaticLibrary' if is_lib else 'Executable',
+                                   language='CPP' if is_cpp else 'C',
+                                   output_name='lib$(MSBuildProjectName)' if is_lib else '$(MSBuildProjectName)',
+                                   output_ext='.a' if is_lib else '.elf',
+                                   name=name)]
+    include_paths = ['../src', '../src/common', '../../shared/include']
+    for config in config_names(configs):
+        parts.append(config_group(config, settings, prefixes, settings_keys, include_paths))
+
+    parts.append('  <ItemGroup>\n')
+    for src_file in src_file_names(src_count, is_cpp):
+        parts.append('    <Compile Include="{}">\n      <SubType>compile</SubType>\n    </Compile>\n'.format(
+            src_file.replace('/', '\\')))
+    parts.append('  </ItemGroup>\n')
+
+    if ref_name:
+        parts.append('  <ItemGroup>\n    <ProjectReference Include="..\\{0}\\{0}{1}">\n      <Name>{0}</Name>\n'
+                     '    </ProjectReference>\n  </ItemGroup>\n'.format(ref_name, os.path.splitext(prj_file)[1]))
+
+    parts.append('</Project>\n')
+    with open(prj_file, 'w', encoding='utf-8') as f:
+        f.write(''.join(parts))
@@ -12,7 +12,8 @@ setup(
         PROJECT_NAME + '.toolchains'
     ],
     entry_points={
-        "console_scripts": ['{0} = {0}.{0}:main'.format(PROJECT_NAME)]
+        "console_scripts": ['{0} = {0}.{0}:main'.format(PROJECT_NAME),
+                            '{0}-client = {0}.client:main'.format(PROJECT_NAME)]
     },
     install_requires=[
         'ninja_syntax>=1.6.0'
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+from asninja.parser import AtmelStudioProject
+from benchmarks.bench import bench_case, compare
+from benchmarks.index_config import XPathProject, bench_project
+from benchmarks.synthetic import write_project
+
+
+class TestSynthetic(unittest.TestCase):
+    def test_write_project(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            as_prj = write_project(tmp_dir, 'App', src_count=120, configs=3, ref_libs_depth=2, settings_keys=10)
+            asp = AtmelStudioProject(as_prj, 'App')
+            self.assertEqual(['Debug', 'Release', 'Config2'], asp.configs())
+            self.assertEqual(240, len(asp.src_files()))
+            self.assertEqual('src/dir2/file119.c', asp.src_files()[-2])
+            self.assertEqual(['App_dep1'], [ref_lib.raw_name for ref_lib in asp.ref_libs])
+            self.assertTrue(asp.select_config('Config2'))
+            self.assertIn('-DCONFIG2', asp.compiler_flags(True, [], [], []))
+            self.assertEqual('value9', asp.key_raw('armgcc.synthetic.key9').text)
+
+            lib_asp = AtmelStudioProject(os.path.join(tmp_dir, 'App_dep1', 'App_dep1.cproj'), 'App_dep1')
+            self.assertTrue(lib_asp.is_lib)
+            self.assertEqual(['App_dep2'], [ref_lib.raw_name for ref_lib in lib_asp.ref_libs])
+            lib_asp = AtmelStudioProject(os.path.join(tmp_dir, 'App_dep2', 'App_dep2.cproj'), 'App_dep2')
+            self.assertEqual([], lib_asp.ref_libs)
+
+
+class TestBench(unittest.TestCase):
+    def test_bench_case(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            case = bench_case(tmp_dir, 10, 2, 1, 0, 2)
+            # each run (timed ones and one with traced memory) converts into own output dir
+            outpaths = [name for name in os.listdir(tmp_dir) if name.startswith('out')]
+            self.assertEqual(3, len(outpaths))
+            for outpath in outpaths:
+                self.assertTrue(os.path.isfile(os.path.join(tmp_dir, outpath, 'build.ninja')))
+        self.assertEqual('src10-cfg2-depth1-keys0', case['name'])
+        for phase in ['parse', 'flags', 'convert']:
+            self.assertGreater(case[phase + '_time'], 0)
+            self.assertGreater(case[phase + '_peak_mem'], 0)
+
+    def test_compare(self):
+        baseline = {'cases': [{'name': 'a', 'parse_time': 1.0, 'convert_time': 2.0}]}
+        results = {'cases': [{'name': 'a', 'parse_time': 1.05, 'convert_time': 3.0},
+                             {'name': 'b', 'parse_time': 1.0}]}
+        lines, regressions = compare(results, baseline, 0.1)
+        self.assertEqual(2, len(lines))
+        self.assertEqual(1, regressions)
+        self.assertTrue(lines[0].endswith('REGRESSION'))
+
+
+class TestIndexConfig(unittest.TestCase):
+    def test_xpath_project(self):
+        asp = XPathProject('Korsar3.cproj', 'Korsar3')
+        self.assertTrue(asp.select_config('Debug'))
+        self.assertIsNone(asp.config_keys)
+        index_asp = AtmelStudioProject('Korsar3.cproj', 'Korsar3')
+        index_asp.select_config('Debug')
+        self.assertEqual(index_asp.compiler_flags(True, [], [], []), asp.compiler_flags(True, [], [], []))
+
+    def test_bench_project(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            as_prj = write_project(tmp_dir, 'Large', 10, 1, 0, 50)
+            case = bench_project('large', as_prj, 'Debug', 2, 1)
+        self.assertEqual('large', case['name'])
+        self.assertGreater(case['xpath_time'], 0)
+        self.assertGreater(case['index_time'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import shutil
+import tempfile
+import unittest
+
+from asninja.cache import *
+
+
+class TestProjectCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = ProjectCache(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        self.cache = None
+
+    def test_key(self):
+        self.assertEqual(self.cache.key('Korsar3.cproj', 'Korsar3'), self.cache.key('Korsar3.cproj', 'Korsar3'))
+        self.assertNotEqual(self.cache.key('Korsar3.cproj', 'Korsar3'), self.cache.key('Korsar3.cproj', 'Other'))
+
+    def test_load(self):
+        cp = self.cache.load('Korsar3.cproj', 'Korsar3')
+        self.assertIsNotNone(cp.asp)
+        self.assertTrue(cp.select_config('Debug'))
+        flags = cp.compiler_flags(True, ['TestDef'], [], [])
+        self.cache.store(cp)
+        self.assertFalse(cp.changed)
+
+        cp = self.cache.load('Korsar3.cproj', 'Korsar3')
+        self.assertIsNone(cp.asp)
+        self.assertFalse(cp.is_cpp)
+        self.assertFalse(cp.is_lib)
+        self.assertEqual('Korsar3.elf', cp.output())
+        self.assertEqual(('6.2', 'com.Atmel.ARMGCC.C', 'Native'), cp.toolchain_id())
+        self.assertEqual(['Release', 'Debug'], cp.configs())
+        self.assertEqual(AtmelStudioProject('Korsar3.cproj', 'Korsar3').src_files(), cp.src_files())
+        self.assertEqual('../HelpersInCppK3/HelpersInCppK3.cppproj', cp.ref_libs[2].prj_file)
+        self.assertTrue(cp.select_config('Debug'))
+        self.assertEqual(flags, cp.compiler_flags(True, ['TestDef'], [], []))
+        self.assertIsNone(cp.asp)
+        self.assertFalse(cp.select_config('NonExists'))
+
+        # flags for other arguments are derived from parsed project
+        self.assertTrue(cp.select_config('Release'))
+        cp.linker_flags('Release')
+        self.assertIsNotNone(cp.asp)
+        self.assertTrue(cp.changed)
+
+    def test_evict(self):
+        self.cache.max_size = 0
+        self.cache.store(self.cache.load('Korsar3.cproj', 'Korsar3'))
+        self.assertEqual([], os.listdir(self.tmp_dir.name))
+
+
+class TestMemoryProjectCache(unittest.TestCase):
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, 'Korsar3.cproj')
+            shutil.copy('Korsar3.cproj', file_name)
+            cache = MemoryProjectCache()
+            cp = cache.load(file_name, 'Korsar3')
+            self.assertTrue(cp.select_config('Debug'))
+            flags = cp.compiler_flags(True, [], [], [])
+            cache.store(cp)
+            self.assertFalse(cp.changed)
+            view = cache.load(file_name, 'Korsar3')
+            self.assertIs(cp.data, view.data)
+            self.assertIsNone(view.config)
+            self.assertEqual(flags, cp.compiler_flags(True, [], [], []))
+
+            with open(file_name, 'a') as f:
+                f.write('\n')
+            self.assertIsNot(cp.data, cache.load(file_name, 'Korsar3').data)
+            cp = cache.load(file_name, 'Korsar3')
+            cache.invalidate([file_name])
+            self.assertIsNot(cp.data, cache.load(file_name, 'Korsar3').data)
+
+    def test_lru(self):
+        cache = MemoryProjectCache(max_projects=1)
+        cache.load('Korsar3.cproj', 'Korsar3')
+        cache.load('HelpersInCppK3.cppproj', 'HelpersInCppK3')
+        self.assertEqual([os.path.abspath('HelpersInCppK3.cppproj')], [key[0] for key in cache.projects])
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = MemoryProjectCache(ProjectCache(tmp_dir))
+            self.assertEqual(tmp_dir, cache.cache_dir)
+            cache.store(cache.load('Korsar3.cproj', 'Korsar3'))
+            self.assertEqual(1, len(os.listdir(tmp_dir)))
+            self.assertIsNone(MemoryProjectCache().load('Korsar3.cproj', 'Korsar3').key)
+
+            # shared models, but not with other disk cache
+            other = MemoryProjectCache().with_disk_cache(ProjectCache(tmp_dir))
+            other.load('Korsar3.cproj', 'Korsar3')
+            self.assertIs(cache.projects, cache.with_disk_cache(None).projects)
+            self.assertEqual(1, len(other.projects))
+
+
+if __name__ == '__main__':
+    unittest.main()
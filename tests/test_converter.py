@@ -1,6 +1,108 @@
+import contextlib
+import io
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
+from unittest.mock import patch
 
 from asninja.converter import *
+from asninja.graph import diff
+from benchmarks.synthetic import write_project
+
+
+FAKE_TOOLCHAIN = os.path.abspath('fake-arm-toolchain')
+
+
+def make_lib_project(tmp_dir):
+    """HelpersInCppK3 project (with dummy sources) in tmp_dir, returns project file name"""
+    prj_dir = os.path.join(tmp_dir, 'HelpersInCppK3')
+    os.makedirs(prj_dir)
+    shutil.copy('HelpersInCppK3.cppproj', prj_dir)
+    asp = AtmelStudioProject('HelpersInCppK3.cppproj', 'HelpersInCppK3')
+    for src_file in asp.src_files():
+        file_name = os.path.join(prj_dir, src_file)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, 'w') as f:
+            f.write('// ' + src_file + '\n')
+    return os.path.join(prj_dir, 'HelpersInCppK3.cppproj')
+
+
+def make_projects(tmp_dir):
+    """Korsar3 and HelpersInCppK3 projects (without sources) in own dirs of tmp_dir, returns Korsar3 project file"""
+    for file_name in ['Korsar3.cproj', 'HelpersInCppK3.cppproj']:
+        prj_dir = os.path.join(tmp_dir, os.path.splitext(file_name)[0])
+        os.makedirs(prj_dir)
+        shutil.copy(file_name, prj_dir)
+    return os.path.join(tmp_dir, 'Korsar3', 'Korsar3.cproj')
+
+
+class TestConvertOptions(unittest.TestCase):
+    def test_cli_args(self):
+        self.assertEqual([], ConvertOptions().cli_args())
+        self.assertEqual(['--compiler_launcher', 'auto'], ConvertOptions(compiler_launcher='auto').cli_args())
+
+    def test_cli_args_conversion(self):
+        self.assertEqual(['--unified', '--no_regen', '--top_ninja', '--cache_dir', os.path.abspath('cache'),
+                          '--streaming'],
+                         ConvertOptions(unified=True, regen=False, top_ninja=True, cache_dir='cache',
+                                        streaming=True).cli_args())
+
+    def test_cli_args_pch(self):
+        self.assertEqual(['--pch', 'auto'], ConvertOptions(pch='auto').cli_args())
+
+    def test_cli_args_unity(self):
+        self.assertEqual(['--unity', '8', '--unity_exclude', 'a/*.c,b.c'],
+                         ConvertOptions(unity=8, unity_exclude=['a/*.c', 'b.c']).cli_args())
+
+    def test_cli_args_pools(self):
+        self.assertEqual(['--compile_pool', 'auto', '--link_pool', '2'],
+                         ConvertOptions(compile_pool='auto', link_pool=2).cli_args())
+
+    def test_pools(self):
+        self.assertEqual({}, ConvertOptions().pools())
+        self.assertEqual({'compile': ('compile_pool', 8), 'ar': ('ar_pool', 1)},
+                         ConvertOptions(compile_pool='8', ar_pool=1).pools())
+        with patch('asninja.helpers.available_memory', return_value=3 * ConvertOptions.COMPILE_JOB_MEMORY + 1):
+            self.assertEqual(3, ConvertOptions(compile_pool='auto').resolved().compile_pool)
+        with patch('asninja.helpers.available_memory', return_value=1):
+            self.assertEqual(1, ConvertOptions(compile_pool='auto').resolved().compile_pool)
+        with patch('asninja.helpers.available_memory', return_value=None):
+            self.assertEqual({}, ConvertOptions(compile_pool='auto').resolved().pools())
+
+    def test_cli_args_distributed(self):
+        self.assertEqual(['--distributed', 'distcc', '--local_preprocess', '--local_pool', '2'],
+                         ConvertOptions(distributed='distcc', local_preprocess=True, local_pool=2).cli_args())
+
+    def test_pools_distributed(self):
+        with patch('os.cpu_count', return_value=2):
+            options = ConvertOptions(distributed='distcc').resolved()
+        self.assertEqual({'compile': ('compile_pool', 8), 'ar': ('local_pool', 2), 'link': ('local_pool', 2),
+                          'local': ('local_pool', 2)}, options.pools())
+        # explicit depths are kept
+        with patch('os.cpu_count', return_value=2):
+            options = ConvertOptions(distributed='distcc', compile_pool='20', link_pool=1, local_pool=3).resolved()
+        self.assertEqual({'compile': ('compile_pool', 20), 'link': ('link_pool', 1), 'ar': ('local_pool', 3),
+                          'local': ('local_pool', 3)}, options.pools())
+        with patch('shutil.which', side_effect=lambda name: '/usr/bin/icecc' if name == 'icecc' else None):
+            self.assertEqual('/usr/bin/icecc', ConvertOptions(distributed='auto').resolved().distributed)
+        with patch('shutil.which', return_value=None):
+            self.assertEqual({}, ConvertOptions(distributed='auto').resolved().pools())
+
+    def test_resolved(self):
+        options = ConvertOptions(compiler_launcher='auto')
+        self.assertEqual('auto', options.compiler_launcher)
+        with patch('shutil.which', side_effect=lambda name: '/usr/bin/sccache' if name == 'sccache' else None):
+            self.assertEqual('/usr/bin/sccache', options.resolved().compiler_launcher)
+        with patch('shutil.which', return_value=None):
+            self.assertIsNone(options.resolved().compiler_launcher)
+
+    def test_launcher_stats_command(self):
+        self.assertIsNone(ConvertOptions().launcher_stats_command())
+        self.assertEqual('/usr/bin/ccache -s', ConvertOptions('/usr/bin/ccache').launcher_stats_command())
+        self.assertEqual('sccache --show-stats', ConvertOptions('sccache').launcher_stats_command())
+        self.assertIsNone(ConvertOptions('distcc').launcher_stats_command())
 
 
 class TestConverter(unittest.TestCase):
@@ -12,6 +114,547 @@ class TestConverter(unittest.TestCase):
     def test_convert(self):
         pass
 
+    def test_regen_command(self):
+        command = Converter.regen_command('Korsar3.cproj', 'Debug', 'Debug', 'Korsar3', ['-mthumb'], [], [],
+                                          custom_toolchain='arm-', options=ConvertOptions(unified=True, top_ninja=True))
+        self.assertIn(os.path.abspath('Korsar3.cproj'), command)
+        self.assertIn('--config Debug', command)
+        self.assertIn('--gcc_toolchain arm-', command)
+        self.assertIn('--unified', command)
+        # regen of config doesn't write top-level build.ninja
+        self.assertNotIn('--top_ninja', command)
+        self.assertNotIn('--add_defs', command)
+
+    def test_project_outdir(self):
+        self.assertEqual(('Debug', '..'), Converter.project_outdir('prj', os.path.join('prj', 'Debug')))
+        self.assertEqual(('Debug', '../..'), Converter.project_outdir('prj', os.path.join('prj', 'Debug', 'App')))
+        self.assertEqual(('out', '..'), Converter.project_outdir('prj', 'out'))
+
+    def test_depfile(self):
+        self.assertEqual('build.ninja:\n', Converter.depfile('build.ninja', []))
+        self.assertEqual('build.ninja: \\\n ../a\\ b.h \\\n ../$$x/c\\#.h\n',
+                         Converter.depfile('build.ninja', ['../a b.h', '..\\$x\\c#.h']))
+
+    def test_select_configs(self):
+        asp = AtmelStudioProject('Korsar3.cproj', 'Korsar3')
+
+        self.assertEqual(['Debug'], Converter.select_configs(asp, 'Debug'))
+        self.assertEqual(['Debug', 'Release'], Converter.select_configs(asp, 'Debug,Release'))
+        self.assertEqual(['Release', 'Debug'], Converter.select_configs(asp, 'all'))
+        self.assertFalse(Converter.is_multi_config('Debug'))
+        self.assertTrue(Converter.is_multi_config('all'))
+        self.assertTrue(Converter.is_multi_config(['Debug', 'Release']))
+
+    def test_convert_multi_config(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            Converter.convert('Korsar3.cproj', 'Release', os.path.join(tmp_dir, 'single', 'Release'), 'Korsar3', [], [],
+                              [], custom_toolchain='arm-', options=ConvertOptions(regen=False))
+            Converter.convert('Korsar3.cproj', 'all', os.path.join(tmp_dir, 'multi'), 'Korsar3', [], [], [],
+                              custom_toolchain='arm-', options=ConvertOptions(regen=False, top_ninja=True))
+
+            with open(os.path.join(tmp_dir, 'single', 'Release', 'build.ninja')) as f:
+                single = f.read()
+            with open(os.path.join(tmp_dir, 'multi', 'Release', 'build.ninja')) as f:
+                self.assertEqual(single, f.read())
+            self.assertTrue(os.path.isfile(os.path.join(tmp_dir, 'multi', 'Debug', 'build.ninja')))
+            with open(os.path.join(tmp_dir, 'multi', 'build.ninja')) as f:
+                content = f.read()
+            self.assertIn('build Debug: phony _Debug', content)
+            self.assertIn('build all: phony Release Debug', content)
+
+    def test_graphs(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            outpath = os.path.join(tmp_dir, 'out')
+            config_graphs = Converter.graphs('Korsar3.cproj', 'all', outpath, 'Korsar3', [], [], [],
+                                             custom_toolchain='arm-', options=ConvertOptions(regen=False))
+            # nothing is written
+            self.assertFalse(os.path.exists(outpath))
+        self.assertEqual(['Release', 'Debug'], [config for config, __, __ in config_graphs])
+        self.assertEqual(os.path.join(outpath, 'Debug'), config_graphs[1][1])
+        release, debug = [graphs['build.ninja'] for __, __, graphs in config_graphs]
+        self.assertEqual(['cc', 'link'], list(debug.rules))
+        self.assertEqual(['$builddir/Korsar3.elf'], debug.defaults)
+        link = debug.producer('$builddir/Korsar3.elf')
+        self.assertEqual('link', link.rule)
+        self.assertIn('$src/src/ASF/sam/utils/linker_scripts/sam4s/sam4s8/gcc/flash.ld', link.implicit)
+        changes = diff(release, debug)
+        self.assertEqual(['ccflags', 'lflags'], changes['variables']['changed'])
+        self.assertEqual([], changes['edges']['added'] + changes['edges']['removed'])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            Converter.convert('Korsar3.cproj', 'Debug', os.path.join(tmp_dir, 'Debug'), 'Korsar3', [], [], [],
+                              custom_toolchain='arm-', options=ConvertOptions(regen=False))
+            with open(os.path.join(tmp_dir, 'Debug', 'build.ninja')) as f:
+                self.assertEqual(debug.to_ninja(), f.read())
+
+    def test_convert_cached(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            Converter.convert('Korsar3.cproj', 'Debug', os.path.join(tmp_dir, 'a', 'Debug'), 'Korsar3', [], [], [],
+                              custom_toolchain='arm-', options=ConvertOptions(regen=False))
+            for __ in range(2):
+                self.assertTrue(Converter.convert('Korsar3.cproj', 'Debug', os.path.join(tmp_dir, 'b', 'Debug'),
+                                                  'Korsar3', [], [], [], custom_toolchain='arm-',
+                                                  options=ConvertOptions(regen=False, cache_dir=cache_dir)))
+                with open(os.path.join(tmp_dir, 'a', 'Debug', 'build.ninja')) as f1, \
+                        open(os.path.join(tmp_dir, 'b', 'Debug', 'build.ninja')) as f2:
+                    self.assertEqual(f1.read(), f2.read())
+                os.remove(os.path.join(tmp_dir, 'b', 'Debug', 'build.ninja'))
+            self.assertEqual(1, len(os.listdir(cache_dir)))
+
+    def test_convert_unified(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            as_prj = make_projects(tmp_dir)
+            outpath = os.path.join(tmp_dir, 'Korsar3', 'Debug')
+
+            self.assertTrue(Converter.convert(as_prj, 'Debug', outpath, 'Korsar3', [], [], [], custom_toolchain='arm-',
+                                              options=ConvertOptions(unified=True)))
+            with open(os.path.join(outpath, 'build.ninja')) as f:
+                content = f.read()
+            self.assertIn('subninja $builddir/HelpersInCppK3.ninja', content)
+            self.assertIn('../../HelpersInCppK3/Debug/libHelpersInCppK3.a', content)
+            self.assertIn('generator = 1', content)
+            self.assertIn('build build.ninja HelpersInCppK3.ninja build.ninja.d: regen ../Korsar3.cproj\n', content)
+            with open(os.path.join(outpath, Converter.REGEN_DEPFILE)) as f:
+                content = f.read()
+            self.assertTrue(content.startswith('build.ninja: \\\n ../../HelpersInCppK3/HelpersInCppK3.cppproj \\\n'))
+            self.assertIn(' ' + Converter.regen_deps()[0].replace('\\', '/') + ' \\\n', content)
+            with open(os.path.join(outpath, 'HelpersInCppK3.ninja')) as f:
+                content = f.read()
+            self.assertIn('builddir = ../../HelpersInCppK3/Debug', content)
+            self.assertIn('build $builddir/libHelpersInCppK3.a: ar', content)
+            self.assertIn('-I"../../Korsar3/src"', content)
+            self.assertNotIn('default', content)
+
+            # same project and arguments - nothing is rewritten
+            self.assertFalse(Converter.convert(as_prj, 'Debug', outpath, 'Korsar3', [], [], [], custom_toolchain='arm-',
+                                               options=ConvertOptions(unified=True)))
+
+            # removed library project makes build.ninja dirty (not an error of missing input)
+            os.remove(os.path.join(tmp_dir, 'HelpersInCppK3', 'HelpersInCppK3.cppproj'))
+            output = subprocess.check_output(['ninja', '-C', outpath, 'build.ninja'], stderr=subprocess.STDOUT)
+            self.assertIn(b'regen build.ninja', output)
+
+    def test_graphs_unified_transitive(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            as_prj = write_project(tmp_dir, 'App', src_count=2, configs=1, ref_libs_depth=2)
+            with contextlib.redirect_stdout(io.StringIO()):
+                config_graphs = Converter.graphs(as_prj, 'Debug', os.path.join(tmp_dir, 'App', 'Debug'), 'App', [],
+                                                 [], [], custom_toolchain='arm-',
+                                                 options=ConvertOptions(unified=True, regen=False))
+        graphs = config_graphs[0][2]
+        self.assertEqual(['$builddir/App_dep2.ninja', '$builddir/App_dep1.ninja'], graphs['build.ninja'].subninjas)
+        # archive of indirectly referenced library is built too
+        link = graphs['build.ninja'].producer('$builddir/App.elf')
+        self.assertEqual(['$builddir/../../App_dep1/Debug/libApp_dep1.a',
+                          '$builddir/../../App_dep2/Debug/libApp_dep2.a'], link.implicit[1:])
+
+    def test_convert_pools(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            as_prj = make_projects(tmp_dir)
+            outpath = os.path.join(tmp_dir, 'Korsar3', 'Debug')
+            Converter.convert(as_prj, 'Debug', outpath, 'Korsar3', [], [], [], custom_toolchain='arm-',
+                              options=ConvertOptions(compile_pool=4, ar_pool=1, link_pool=1, unified=True))
+            with open(os.path.join(outpath, 'build.ninja')) as f:
+                content = f.read()
+            self.assertIn('pool compile_pool\n  depth = 4\npool ar_pool\n  depth = 1\npool link_pool\n  depth = 1\n\n'
+                          'subninja $builddir/HelpersInCppK3.ninja', content)
+            self.assertIn('  depfile = $out.d\n  pool = compile_pool\n', content)
+            self.assertIn('  description = link $out\n  pool = link_pool\n', content)
+            for arg in ['--compile_pool 4', '--ar_pool 1', '--link_pool 1']:
+                self.assertIn(arg, content)
+            # pools are global, library graph only uses them
+            with open(os.path.join(outpath, 'HelpersInCppK3.ninja')) as f:
+                content = f.read()
+            self.assertNotIn('pool compile_pool', content)
+            self.assertIn('  depfile = $out.d\n  pool = compile_pool\n', content)
+            self.assertIn('  description = ar $out\n  pool = ar_pool\n', content)
+
+    def test_thin_archiver_flags(self):
+        self.assertEqual(['-rcsT'], Converter.thin_archiver_flags(['-r']))
+        self.assertEqual(['-rscT', '-v'], Converter.thin_archiver_flags(['-rs', '-v']))
+        self.assertEqual(['-rcsT'], Converter.thin_archiver_flags([]))
+        # ArchiverFlags of project may have several options
+        self.assertEqual(['-rcsT', '-v'], Converter.thin_archiver_flags(['-r -v']))
+        self.assertEqual(['-rcsT', '--plugin', "'a b.so'", '-x'],
+                         Converter.thin_archiver_flags(['-r --plugin "a b.so"', '-x']))
+
+    def test_native_output(self):
+        with patch.object(os, 'name', 'nt'):
+            self.assertIn('"$out_native"', Converter.remove_output_command())
+            self.assertEqual({'out_native': '..\\..\\Lib\\Debug\\libLib.a'},
+                             Converter.native_output('../../Lib/Debug', 'libLib.a'))
+        with patch.object(os, 'name', 'posix'):
+            self.assertIsNone(Converter.native_output('../../Lib/Debug', 'libLib.a'))
+
+    def test_convert_thin_archives(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            as_prj = make_projects(tmp_dir)
+            outpath = os.path.join(tmp_dir, 'Korsar3', 'Debug')
+            Converter.convert(as_prj, 'Debug', outpath, 'Korsar3', [], [], [], custom_toolchain='arm-',
+                              options=ConvertOptions(thin_archives=True, unified=True))
+            with open(os.path.join(outpath, 'HelpersInCppK3.ninja')) as f:
+                content = f.read()
+            self.assertIn('arflags = -rcsT\n', content)
+            self.assertIn('command = ' + Converter.remove_output_command() + 'arm-' + os.sep +
+                          'arm-none-eabi-ar $arflags -o $out $in\n', content)
+            # link still depends on library archive
+            with open(os.path.join(outpath, 'build.ninja')) as f:
+                content = f.read()
+            self.assertIn('../../HelpersInCppK3/Debug/libHelpersInCppK3.a', content)
+            self.assertIn('--thin_archives', content)
+
+    def test_convert_post_link(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            Converter.convert('Korsar3.cproj', 'Debug', tmp_dir, 'Korsar3', [], [], [], custom_toolchain='arm-',
+                              options=ConvertOptions(post_link=['hex', 'bin', 'lss', 'size']))
+            with open(os.path.join(tmp_dir, 'build.ninja')) as f:
+                content = f.read()
+            tool = 'arm-' + os.sep + 'arm-none-eabi-'
+            self.assertIn('command = ' + tool + 'objcopy -O ihex -R .eeprom', content)
+            self.assertIn('command = ' + tool + 'objcopy -O binary $in $out', content)
+            self.assertIn('objdump -h -S $in > $out', content)
+            self.assertIn(' size --tool ' + tool + 'size --output $out $in\n', content)
+            for ext, rule in [('.hex', 'hex'), ('.bin', 'bin'), ('.lss', 'lss'), ('.size.json', 'size')]:
+                self.assertIn('build $builddir/Korsar3{}: {} $builddir/Korsar3.elf\n'.format(ext, rule), content)
+            self.assertIn('default $builddir/Korsar3.elf $builddir/Korsar3.hex $builddir/Korsar3.bin', content)
+            self.assertIn('--post_link hex,bin,lss,size', content)
+
+            # libraries have no post-link outputs
+            Converter.convert('HelpersInCppK3.cppproj', 'Debug', tmp_dir, 'HelpersInCppK3', [], [], [],
+                              custom_toolchain='arm-', options=ConvertOptions(post_link=['hex']))
+            with open(os.path.join(tmp_dir, 'build.ninja')) as f:
+                self.assertNotIn('objcopy', f.read())
+
+    def test_convert_compiler_launcher(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            outpath = os.path.join(tmp_dir, 'Debug')
+            Converter.convert('Korsar3.cproj', 'Debug', outpath, 'Korsar3', [], [], [], custom_toolchain='arm-',
+                              options=ConvertOptions(compiler_launcher='/usr/bin/ccache', regen=False))
+            with open(os.path.join(outpath, 'build.ninja')) as f:
+                content = f.read()
+            self.assertIn('command = /usr/bin/ccache arm-' + os.sep + 'arm-none-eabi-gcc -x c -c', content)
+            self.assertIn('command = arm-' + os.sep + 'arm-none-eabi-gcc -o $out', content)
+            self.assertIn('command = /usr/bin/ccache -s', content)
+            self.assertIn('build launcher_stats: launcher_stats $builddir/Korsar3.elf', content)
+            # statistics are opt-in, default build stays no-op when nothing changed
+            self.assertIn('default $builddir/Korsar3.elf\n', content)
+
+    @unittest.skipUnless(shutil.which('ninja') and not sys.platform.startswith('win'), 'requires ninja and POSIX')
+    def test_build_compiler_launcher(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            as_prj = make_lib_project(tmp_dir)
+            outpath = os.path.join(tmp_dir, 'HelpersInCppK3', 'Debug')
+            launcher = os.path.join(FAKE_TOOLCHAIN, 'fake-launcher')
+            Converter.convert(as_prj, 'Debug', outpath, 'HelpersInCppK3', [], [], [], custom_toolchain=FAKE_TOOLCHAIN,
+                              options=ConvertOptions(compiler_launcher=launcher, regen=False))
+
+            log = os.path.join(tmp_dir, 'launcher.log')
+            subprocess.check_call(['ninja', '-C', outpath], stdout=subprocess.DEVNULL,
+                                  env=dict(os.environ, FAKE_LAUNCHER_LOG=log))
+            self.assertTrue(os.path.isfile(os.path.join(outpath, 'libHelpersInCppK3.a')))
+            with open(log) as f:
+                self.assertEqual(2, len(f.readlines()))
+            # depfiles are read by ninja, so nothing is rebuilt
+            output = subprocess.check_output(['ninja', '-C', outpath, '-n', '-d', 'explain'], stderr=subprocess.STDOUT,
+                                             env=dict(os.environ, FAKE_LAUNCHER_LOG=log))
+            self.assertIn(b'no work to do', output)
+
+    @unittest.skipUnless(shutil.which('ninja') and not sys.platform.startswith('win'), 'requires ninja and POSIX')
+    def test_build_launcher_stats(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            as_prj = make_lib_project(tmp_dir)
+            outpath = os.path.join(tmp_dir, 'HelpersInCppK3', 'Debug')
+            # fake launcher named as ccache, so statistics target is written
+            launcher = os.path.join(tmp_dir, 'ccache')
+            os.symlink(os.path.join(FAKE_TOOLCHAIN, 'fake-launcher'), launcher)
+            Converter.convert(as_prj, 'Debug', outpath, 'HelpersInCppK3', [], [], [], custom_toolchain=FAKE_TOOLCHAIN,
+                              options=ConvertOptions(compiler_launcher=launcher, regen=False))
+
+            subprocess.check_call(['ninja', '-C', outpath], stdout=subprocess.DEVNULL)
+            output = subprocess.check_output(['ninja', '-C', outpath], stderr=subprocess.STDOUT)
+            self.assertIn(b'no work to do', output)
+            output = subprocess.check_output(['ninja', '-C', outpath, 'launcher_stats'], stderr=subprocess.STDOUT)
+            self.assertIn(b'cache hit 0', output)
+
+    def test_convert_distributed(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            outpath = os.path.join(tmp_dir, 'Debug')
+            options = ConvertOptions(distributed='distcc', compile_pool=16, local_pool=2, regen=False)
+            Converter.convert('Korsar3.cproj', 'Debug', outpath, 'Korsar3', [], [], [], custom_toolchain='arm-',
+                              options=options)
+            with open(os.path.join(outpath, 'build.ninja')) as f:
+                content = f.read()
+            self.assertIn('pool compile_pool\n  depth = 16\npool local_pool\n  depth = 2\n\n', content)
+            self.assertIn('command = distcc arm-' + os.sep + 'arm-none-eabi-gcc -x c -c $ccflags', content)
+            self.assertIn('  depfile = $out.d\n  pool = compile_pool\n', content)
+            # link stays local
+            self.assertIn('command = arm-' + os.sep + 'arm-none-eabi-gcc -o $out', content)
+            self.assertIn('  description = link $out\n  pool = local_pool\n', content)
+
+            options = ConvertOptions(distributed='distcc', local_preprocess=True, compile_pool=16, local_pool=2,
+                                     regen=False)
+            Converter.convert('Korsar3.cproj', 'Debug', outpath, 'Korsar3', [], [], [], custom_toolchain='arm-',
+                              options=options)
+            with open(os.path.join(outpath, 'build.ninja')) as f:
+                content = f.read()
+            self.assertIn('command = arm-' + os.sep + 'arm-none-eabi-gcc -x c -E $ccflags -MD', content)
+            self.assertIn('  description = cc_pp $out\n  depfile = $out.d\n  pool = local_pool\n  deps = gcc\n',
+                          content)
+            self.assertIn('command = distcc arm-' + os.sep + 'arm-none-eabi-gcc -x cpp-output -c $remote_ccflags',
+                          content)
+            self.assertIn('build $builddir/src/main.i: cc_pp $src/src/main.c\n', content)
+            self.assertIn('build $builddir/src/main.o: cc $builddir/src/main.i\n', content)
+            remote_ccflags = next(line for line in content.splitlines() if line.startswith('remote_ccflags = '))
+            self.assertNotIn('-I', remote_ccflags)
+            self.assertNotIn('-D', remote_ccflags)
+
+    @unittest.skipUnless(shutil.which('ninja') and not sys.platform.startswith('win'), 'requires ninja and POSIX')
+    def test_build_distributed(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            as_prj = make_lib_project(tmp_dir)
+            outpath = os.path.join(tmp_dir, 'HelpersInCppK3', 'Debug')
+            distcc = os.path.join(FAKE_TOOLCHAIN, 'fake-distcc')
+            Converter.convert(as_prj, 'Debug', outpath, 'HelpersInCppK3', [], [], [], custom_toolchain=FAKE_TOOLCHAIN,
+                              options=ConvertOptions(distributed=distcc, local_preprocess=True, regen=False))
+
+            log = os.path.join(tmp_dir, 'distcc.log')
+            env = dict(os.environ, FAKE_DISTCC_LOG=log)
+            subprocess.check_call(['ninja', '-C', outpath], stdout=subprocess.DEVNULL, env=env)
+            self.assertTrue(os.path.isfile(os.path.join(outpath, 'libHelpersInCppK3.a')))
+            with open(log) as f:
+                lines = f.readlines()
+            self.assertEqual(2, len(lines))
+            self.assertTrue(all(line.rstrip().endswith('.ii') for line in lines))
+            # depfiles of local preprocessing are read by ninja, so nothing is rebuilt
+            output = subprocess.check_output(['ninja', '-C', outpath, '-n', '-d', 'explain'], stderr=subprocess.STDOUT,
+                                             env=env)
+            self.assertIn(b'no work to do', output)
+
+    def test_convert_optimize_includes(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            prj_dir = os.path.join(tmp_dir, 'Korsar3')
+            os.makedirs(os.path.join(prj_dir, 'src', 'config'))
+            shutil.copy('Korsar3.cproj', prj_dir)
+            src_files = [src_file for src_file in AtmelStudioProject('Korsar3.cproj', 'Korsar3').src_files()
+                         if src_file.endswith('.c')]
+            for src_file in src_files:
+                os.makedirs(os.path.join(prj_dir, os.path.dirname(src_file)), exist_ok=True)
+                with open(os.path.join(prj_dir, src_file), 'w') as f:
+                    f.write('#include "conf_board.h"\n#include <stdint.h>\n' if src_file == 'src/main.c' else '')
+            with open(os.path.join(prj_dir, 'src', 'config', 'conf_board.h'), 'w') as f:
+                f.write('')
+            outpath = os.path.join(prj_dir, 'Debug')
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                Converter.convert(os.path.join(prj_dir, 'Korsar3.cproj'), 'Debug', outpath, 'Korsar3', [], [], [],
+                                  custom_toolchain='arm-', options=ConvertOptions(optimize_includes=True))
+            self.assertIn('include paths of Korsar3.elf (.c): 47 -> 1 dirs (0 duplicate, 46 unused), probes 51 -> 3',
+                          out.getvalue())
+            with open(os.path.join(outpath, 'build.ninja')) as f:
+                content = f.read()
+            self.assertIn('-DDEBUG -D_ASSERT_ENABLE_ -I"../src/config" -O0', content)
+            self.assertIn('--optimize_includes', content)
+            # optimized flags depend on scanned sources, headers and include dirs
+            with open(os.path.join(outpath, Converter.REGEN_DEPFILE)) as f:
+                deps = f.read().split(' \\\n ')
+            self.assertIn('../src/config/conf_board.h', deps)
+            self.assertIn('../src/main.c', deps)
+            self.assertIn('../src/config', deps)
+
+            # missing source may include anything, so include paths are kept
+            os.remove(os.path.join(prj_dir, src_files[0]))
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                Converter.convert(os.path.join(prj_dir, 'Korsar3.cproj'), 'Debug', outpath, 'Korsar3', [], [], [],
+                                  custom_toolchain='arm-', options=ConvertOptions(optimize_includes=True))
+            self.assertIn("include paths of Korsar3.elf (.c) are not optimized, 1 scanned files can't be read",
+                          out.getvalue())
+            with open(os.path.join(outpath, 'build.ninja')) as f:
+                content = f.read()
+            content = content.replace(' $\n    ', ' ')
+            self.assertEqual(47, content.split('ccflags = ')[1].split('\n')[0].count('-I'))
+            with open(os.path.join(outpath, Converter.REGEN_DEPFILE)) as f:
+                deps = f.read().split(' \\\n ')
+            self.assertNotIn('../' + src_files[0], deps)
+            self.assertIn('../src/main.c', deps)
+
+            # removed scanned header makes build.ninja dirty (not an error of missing input)
+            os.remove(os.path.join(prj_dir, 'src', 'config', 'conf_board.h'))
+            output = subprocess.check_output(['ninja', '-C', outpath, '-d', 'explain', 'build.ninja'],
+                                             stderr=subprocess.STDOUT)
+            self.assertIn(b'regen build.ninja', output)
+
+    def test_detect_pch_header(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            as_prj = make_lib_project(tmp_dir)
+            asp = AtmelStudioProject(as_prj, 'HelpersInCppK3')
+            prj_dir = os.path.dirname(as_prj)
+            self.assertIsNone(Converter.detect_pch_header(asp, prj_dir))
+
+            for src_file in asp.src_files():
+                with open(os.path.join(prj_dir, src_file), 'w') as f:
+                    f.write('// comment\n#include <asf.h>\n#include "other.h"\n')
+            self.assertEqual('asf.h', Converter.detect_pch_header(asp, prj_dir))
+
+            # quoted header next to sources is included by wrapper in builddir relative to it
+            for src_file in asp.src_files():
+                with open(os.path.join(prj_dir, src_file), 'w') as f:
+                    f.write('#include "pch.h"\n')
+            self.assertEqual('pch.h', Converter.detect_pch_header(asp, prj_dir))
+            with open(os.path.join(tmp_dir, 'Shared', 'HelpersInCpp', 'pch.h'), 'w'):
+                pass
+            header = Converter.detect_pch_header(asp, prj_dir)
+            self.assertEqual('../../Shared/HelpersInCpp/pch.h', header)
+            self.assertTrue(os.path.isfile(os.path.normpath(os.path.join(prj_dir, 'Debug', header))))
+
+    def test_convert_pch(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            as_prj = make_lib_project(tmp_dir)
+            outpath = os.path.join(tmp_dir, 'HelpersInCppK3', 'Debug')
+            Converter.convert(as_prj, 'Debug', outpath, 'HelpersInCppK3', [], [], [], custom_toolchain='arm-',
+                              options=ConvertOptions(pch='asf.h', regen=False))
+            with open(os.path.join(outpath, Converter.PCH_WRAPPER)) as f:
+                self.assertEqual('#include "asf.h"\n', f.read())
+            with open(os.path.join(outpath, 'build.ninja')) as f:
+                content = f.read()
+            self.assertIn('command = arm-' + os.sep + 'arm-none-eabi-g++ -x c++-header -c $cxxflags', content)
+            self.assertIn('build $builddir/asninja_pch.h.gch: pch $builddir/asninja_pch.h', content)
+            self.assertIn('build $builddir/Shared/HelpersInCpp/CursorPosCalc.o: cxx '
+                          '$src/../Shared/HelpersInCpp/CursorPosCalc.cpp | $\n    $builddir/asninja_pch.h.gch\n'
+                          '  cxxflags = -include $builddir/asninja_pch.h $cxxflags\n', content)
+
+            # no pch for C projects
+            for pch in [None, 'asf.h']:
+                Converter.convert('Korsar3.cproj', 'Debug', os.path.join(tmp_dir, str(pch)), 'Korsar3', [], [], [],
+                                  custom_toolchain='arm-', options=ConvertOptions(pch=pch, regen=False))
+            with open(os.path.join(tmp_dir, 'None', 'build.ninja')) as f1, \
+                    open(os.path.join(tmp_dir, 'asf.h', 'build.ninja')) as f2:
+                self.assertEqual(f1.read().replace('None', 'asf.h'), f2.read())
+
+    def test_unity_batches(self):
+        asp = AtmelStudioProject('Korsar3.cproj', 'Korsar3')
+        self.assertEqual([], Converter.unity_batches(asp, ConvertOptions()))
+
+        batches = Converter.unity_batches(asp, ConvertOptions(unity='dir'))
+        for name, src_files in batches:
+            self.assertTrue(name.startswith(Converter.UNITY_DIR + '/unity_'))
+            self.assertGreater(len(src_files), 1)
+            self.assertEqual(1, len(set(os.path.dirname(src_file) for src_file in src_files)))
+        self.assertEqual(len(batches), len(set(name for name, __ in batches)))
+
+        batches = Converter.unity_batches(asp, ConvertOptions(unity=4, unity_exclude=['*/services/*']))
+        c_files = [src_file for src_file in asp.src_files()
+                   if src_file.endswith('.c') and '/services/' not in src_file]
+        self.assertEqual(c_files, [src_file for __, src_files in batches for src_file in src_files][:len(c_files)])
+        for name, src_files in batches:
+            self.assertTrue(name.endswith('.c'))
+            self.assertLessEqual(len(src_files), 4)
+
+    def test_convert_unity(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            as_prj = make_lib_project(tmp_dir)
+            outpath = os.path.join(tmp_dir, 'HelpersInCppK3', 'Debug')
+            options = ConvertOptions(unity=2, regen=False)
+            Converter.convert(as_prj, 'Debug', outpath, 'HelpersInCppK3', [], [], [], custom_toolchain='arm-',
+                              options=options)
+            unity_file = os.path.join(outpath, Converter.UNITY_DIR, 'unity_0.cpp')
+            with open(unity_file) as f:
+                self.assertEqual('#include "../../../Shared/HelpersInCpp/CursorPosCalc.cpp"\n'
+                                 '#include "../../../Shared/HelpersInCpp/OptSignalGraphic.cpp"\n', f.read())
+            with open(os.path.join(outpath, 'build.ninja')) as f:
+                content = f.read()
+            self.assertIn('build $builddir/asninja_unity/unity_0.o: cxx $builddir/asninja_unity/unity_0.cpp\n',
+                          content)
+            self.assertNotIn('CursorPosCalc.o', content)
+            self.assertIn('build $builddir/libHelpersInCppK3.a: ar $builddir/asninja_unity/unity_0.o\n', content)
+
+            # unchanged membership keeps unity source
+            os.utime(unity_file, (0, 0))
+            Converter.convert(as_prj, 'Debug', outpath, 'HelpersInCppK3', [], [], [], custom_toolchain='arm-',
+                              options=options)
+            self.assertEqual(0, os.path.getmtime(unity_file))
+
+            # excluded sources are compiled as is
+            options.unity_exclude = ['*/OptSignalGraphic.cpp']
+            Converter.convert(as_prj, 'Debug', outpath, 'HelpersInCppK3', [], [], [], custom_toolchain='arm-',
+                              options=options)
+            with open(os.path.join(outpath, 'build.ninja')) as f:
+                content = f.read()
+            self.assertNotIn('unity_0', content)
+            self.assertIn('build $builddir/Shared/HelpersInCpp/CursorPosCalc.o: cxx '
+                          '$src/../Shared/HelpersInCpp/CursorPosCalc.cpp\n', content)
+
+    def test_convert_timings(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            timings = PhaseTimings()
+            Converter.convert('Korsar3.cproj', 'Debug', tmp_dir, 'Korsar3', [], [], [], custom_toolchain='arm-',
+                              options=ConvertOptions(timings=timings))
+            self.assertEqual(['parse', 'toolchain', 'sources', 'flags', 'graph', 'render', 'output'],
+                             list(timings.phases))
+            for entry in timings.phases.values():
+                self.assertEqual(1, entry['calls'])
+                self.assertGreaterEqual(entry['time'], 0)
+
+    def test_solution_tasks(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sln = os.path.join(tmp_dir, 'a.atsln')
+            projects = [('App', 'app/app.cproj'), ('Lib', 'lib/lib.cppproj'), ('Lib2', 'lib/lib.cproj')]
+            with open(sln, 'w') as f:
+                for name, file_name in projects:
+                    f.write('Project("{{X}}") = "{}", "{}", "{{Y}}"\nEndProject\n'.format(name, file_name))
+            self.assertRaises(Exception, lambda: Converter.solution_tasks(sln, 'Debug', None, [], [], []))
+
+            projects[2] = ('Lib2', 'lib/lib2.cproj')
+            with open(sln, 'w') as f:
+                for name, file_name in projects:
+                    f.write('Project("{{X}}") = "{}", "{}", "{{Y}}"\nEndProject\n'.format(name, file_name))
+            tasks = Converter.solution_tasks(sln, 'Debug', None, [], [], [])
+            # output is named after project file, projects in same dir get subdirs
+            self.assertEqual([('App', 'app', os.path.join(tmp_dir, 'app', 'Debug')),
+                              ('Lib', 'lib', os.path.join(tmp_dir, 'lib', 'Debug', 'lib')),
+                              ('Lib2', 'lib2', os.path.join(tmp_dir, 'lib', 'Debug', 'lib2'))],
+                             [(name, kwargs['output'], kwargs['outpath']) for name, kwargs in tasks])
+
+    def test_convert_solution(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for file_name in ['Korsar3.atsln', 'Korsar3.cproj', 'HelpersInCppK3.cppproj']:
+                shutil.copy(file_name, tmp_dir)
+
+            timings = PhaseTimings()
+            results = Converter.convert_solution(os.path.join(tmp_dir, 'Korsar3.atsln'), 'Debug', None, [], [], [],
+                                                 custom_toolchain='arm-', jobs=2,
+                                                 options=ConvertOptions(timings=timings))
+            # timings of worker processes are merged
+            self.assertEqual(2, timings.phases['parse']['calls'])
+            self.assertEqual(['Korsar3', 'HelpersInCppK3'], [name for name, __, __, __ in results])
+            for __, __, changed, error in results:
+                self.assertTrue(changed)
+                self.assertIsNone(error)
+            # projects are in same dir, so each one gets own subdir of Debug
+            self.assertFalse(os.path.isfile(os.path.join(tmp_dir, 'Debug', 'build.ninja')))
+            for name, output in [('Korsar3', 'Korsar3.elf'), ('HelpersInCppK3', 'libHelpersInCppK3.a')]:
+                with open(os.path.join(tmp_dir, 'Debug', name, 'build.ninja')) as f:
+                    content = f.read().replace(' $\n    ', ' ')
+                self.assertIn('build $builddir/{}: '.format(output), content)
+                # sources and paths of flags stay relative to project dir
+                self.assertIn('src = $builddir/../..\n', content)
+            with open(os.path.join(tmp_dir, 'Debug', 'Korsar3', 'build.ninja')) as f:
+                content = f.read().replace(' $\n    ', ' ')
+            self.assertIn('build $builddir/src/main.o: cc $src/src/main.c\n', content)
+            self.assertIn(' -I"../../src" ', content)
+            self.assertIn(' -L"../../../HelpersInCppK3/Debug" ', content)
+            self.assertIn(' -T../../src/ASF/sam/utils/linker_scripts/sam4s/sam4s8/gcc/flash.ld', content)
+            self.assertIn(' | $src/src/ASF/sam/utils/linker_scripts/sam4s/sam4s8/gcc/flash.ld ', content)
+            self.assertIn(' $builddir/../../../HelpersInCppK3/Debug/libHelpersInCppK3.a', content)
+            with open(os.path.join(tmp_dir, 'Debug', 'HelpersInCppK3', 'build.ninja')) as f:
+                self.assertIn(' -I"../../../Korsar3/src" ', f.read().replace(' $\n    ', ' '))
+
+            results = Converter.convert_solution(os.path.join(tmp_dir, 'Korsar3.atsln'), 'NonExists', None, [], [], [],
+                                                 custom_toolchain='arm-', jobs=2)
+            for __, __, __, error in results:
+                self.assertIsNotNone(error)
+
 
 if __name__ == '__main__':
     unittest.main()
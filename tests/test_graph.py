@@ -0,0 +1,63 @@
+import io
+import unittest
+
+import ninja_syntax
+
+from asninja.graph import *
+
+
+def build(graph):
+    graph.variable('ninja_required_version', '1.3')
+    graph.newline()
+    graph.pool('link_pool', 1)
+    graph.variable('ccflags', ['-O2', '', '-Wall'])
+    graph.variable('unset', None)
+    graph.rule('cc', command='gcc $ccflags -c $in -o $out', description='cc $out', depfile='$out.d', deps='gcc')
+    graph.rule('link', command='gcc -o $out @$out.rsp', rspfile='$out.rsp', rspfile_content='$in', pool='link_pool')
+    graph.comment('objects')
+    objs = graph.build('a.o', 'cc', 'a c.c', variables={'ccflags': '-O0'})
+    objs += graph.build('b.o', 'cc', 'b.c', implicit='b.h', order_only=['gen'])
+    elf = graph.build('app.elf', 'link', objs, implicit_outputs='app.map')
+    graph.default(elf)
+
+
+class TestBuildGraph(unittest.TestCase):
+    def setUp(self):
+        self.graph = BuildGraph()
+        build(self.graph)
+
+    def test_model(self):
+        self.assertEqual({'ninja_required_version': '1.3', 'ccflags': ['-O2', '', '-Wall']}, self.graph.variables)
+        self.assertEqual({'link_pool': 1}, self.graph.pools)
+        self.assertEqual(['cc', 'link'], list(self.graph.rules))
+        self.assertEqual('link_pool', self.graph.rules['link'].pool)
+        self.assertEqual(3, len(self.graph.edges))
+        self.assertEqual(['a.o', 'b.o'], self.graph.edges[2].inputs)
+        self.assertEqual({'ccflags': '-O0'}, self.graph.edges[0].variables)
+        self.assertEqual(['gen'], self.graph.producer('b.o').order_only)
+        self.assertIs(self.graph.edges[2], self.graph.producer('app.map'))
+        self.assertIsNone(self.graph.producer('c.o'))
+        self.assertEqual(['app.elf'], self.graph.defaults)
+
+    def test_write(self):
+        f = io.StringIO()
+        build(ninja_syntax.Writer(f, 120))
+        self.assertEqual(f.getvalue(), self.graph.to_ninja())
+
+    def test_diff(self):
+        other = BuildGraph()
+        build(other)
+        self.assertEqual(self.graph, other)
+        other.variable('ccflags', '-O3')
+        other.build('c.o', 'cc', 'c.c')
+        other.rule('cc', command='clang -c $in -o $out')
+        self.assertNotEqual(self.graph, other)
+        changes = diff(self.graph, other)
+        self.assertEqual({'added': [], 'removed': [], 'changed': ['ccflags']}, changes['variables'])
+        self.assertEqual(['cc'], changes['rules']['changed'])
+        self.assertEqual({'added': ['c.o'], 'removed': [], 'changed': []}, changes['edges'])
+        self.assertFalse(changes['defaults_changed'])
+
+
+if __name__ == '__main__':
+    unittest.main()
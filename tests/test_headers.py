@@ -0,0 +1,173 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from asninja.converter import Converter, ConvertOptions
+from asninja.headers import *
+from asninja.report import NinjaGraph
+
+
+def write_deps(file_name, records):
+    """Writes .ninja_deps (v4) with (output, [inputs]) records"""
+    ids = {}
+
+    def path_record(path):
+        ids[path] = len(ids)
+        data = path.encode('utf-8')
+        data += b'\0' * (-len(data) % 4)
+        return struct.pack('<I', len(data) + 4) + data + struct.pack('<I', ~ids[path] & 0xffffffff)
+
+    with open(file_name, 'wb') as f:
+        f.write(b'# ninjadeps\n' + struct.pack('<i', 4))
+        for output, inputs in records:
+            for path in [output] + inputs:
+                if path not in ids:
+                    f.write(path_record(path))
+            f.write(struct.pack('<IiII', (12 + 4 * len(inputs)) | 0x80000000, ids[output], 0, 0))
+            f.write(struct.pack('<{}i'.format(len(inputs)), *[ids[path] for path in inputs]))
+
+
+def write_files(base_dir, files):
+    for name, content in files.items():
+        file_name = os.path.join(base_dir, name)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, 'w') as f:
+            f.write(content)
+
+
+class TestNinjaDeps(unittest.TestCase):
+    def test_read(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, '.ninja_deps')
+            write_deps(file_name, [('a.o', ['../a.c', '../a.h']),
+                                   ('b.o', ['../b.c', '../a.h']),
+                                   ('a.o', ['../a.c', '../a.h', '../c.h'])])
+            deps = NinjaDeps(file_name)
+        self.assertEqual({'a.o': ['../a.c', '../a.h', '../c.h'], 'b.o': ['../b.c', '../a.h']}, deps.deps)
+
+    @unittest.skipUnless(shutil.which('ninja') and not sys.platform.startswith('win'), 'requires ninja and POSIX')
+    def test_read_ninja(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_files(tmp_dir, {'a.c': '', 'a.h': '',
+                                  'build.ninja': 'rule cc\n'
+                                                 '  command = touch $out && echo "$out: $in a.h" > $out.d\n'
+                                                 '  depfile = $out.d\n'
+                                                 '  deps = gcc\n'
+                                                 'build a.o: cc a.c\n'})
+            subprocess.check_call(['ninja', '-C', tmp_dir], stdout=subprocess.DEVNULL)
+            deps = NinjaDeps(os.path.join(tmp_dir, '.ninja_deps'))
+        self.assertEqual({'a.o': ['a.c', 'a.h']}, deps.deps)
+
+
+class TestIncludeScanner(unittest.TestCase):
+    def test_headers(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_files(tmp_dir, {'src/a.c': '#include "a.h"\n  #  include <common.h>\n#include <stdint.h>\n',
+                                  'src/a.h': '// #include "b.h" is not seen\n',
+                                  'inc/common.h': '#include "b.h"\n#include MACRO\n',
+                                  'inc/b.h': '#include "common.h"\n',
+                                  'inc/a.h': ''})
+            scanner = IncludeScanner([os.path.join(tmp_dir, 'inc')])
+            headers = scanner.headers(os.path.join(tmp_dir, 'src', 'a.c'))
+            # quoted include is found next to includer first
+            self.assertEqual([os.path.join(tmp_dir, 'src', 'a.h'), os.path.join(tmp_dir, 'inc', 'common.h'),
+                              os.path.join(tmp_dir, 'inc', 'b.h')], headers)
+
+    def test_include_dirs(self):
+        self.assertEqual([os.path.join('out', '../src'), os.path.join('out', '/abs')],
+                         include_dirs(['-DX', '-I"../src"', '-O2', '-I/abs'], 'out'))
+
+
+class TestHeaders(unittest.TestCase):
+    def test_rank(self):
+        index = {'a.h': {'a.c', 'b.c'}, 'b.h': {'b.c'}, 'c.h': {'c.c'}}
+        self.assertEqual([('a.h', 2, 2.0), ('b.h', 1, 1.0), ('c.h', 1, 1.0)], rank(index))
+        self.assertEqual([('c.h', 1, 5.0), ('a.h', 2, 1.5), ('b.h', 1, 1.0)],
+                         rank(index, {'a.c': 0.5, 'b.c': 1.0, 'c.c': 5.0}))
+
+    def test_deps_index(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            build_dir = os.path.join(tmp_dir, 'Debug')
+            write_files(build_dir, {'build.ninja': 'builddir = .\n'
+                                                   'src = $builddir/..\n'
+                                                   'build $builddir/src/a.o: cc $src/src/a.c\n'
+                                                   'build $builddir/src/b.o: cc $src/src/b.c\n'
+                                                   'build $builddir/app.elf: link $builddir/src/a.o '
+                                                   '$builddir/src/b.o\n'})
+            write_deps(os.path.join(build_dir, '.ninja_deps'),
+                       [('src/a.o', ['../src/a.c', '../src/a.h', '../inc/common.h', '/usr/include/stdint.h']),
+                        ('src/b.o', ['../src/b.c', '../inc/common.h'])])
+            graph = NinjaGraph(os.path.join(build_dir, 'build.ninja'))
+            deps = NinjaDeps(os.path.join(build_dir, '.ninja_deps'))
+            self.assertEqual({'src/a.h': {'src/a.c'}, 'inc/common.h': {'src/a.c', 'src/b.c'}},
+                             dict(deps_index(graph, deps)))
+            self.assertEqual({'src/a.c'}, deps_index(graph, deps, system=True)['/usr/include/stdint.h'])
+
+            with open(os.path.join(build_dir, '.ninja_log'), 'w') as f:
+                f.write('# ninja log v5\n0\t3000\t0\tsrc/a.o\t0\n0\t500\t0\tsrc/b.o\t0\n')
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                self.assertEqual(0, main(['--builddir', build_dir]))
+            self.assertEqual(['     3.500s      2  inc/common.h', '     3.000s      1  src/a.h'],
+                             out.getvalue().splitlines()[1:])
+
+    def test_main_scan(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            prj_dir = os.path.join(tmp_dir, 'Korsar3')
+            os.makedirs(prj_dir)
+            shutil.copy('Korsar3.cproj', prj_dir)
+            # other sources of project are missing, they include nothing
+            write_files(prj_dir, {'src/main.c': '#include <asf.h>\n#include "conf_board.h"\n',
+                                  'src/asf.h': '#include <conf_board.h>\n',
+                                  'src/config/conf_board.h': ''})
+            out = io.StringIO()
+            err = io.StringIO()
+            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+                self.assertEqual(0, main(['--prj', os.path.join(prj_dir, 'Korsar3.cproj'), '--json',
+                                          '--builddir', os.path.join(prj_dir, 'Debug')]))
+            self.assertIn("files can't be read (scanned as without includes)", err.getvalue())
+            data = json.loads(out.getvalue())
+            self.assertFalse(data['timed'])
+            self.assertEqual([{'header': 'src/asf.h', 'units': 1, 'weight': 1.0},
+                              {'header': 'src/config/conf_board.h', 'units': 1, 'weight': 1.0}], data['headers'])
+
+    def test_main_scan_unity(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            prj_dir = os.path.join(tmp_dir, 'Korsar3')
+            os.makedirs(prj_dir)
+            shutil.copy('Korsar3.cproj', prj_dir)
+            write_files(prj_dir, {'src/main.c': '#include "conf_board.h"\n', 'src/config/conf_board.h': ''})
+            as_prj = os.path.join(prj_dir, 'Korsar3.cproj')
+            build_dir = os.path.join(prj_dir, 'Debug')
+            options = ConvertOptions(unity='8', regen=False)
+            with contextlib.redirect_stdout(io.StringIO()):
+                Converter.convert(as_prj, 'Debug', build_dir, 'Korsar3', [], [], [], custom_toolchain='arm-',
+                                  options=options)
+            asp = AtmelStudioProject(as_prj, 'Korsar3')
+            asp.select_config('Debug')
+            name, src_files = [batch for batch in Converter.unity_batches(asp, options) if 'src/main.c' in batch[1]][0]
+            with open(os.path.join(build_dir, '.ninja_log'), 'w') as f:
+                f.write('# ninja log v5\n0\t{}\t0\t{}\t0\n'.format(1000 * len(src_files), name[:-2] + '.o'))
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(io.StringIO()):
+                self.assertEqual(0, main(['--prj', as_prj, '--json', '--builddir', build_dir, '--unity', '8']))
+            # compile time of unity source is split across its sources
+            self.assertEqual([{'header': 'src/config/conf_board.h', 'units': 1, 'weight': 1.0}],
+                             json.loads(out.getvalue())['headers'])
+
+    def test_main_no_deps(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with contextlib.redirect_stderr(io.StringIO()):
+                with self.assertRaises(SystemExit):
+                    main(['--builddir', tmp_dir])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import tempfile
 import unittest
 
 from asninja.helpers import *
@@ -8,11 +9,44 @@ class TestHelpers(unittest.TestCase):
         self.assertEqual(['a', 'c'], strip_empty_symbols(['a', '', 'c']))
         self.assertEqual([], strip_empty_symbols([]))
 
+    def test_quote_command(self):
+        self.assertEqual('a b', quote_command(['a', 'b']))
+        if os.name == 'nt':
+            self.assertEqual('a "b c"', quote_command(['a', 'b c']))
+        else:
+            self.assertEqual("a 'b c'", quote_command(['a', 'b c']))
+
+    def test_rebase_include_paths(self):
+        self.assertEqual(['-I"../../Lib/src"', '-I"/abs"', '-I"C:\\abs"', '-DX'],
+                         rebase_include_paths(['-I"../src"', '-I"/abs"', '-I"C:\\abs"', '-DX'], '../../Lib/Debug'))
+
+    def test_rebase_linker_paths(self):
+        self.assertEqual(['-L"../../Lib/Debug"', '-L"/abs"', '-Wl,--gc-sections',
+                          '-T../../src/flash.ld -Wl,--cref', '-Wl,-Map="App.map"'],
+                         rebase_linker_paths(['-L"../Lib/Debug"', '-L"/abs"', '-Wl,--gc-sections',
+                                              '-T../src/flash.ld -Wl,--cref', '-Wl,-Map="App.map"'], '../../Debug'))
+
+    def test_strip_preprocessor_flags(self):
+        self.assertEqual(['-O2', '-std=gnu99 -Wall', '-g3'],
+                         strip_preprocessor_flags(['-DX', '-I"../a b"', '-O2', '-UY', '-std=gnu99 -include x.h -Wall',
+                                                   '-DA="1 2" -g3', '-isystem /usr/include']))
+        self.assertEqual(['-mthumb', ''], strip_preprocessor_flags(['-mthumb', '']))
+
     def test_strip_updir(self):
         self.assertEqual('Path', strip_updir('../../Path'))
         self.assertEqual('Path', strip_updir('Path'))
         self.assertEqual('ath', strip_updir('..Path'))
 
+    def test_write_if_changed(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, 'build.ninja')
+            self.assertTrue(write_if_changed(file_name, 'a'))
+            self.assertFalse(write_if_changed(file_name, 'a'))
+            self.assertTrue(write_if_changed(file_name, 'b'))
+            with open(file_name) as f:
+                self.assertEqual('b', f.read())
+            self.assertEqual(['build.ninja'], os.listdir(tmp_dir))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+
+from asninja.include_paths import *
+
+
+def write_files(base_dir, files):
+    for name, content in files.items():
+        file_name = os.path.join(base_dir, name)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, 'w') as f:
+            f.write(content)
+
+
+class TestIncludePathOptimizer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.prj_dir = self.tmp_dir.name
+        write_files(self.prj_dir, {'src/a.c': '#include <common.h>\n#include <b.h>\n#include <stdint.h>\n',
+                                   'src/b.c': '#include <b.h>\n#include "local.h"\n',
+                                   'src/local.h': '',
+                                   'lib1/common.h': '#include "lib1.h"\n',
+                                   'lib1/lib1.h': '',
+                                   'lib2/b.h': '',
+                                   'lib2/common.h': '',
+                                   'unused/x.h': ''})
+        self.src_files = [os.path.join(self.prj_dir, 'src', name) for name in ['a.c', 'b.c']]
+        self.base_dir = os.path.join(self.prj_dir, 'Debug')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_optimize(self):
+        optimizer = IncludePathOptimizer(['../unused', '../lib1', '../lib2', '../Debug/../lib1', '../missing'],
+                                         self.base_dir)
+        dirs, report = optimizer.optimize(self.src_files)
+        # lib2 is used more, but common.h of lib1 must stay first
+        self.assertEqual(['../lib1', '../lib2'], dirs)
+        self.assertEqual(IncludePathReport(dirs_before=5, dirs_after=2, duplicates=1, unused=2, probes_before=14,
+                                           probes_after=9, refused=False, unreadable=0), report)
+
+    def test_unreadable(self):
+        # includes of missing source are unknown, so dirs are kept (only duplicates are dropped)
+        optimizer = IncludePathOptimizer(['../unused', '../lib1', '../lib1'], self.base_dir)
+        dirs, report = optimizer.optimize(self.src_files + [os.path.join(self.prj_dir, 'src', 'missing.c')])
+        self.assertEqual(['../unused', '../lib1'], dirs)
+        self.assertEqual((True, 1, 0), (report.refused, report.unreadable, report.unused))
+        self.assertEqual([os.path.join(self.prj_dir, 'src', 'missing.c')], optimizer.unreadable)
+
+    def test_reorder(self):
+        optimizer = IncludePathOptimizer(['../lib1', '../unused', '../lib2'], self.base_dir)
+        dirs, report = optimizer.optimize(self.src_files[1:])
+        self.assertEqual(['../lib2'], dirs)
+
+        # b.h is used by both sources, common.h by one
+        os.remove(os.path.join(self.prj_dir, 'lib2', 'common.h'))
+        dirs, report = IncludePathOptimizer(['../lib1', '../lib2'], self.base_dir).optimize(self.src_files)
+        self.assertEqual(['../lib2', '../lib1'], dirs)
+        self.assertLess(report.probes_after, report.probes_before)
+
+    def test_resolution(self):
+        optimizer = IncludePathOptimizer(['../lib1', '../lib2'], self.base_dir)
+        lookups = optimizer.lookups(self.src_files)
+        self.assertEqual({(None, False, 'common.h'): 1, (None, False, 'b.h'): 2, (None, False, 'stdint.h'): 1,
+                          (os.path.join(self.prj_dir, 'lib1'), True, 'lib1.h'): 1,
+                          (os.path.join(self.prj_dir, 'src'), True, 'local.h'): 1}, dict(lookups))
+        self.assertNotEqual(optimizer.resolution(['../lib1', '../lib2'], lookups),
+                            optimizer.resolution(['../lib2', '../lib1'], lookups))
+
+    def test_optimize_include_flags(self):
+        flags = ['-DX', '-I"../unused"', '-I"../lib2"', '-I"../lib1"', '-O0', '-std=gnu99 -I../unused']
+        new_flags, report = optimize_include_flags(flags, self.src_files, self.base_dir)
+        # common.h is found in lib2 first, so lib1 isn't used
+        self.assertEqual(['-DX', '-I"../lib2"', '-O0', '-std=gnu99 -I../unused'], new_flags)
+        self.assertEqual(2, report.unused)
+        scanned_files = []
+        optimize_include_flags(flags, self.src_files, self.base_dir, scanned_files)
+        # include dirs (dropped ones too) are scanned for headers
+        self.assertEqual(sorted(self.src_files + [os.path.join(self.prj_dir, 'lib2', name)
+                                                  for name in ['b.h', 'common.h']] +
+                                [os.path.join(self.prj_dir, 'src', 'local.h')] +
+                                [os.path.join(self.prj_dir, name) for name in ['unused', 'lib2', 'lib1']]),
+                         sorted(scanned_files))
+        self.assertEqual((flags, None), optimize_include_flags(flags, [], self.base_dir))
+        self.assertEqual((['-DX'], None), optimize_include_flags(['-DX'], self.src_files, self.base_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from asninja.map_report import *
+from asninja.parser import AtmelStudioProject
+
+HELPERS_OBJ = '../../HelpersInCppK3/Debug/libHelpersInCppK3.a(CursorPosCalc.o)'
+
+
+class TestLinkerMap(unittest.TestCase):
+    def setUp(self):
+        self.lm = LinkerMap('Korsar3.map')
+
+    def test_regions(self):
+        self.assertEqual({'rom': (0x400000, 0x80000, 'flash'), 'ram': (0x20000000, 0x20000, 'ram')},
+                         dict(self.lm.regions))
+
+    def test_totals(self):
+        # .relocate is in ram and loaded from rom, debug sections are skipped
+        self.assertEqual({'flash': 0x200 + 0x10, 'ram': 0x10 + 0x430}, self.lm.totals)
+
+    def test_objects(self):
+        self.assertEqual({'flash': 0x40 + 0x4, 'ram': 0x4 + 0x28}, self.lm.objects['src/main.o'])
+        # section name on own line
+        self.assertEqual({'flash': 0x50 + 0xc, 'ram': 0xc}, self.lm.objects[HELPERS_OBJ])
+        self.assertEqual({'flash': 0x30, 'ram': 0x8},
+                         self.lm.objects['src/ASF/common/services/clock/sam4s/sysclk.o'])
+        self.assertEqual({'flash': 0x4, 'ram': 0x400}, self.lm.objects[LinkerMap.FILL])
+        self.assertEqual(self.lm.totals['flash'], sum(sizes['flash'] for sizes in self.lm.objects.values()))
+
+    def test_folders(self):
+        folders = self.lm.folders()
+        self.assertEqual({'flash': 0x44, 'ram': 0x2c}, folders['src'])
+        self.assertEqual({'flash': 0x5c, 'ram': 0xc}, folders['../../HelpersInCppK3/Debug/libHelpersInCppK3.a'])
+
+    def test_libraries(self):
+        self.assertEqual({'flash': 0x5c, 'ram': 0}, self.lm.libraries()['libc.a'])
+        libraries = self.lm.libraries(AtmelStudioProject('Korsar3.cproj', 'Korsar3').ref_libs)
+        self.assertEqual(['(objects)', '(toolchain)', '*fill*', 'libHelpersInCppK3.a'], sorted(libraries))
+        self.assertEqual({'flash': 0x5c, 'ram': 0xc}, libraries['libHelpersInCppK3.a'])
+
+
+class TestMapDiff(unittest.TestCase):
+    def test_diff(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            new_map = os.path.join(tmp_dir, 'new.map')
+            with open('Korsar3.map') as f_in, open(new_map, 'w') as f_out:
+                f_out.write(f_in.read().replace('.text           0x00400000      0x200',
+                                                '.text           0x00400000      0x220')
+                            .replace('.text.main     0x004000e0       0x40', '.text.main     0x004000e0       0x60'))
+            f = io.StringIO()
+            with contextlib.redirect_stdout(f):
+                self.assertEqual(0, main(['--json', 'Korsar3.map', new_map]))
+            data = json.loads(f.getvalue())
+        self.assertEqual({'flash': 0x20, 'ram': 0}, data['totals'])
+        self.assertEqual({'src/main.o': {'flash': 0x20, 'ram': 0}}, data['objects'])
+        self.assertEqual({'src': {'flash': 0x20, 'ram': 0}}, data['folders'])
+
+    def test_main(self):
+        f = io.StringIO()
+        with contextlib.redirect_stdout(f):
+            self.assertEqual(0, main(['--prj', 'Korsar3.cproj', '--top', '2', 'Korsar3.map']))
+        self.assertIn('Korsar3.map: flash 528, ram 1088\n', f.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,6 +20,7 @@ class TestAtmelStudioProject(unittest.TestCase):
         self.assertIsNotNone(self.asp.ref_libs)
         self.assertIsInstance(self.asp.ref_libs, list)
         self.assertLess(0, len(self.asp.ref_libs))
+        self.assertEqual('../HelpersInCppK3/HelpersInCppK3.cppproj', self.asp.ref_libs[2].prj_file)
 
     def test_output(self):
         self.assertEqual('Korsar3.elf', self.asp.output())
@@ -30,15 +31,21 @@ class TestAtmelStudioProject(unittest.TestCase):
         self.assertEqual('com.Atmel.ARMGCC.C', name)
         self.assertEqual('Native', flavour)
 
+    def test_configs(self):
+        self.assertEqual(['Release', 'Debug'], self.asp.configs())
+
     def test_select_config(self):
         self.assertTrue(self.asp.select_config('Debug'))
         self.assertIsNotNone(self.asp.config_group)
+        self.assertIn('armgcc.compiler.warnings.AllWarnings', self.asp.config_keys)
+        self.assertIn('armgcc.compiler.symbols.DefSymbols', self.asp.config_lists)
 
         self.assertTrue(self.asp.select_config('Release'))
         self.assertIsNotNone(self.asp.config_group)
 
         self.assertFalse(self.asp.select_config('NonExists'))
         self.assertIsNone(self.asp.config_group)
+        self.assertEqual({}, self.asp.config_keys)
 
     def test_key_raw(self):
         self.assertTrue(self.asp.select_config('Debug'))
@@ -119,7 +126,38 @@ class TestAtmelStudioProject(unittest.TestCase):
         self.assertEqual('-r', flags[0])
 
 
+class TestStreamingAtmelStudioProject(unittest.TestCase):
+    def test_same_as_tree(self):
+        for file_name in ['Korsar3.cproj', 'HelpersInCppK3.cppproj']:
+            asp = AtmelStudioProject(file_name, 'Output')
+            sasp = StreamingAtmelStudioProject(file_name, 'Output')
+
+            self.assertEqual(asp.is_cpp, sasp.is_cpp)
+            self.assertEqual(asp.is_lib, sasp.is_lib)
+            self.assertEqual(asp.output(), sasp.output())
+            self.assertEqual(asp.toolchain_settings, sasp.toolchain_settings)
+            self.assertEqual([vars(ref_lib) for ref_lib in asp.ref_libs], [vars(ref_lib) for ref_lib in sasp.ref_libs])
+            self.assertEqual(asp.toolchain_id(), sasp.toolchain_id())
+            self.assertEqual(asp.src_files(), sasp.src_files())
+            self.assertEqual(asp.configs(), sasp.configs())
+            for config in asp.configs():
+                self.assertTrue(sasp.select_config(config))
+                self.assertTrue(asp.select_config(config))
+                self.assertEqual(asp.compiler_flags(True, [], [], []), sasp.compiler_flags(True, [], [], []))
+                self.assertEqual(asp.compiler_flags(False, [], [], []), sasp.compiler_flags(False, [], [], []))
+                self.assertEqual(asp.linker_flags(config), sasp.linker_flags(config))
+                self.assertEqual(asp.archiver_flags(), sasp.archiver_flags())
+            self.assertFalse(sasp.select_config('NonExists'))
+
+
 class TestRefLibrary(unittest.TestCase):
+    def test_from_include(self):
+        reflib = RefLibrary.from_include('..\\Path\\Center.cproj')
+
+        self.assertEqual('../Path', reflib.path)
+        self.assertEqual('Center', reflib.raw_name)
+        self.assertEqual('../Path/Center.cproj', reflib.prj_file)
+
     def test_lib_name(self):
         reflib = RefLibrary('', 'Center')
 
@@ -0,0 +1,134 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from asninja.converter import Converter, ConvertOptions
+from asninja.report import *
+
+
+def write_log(file_name, entries):
+    """Writes .ninja_log with (output, start ms, end ms) entries"""
+    with open(file_name, 'w') as f:
+        f.write('# ninja log v5\n')
+        for output, start, end in entries:
+            f.write('{}\t{}\t0\t{}\t0\n'.format(start, end, output))
+
+
+class TestNinjaGraph(unittest.TestCase):
+    def test_read(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, 'build.ninja'), 'w') as f:
+                f.write('builddir = .\n'
+                        'src = $builddir/..\n'
+                        'rule cc\n'
+                        '  command = gcc -c $in -o $out\n'
+                        'build $builddir/a$ b.o: cc $src/a$ b.c | $\n'
+                        '    h.h || gen\n'
+                        '  ccflags = -O2\n'
+                        'subninja sub.ninja\n'
+                        'build all: phony a$ b.o\n')
+            with open(os.path.join(tmp_dir, 'sub.ninja'), 'w') as f:
+                f.write('builddir = ../lib/out\n'
+                        'build $builddir/x.o: cc $builddir/../x.c\n')
+            graph = NinjaGraph(os.path.join(tmp_dir, 'build.ninja'))
+        self.assertEqual([Edge('cc', ['a b.o'], ['../a b.c'], ['../a b.c', 'h.h', 'gen']),
+                          Edge('cc', ['../lib/out/x.o'], ['../lib/x.c'], ['../lib/x.c']),
+                          Edge('phony', ['all'], ['a b.o'], ['a b.o'])], graph.edges)
+
+
+class TestBuildReport(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for file_name in ['Korsar3.cproj', 'HelpersInCppK3.cppproj']:
+            prj_dir = os.path.join(self.tmp_dir, os.path.splitext(file_name)[0])
+            os.makedirs(prj_dir)
+            shutil.copy(file_name, prj_dir)
+        self.outpath = os.path.join(self.tmp_dir, 'Korsar3', 'Debug')
+        with contextlib.redirect_stdout(io.StringIO()):
+            Converter.convert(os.path.join(self.tmp_dir, 'Korsar3', 'Korsar3.cproj'), 'Debug', self.outpath,
+                              'Korsar3', [], [], [], custom_toolchain='arm-',
+                              options=ConvertOptions(unified=True))
+        self.log = os.path.join(self.outpath, '.ninja_log')
+        write_log(self.log, [('src/main.o', 0, 500),
+                             ('src/ASF/common/services/clock/sam4s/sysclk.o', 0, 300),
+                             ('src/ASF/common/services/clock/sam4s/sysclk.o', 1000, 1200),
+                             ('../../HelpersInCppK3/Debug/Shared/HelpersInCpp/CursorPosCalc.o', 0, 1500),
+                             ('../../HelpersInCppK3/Debug/libHelpersInCppK3.a', 1500, 1600),
+                             ('Korsar3.elf', 1600, 2000)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_compile_times(self):
+        report = BuildReport(NinjaGraph(os.path.join(self.outpath, 'build.ninja')), NinjaLog(self.log))
+        # last entry of output wins, sources are relative to project dir
+        self.assertEqual([('../Shared/HelpersInCpp/CursorPosCalc.cpp', 1.5),
+                          ('src/main.c', 0.5),
+                          ('src/ASF/common/services/clock/sam4s/sysclk.c', 0.2)], report.compile_times())
+        self.assertEqual(('src', 0.5), report.folder_times()[1])
+
+    def test_compile_times_preprocess(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            build_dir = os.path.join(tmp_dir, 'Debug')
+            os.makedirs(build_dir)
+            with open(os.path.join(build_dir, 'build.ninja'), 'w') as f:
+                f.write('builddir = .\n'
+                        'src = $builddir/..\n'
+                        'build $builddir/src/a.i: cc_pp $src/src/a.c\n'
+                        'build $builddir/src/a.o: cc $builddir/src/a.i\n'
+                        'build $builddir/src/b.ii: cxx_pp $src/src/b.cpp\n'
+                        'build $builddir/src/b.o: cxx $builddir/src/b.ii\n')
+            log = os.path.join(build_dir, '.ninja_log')
+            write_log(log, [('src/a.i', 0, 100), ('src/a.o', 100, 400), ('src/b.ii', 0, 200), ('src/b.o', 200, 1000)])
+            report = BuildReport(NinjaGraph(os.path.join(build_dir, 'build.ninja')), NinjaLog(log))
+            # preprocessing and compile of preprocessed source count for source
+            self.assertEqual([('src/b.cpp', 1.0), ('src/a.c', 0.4)], report.compile_times())
+
+    def test_compile_times_unity(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            build_dir = os.path.join(tmp_dir, 'Debug')
+            os.makedirs(build_dir)
+            with open(os.path.join(build_dir, 'build.ninja'), 'w') as f:
+                f.write('builddir = .\n'
+                        'src = $builddir/..\n'
+                        'build $builddir/asninja_unity/unity_0.o: cc $builddir/asninja_unity/unity_0.c\n'
+                        'build $builddir/src/c.o: cc $src/src/c.c\n')
+            log = os.path.join(build_dir, '.ninja_log')
+            write_log(log, [('asninja_unity/unity_0.o', 0, 1000), ('src/c.o', 0, 300)])
+            graph = NinjaGraph(os.path.join(build_dir, 'build.ninja'))
+            self.assertEqual([('Debug/asninja_unity/unity_0.c', 1.0), ('src/c.c', 0.3)],
+                             BuildReport(graph, NinjaLog(log)).compile_times())
+            # time of unity source is split across its sources
+            report = BuildReport(graph, NinjaLog(log), [('asninja_unity/unity_0.c', ['src/a.c', 'src\\b.c'])])
+            self.assertEqual([('src/a.c', 0.5), ('src/b.c', 0.5), ('src/c.c', 0.3)], report.compile_times())
+
+    def test_critical_path(self):
+        report = BuildReport(NinjaGraph(os.path.join(self.outpath, 'build.ninja')), NinjaLog(self.log))
+        total, path = report.critical_path()
+        self.assertAlmostEqual(2.0, total)
+        self.assertEqual([('../../HelpersInCppK3/Debug/Shared/HelpersInCpp/CursorPosCalc.o', 'cxx', 1.5),
+                          ('../../HelpersInCppK3/Debug/libHelpersInCppK3.a', 'ar', 0.1),
+                          ('Korsar3.elf', 'link', 0.4)], path)
+
+    def test_main(self):
+        old_log = os.path.join(self.tmp_dir, 'old.ninja_log')
+        write_log(old_log, [('src/main.o', 0, 100)])
+        f = io.StringIO()
+        with contextlib.redirect_stdout(f):
+            self.assertEqual(0, main(['--builddir', self.outpath, '--log', old_log, '--log', self.log, '--json']))
+        data = json.loads(f.getvalue())
+        self.assertEqual(3, len(data['compile_times']))
+        self.assertEqual(['src/main.c', [0.1, 0.5]], data['trends']['sources'][0])
+
+        f = io.StringIO()
+        with contextlib.redirect_stdout(f):
+            self.assertEqual(0, main(['--builddir', self.outpath, '--top', '1']))
+        self.assertIn('Critical path (2.000s):', f.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
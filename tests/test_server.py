@@ -0,0 +1,135 @@
+import io
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+import asninja.client
+from asninja.client import conversion_env, is_served, send_request
+from asninja.server import *
+
+
+class TestClient(unittest.TestCase):
+    def test_is_served(self):
+        self.assertTrue(is_served(['--prj', 'a.cproj']))
+        self.assertFalse(is_served(['report', '--builddir', 'Debug']))
+        self.assertFalse(is_served(['--prj', 'a.cproj', '--watch']))
+        self.assertFalse(is_served(['--prj', 'a.cproj', '--profile=out.prof']))
+
+    def test_fallback(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            socket_path = os.path.join(tmp_dir, 'missing.sock')
+            self.assertIsNone(send_request(socket_path, ['--prj', 'a.cproj'], tmp_dir))
+            f = io.StringIO()
+            with patch.dict(os.environ, {'ASNINJA_SOCKET': socket_path}), redirect_stdout(f):
+                self.assertEqual(0, asninja.client.main(['--prj', 'Korsar3.cproj', '--output', 'Korsar3',
+                                                         '--gcc_toolchain', 'arm-', '--outpath', tmp_dir]))
+            self.assertTrue(os.path.isfile(os.path.join(tmp_dir, 'build.ninja')))
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'requires Unix sockets')
+class TestConversionServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmp_dir.name, 'asninja.sock')
+        self.server = ConversionServer(self.socket_path, max_projects=4)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def convert_args(self, outpath):
+        return ['--prj', os.path.abspath('Korsar3.cproj'), '--output', 'Korsar3', '--gcc_toolchain', 'arm-',
+                '--outpath', outpath, '--no_regen']
+
+    def test_request(self):
+        response = send_request(self.socket_path, self.convert_args('out'), self.tmp_dir.name)
+        self.assertEqual(0, response['exit_code'])
+        self.assertIn('linker_script = ', response['stdout'])
+        # outpath is relative to cwd of client
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp_dir.name, 'out', 'build.ninja')))
+
+        response = send_request(self.socket_path, self.convert_args('out'), self.tmp_dir.name)
+        self.assertEqual('build.ninja unchanged\n', response['stdout'].splitlines(True)[-1])
+        self.assertEqual(1, len(self.server.cache.projects))
+
+    def test_concurrent_requests(self):
+        responses = {}
+
+        def request(name):
+            responses[name] = send_request(self.socket_path,
+                                           self.convert_args(name + '/Release') + ['--config', 'Release'],
+                                           self.tmp_dir.name)
+
+        threads = [threading.Thread(target=request, args=('out{}'.format(i),)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([0] * 4, [response['exit_code'] for response in responses.values()])
+        # output of each request is captured separately
+        self.assertEqual([1] * 4, [response['stdout'].count('linker_script = ') for response in responses.values()])
+        contents = set()
+        for name in responses:
+            with open(os.path.join(self.tmp_dir.name, name, 'Release', 'build.ninja')) as f:
+                contents.add(f.read())
+        self.assertEqual(1, len(contents))
+
+    def test_solution_request(self):
+        # projects of solution are converted in worker threads, their output goes to response too
+        shutil.copy('Korsar3.cproj', self.tmp_dir.name)
+        with open(os.path.join(self.tmp_dir.name, 'Korsar3.atsln'), 'w') as f:
+            f.write('Project("{54F91283-7BC4-4236-8FF9-10F437C3AD48}") = "Korsar3", "Korsar3.cproj", "{C207956D}"\n'
+                    'EndProject\n')
+        response = send_request(self.socket_path, ['--sln', 'Korsar3.atsln', '--gcc_toolchain', 'arm-', '--no_regen'],
+                                self.tmp_dir.name)
+        self.assertEqual(0, response['exit_code'])
+        self.assertEqual(1, response['stdout'].count('linker_script = '))
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp_dir.name, 'Debug', 'build.ninja')))
+
+    def test_other_env(self):
+        # tools of other PATH aren't seen by server, such call is converted by client itself
+        self.server.stderr = io.StringIO()
+        env = dict(conversion_env(), PATH=os.pathsep.join(['bin', os.environ.get('PATH', '')]))
+        response = send_request(self.socket_path, self.convert_args('out'), self.tmp_dir.name, env)
+        self.assertIsNone(response['exit_code'])
+        self.assertEqual('asninja serve: refused call with other PATH\n', self.server.stderr.getvalue())
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir.name, 'out', 'build.ninja')))
+
+        f = io.StringIO()
+        outpath = os.path.join(self.tmp_dir.name, 'local')
+        with patch.dict(os.environ, {'ASNINJA_SOCKET': self.socket_path, 'PATH': env['PATH']}), redirect_stdout(f):
+            self.assertEqual(0, asninja.client.main(self.convert_args(outpath)))
+        self.assertIn('linker_script = ', f.getvalue())
+        self.assertTrue(os.path.isfile(os.path.join(outpath, 'build.ninja')))
+        self.assertEqual(0, len(self.server.cache.projects))
+
+    def test_errors(self):
+        response = send_request(self.socket_path, ['--bogus'], self.tmp_dir.name)
+        self.assertEqual(2, response['exit_code'])
+        self.assertIn('unrecognized arguments: --bogus', response['stderr'])
+        response = send_request(self.socket_path, ['report'], self.tmp_dir.name)
+        self.assertEqual(2, response['exit_code'])
+        response = send_request(self.socket_path, ['--prj', 'missing.cproj', '--output', 'missing'],
+                                self.tmp_dir.name)
+        self.assertEqual(1, response['exit_code'])
+        self.assertIn('FileNotFoundError', response['stderr'])
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        sock.sendall(b'{"argv": 1}\n')
+        with sock.makefile('rb') as f:
+            self.assertIn(b'malformed request', f.readline())
+        sock.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
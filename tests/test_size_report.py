@@ -0,0 +1,39 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from asninja.size_report import *
+
+FAKE_SIZE = os.path.join(os.path.abspath('fake-arm-toolchain'), 'arm-none-eabi-size')
+
+
+class TestSizeReport(unittest.TestCase):
+    def test_format_report(self):
+        report = {'file': 'a.elf', 'text': 100, 'data': 10, 'bss': 20, 'flash': 110, 'ram': 30}
+        self.assertEqual('a.elf: text 100, data 10, bss 20, flash 110, ram 30', format_report(report))
+        previous = {'file': 'a.elf', 'text': 90, 'data': 10, 'bss': 24, 'flash': 100, 'ram': 34}
+        self.assertEqual('a.elf: text 100 (+10), data 10 (+0), bss 20 (-4), flash 110 (+10), ram 30 (-4)',
+                         format_report(report, previous))
+
+    @unittest.skipIf(os.name == 'nt', 'requires POSIX')
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = os.path.join(tmp_dir, 'a.size.json')
+            for fake_size, expected in [('100 10 20', 'a.elf: text 100, data 10, bss 20, flash 110, ram 30\n'),
+                                        ('120 10 20', 'a.elf: text 120 (+20), data 10 (+0), bss 20 (+0), '
+                                                      'flash 130 (+20), ram 30 (+0)\n')]:
+                f = io.StringIO()
+                with patch.dict(os.environ, FAKE_SIZE=fake_size), contextlib.redirect_stdout(f):
+                    self.assertEqual(0, main(['--tool', FAKE_SIZE, '--output', output, 'a.elf']))
+                self.assertEqual(expected, f.getvalue())
+            with open(output) as f:
+                self.assertEqual({'file': 'a.elf', 'text': 120, 'data': 10, 'bss': 20, 'flash': 130, 'ram': 30},
+                                 json.load(f))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+
+from asninja.solution import *
+
+
+class TestAtmelStudioSolution(unittest.TestCase):
+    def setUp(self):
+        self.sln = AtmelStudioSolution('Korsar3.atsln')
+
+    def tearDown(self):
+        self.sln = None
+
+    def test_init(self):
+        self.assertEqual(2, len(self.sln.projects))
+        self.assertEqual('Korsar3', self.sln.projects[0].name)
+        self.assertEqual('Korsar3.cproj', self.sln.projects[0].file_name)
+        self.assertEqual('HelpersInCppK3', self.sln.projects[1].name)
+        self.assertEqual('HelpersInCppK3.cppproj', self.sln.projects[1].file_name)
+
+
+class TestSolutionProject(unittest.TestCase):
+    def test_outpath(self):
+        prj = SolutionProject('Center', 'Path/Center/Center.cproj')
+
+        self.assertEqual(os.path.join('Path/Center', 'Debug'), prj.outpath('Debug'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import io
+import json
+import pickle
+import time
+import tracemalloc
+import unittest
+
+from asninja.timings import PhaseTimings
+
+
+class TestPhaseTimings(unittest.TestCase):
+    def test_phase(self):
+        calls = []
+        timings = PhaseTimings(callback=lambda name, elapsed, blocks: calls.append(name))
+        with timings.phase('outer'):
+            with timings.phase('inner'):
+                time.sleep(0.02)
+        with timings.phase('inner'):
+            pass
+        self.assertEqual(['inner', 'outer', 'inner'], calls)
+        self.assertEqual(['inner', 'outer'], list(timings.phases))
+        self.assertEqual(2, timings.phases['inner']['calls'])
+        # nested phase is excluded from outer one
+        self.assertGreaterEqual(timings.phases['inner']['time'], 0.02)
+        self.assertLess(timings.phases['outer']['time'], 0.02)
+
+    def test_memory(self):
+        timings = PhaseTimings()
+        with timings.phase('convert'):
+            with timings.phase('alloc'):
+                objects = [object() for __ in range(10000)]
+            with timings.phase('free'):
+                del objects
+        with timings.phase('outer'):
+            with timings.phase('temp'):
+                temp = bytearray(1000000)
+                del temp
+            kept = bytearray(100000)
+        # net size, negative when phase frees more than allocates
+        self.assertLess(timings.phases['free']['size'], 0)
+        # peak includes nested phases, size doesn't
+        self.assertLess(timings.phases['temp']['size'], 100000)
+        self.assertGreaterEqual(timings.phases['temp']['peak'], 1000000)
+        self.assertGreaterEqual(timings.phases['outer']['size'], 100000)
+        self.assertLess(timings.phases['outer']['size'], 1000000)
+        self.assertGreaterEqual(timings.phases['outer']['peak'], 1000000)
+        # tracing is stopped by outermost phase
+        self.assertFalse(tracemalloc.is_tracing())
+        del kept
+
+    def test_merge_and_dump(self):
+        timings = PhaseTimings()
+        timings.add('parse', 1.0, 10, 20)
+        timings.merge({'parse': {'time': 2.0, 'calls': 2, 'size': 5, 'peak': 30},
+                       'render': {'time': 0.5, 'calls': 1, 'size': 1, 'peak': 1}})
+        f = io.StringIO()
+        timings.dump(f)
+        data = json.loads(f.getvalue())
+        self.assertEqual({'time': 3.0, 'calls': 3, 'size': 15, 'peak': 30}, data['phases']['parse'])
+        self.assertEqual(3.5, data['total_time'])
+
+    def test_pickle(self):
+        timings = PhaseTimings(callback=lambda name, elapsed, blocks: None)
+        timings.add('parse', 1.0, 10)
+        timings = pickle.loads(pickle.dumps(timings))
+        self.assertIsNone(timings.callback)
+        self.assertEqual(1, timings.phases['parse']['calls'])
+
+
+if __name__ == '__main__':
+    unittest.main()
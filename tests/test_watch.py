@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from asninja.watch import *
+
+
+def touch(file_name, content):
+    with open(file_name, 'a') as f:
+        f.write(content)
+
+
+class TestPollingWatcher(unittest.TestCase):
+    def test_wait(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, 'a.cproj')
+            touch(file_name, '<a/>')
+            watcher = PollingWatcher(0.01)
+            watcher.watch([file_name, os.path.join(tmp_dir, 'missing.cproj')])
+            self.assertEqual(set(), watcher.wait(0.05))
+            touch(file_name, '\n')
+            self.assertEqual({file_name}, watcher.wait(0.05))
+            self.assertEqual(set(), watcher.wait(0))
+            touch(os.path.join(tmp_dir, 'missing.cproj'), '<b/>')
+            self.assertEqual({os.path.join(tmp_dir, 'missing.cproj')}, watcher.wait(0.05))
+
+
+class TestInotifyWatcher(unittest.TestCase):
+    def test_wait(self):
+        try:
+            watcher = InotifyWatcher()
+        except (OSError, AttributeError):
+            self.skipTest('inotify is not available')
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                file_name = os.path.join(tmp_dir, 'a.cproj')
+                touch(file_name, '<a/>')
+                watcher.watch([file_name])
+                self.assertEqual(set(), watcher.wait(0.05))
+                touch(os.path.join(tmp_dir, 'other.txt'), 'x')
+                self.assertEqual(set(), watcher.wait(0.05))
+                touch(file_name, '\n')
+                self.assertEqual({file_name}, watcher.wait(1))
+                # save via rename
+                touch(file_name + '.tmp', '<b/>')
+                os.replace(file_name + '.tmp', file_name)
+                self.assertEqual({file_name}, watcher.wait(1))
+                watcher.watch([])
+                self.assertEqual({}, watcher.dirs)
+        finally:
+            watcher.close()
+
+
+class FakeWatcher(object):
+    """Returns queued sets of changed files"""
+
+    def __init__(self, changes):
+        self.changes = list(changes)
+        self.files = set()
+
+    def watch(self, file_names):
+        self.files = set(file_names)
+
+    def wait(self, timeout=None):
+        return self.changes.pop(0) if self.changes else set()
+
+    def close(self):
+        pass
+
+
+class TestProjectWatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.prjs = {}
+        for name, file_name in [('Korsar3', 'Korsar3.cproj'), ('HelpersInCppK3', 'HelpersInCppK3.cppproj')]:
+            prj_dir = os.path.join(self.tmp_dir.name, name)
+            os.makedirs(prj_dir)
+            shutil.copy(file_name, prj_dir)
+            self.prjs[name] = os.path.join(prj_dir, file_name)
+        self.tasks = [(name, dict(as_prj=prj, config='Debug', outpath=os.path.join(os.path.dirname(prj), 'Debug'),
+                                  output=name, flags=[], add_defs=[], del_defs=[], custom_toolchain='arm-',
+                                  options=None))
+                      for name, prj in self.prjs.items()]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_run(self):
+        project_watch = ProjectWatch(self.tasks, FakeWatcher([]))
+        results = project_watch.run()
+        self.assertEqual(['Korsar3', 'HelpersInCppK3'], [name for name, __, __, __ in results])
+        self.assertEqual([(True, None)] * 2, [(changed, error) for __, __, changed, error in results])
+        # missing library projects are watched too
+        self.assertEqual(5, len(project_watch.deps['Korsar3']))
+        self.assertLessEqual(set(self.prjs.values()), project_watch.deps['Korsar3'])
+        self.assertEqual({self.prjs['HelpersInCppK3']}, project_watch.deps['HelpersInCppK3'])
+        self.assertEqual(project_watch.deps['Korsar3'], project_watch.watcher.files)
+        # models are kept in memory
+        cp = project_watch.cache.load(self.prjs['Korsar3'], 'Korsar3')
+        project_watch.run()
+        self.assertIs(cp.data, project_watch.cache.load(self.prjs['Korsar3'], 'Korsar3').data)
+
+    def test_step(self):
+        lib_prj = self.prjs['HelpersInCppK3']
+        watcher = FakeWatcher([{self.prjs['Korsar3']}, {lib_prj}, {lib_prj}, set()])
+        project_watch = ProjectWatch(self.tasks, watcher, debounce=0)
+        project_watch.run()
+        self.assertEqual(['Korsar3'], project_watch.affected({self.prjs['Korsar3']}))
+        self.assertEqual(['Korsar3', 'HelpersInCppK3'], project_watch.affected({lib_prj}))
+
+        cp = project_watch.cache.load(lib_prj, 'HelpersInCppK3')
+        # burst of changes is one run, only library change is rerun in both conversions
+        results = project_watch.step(0)
+        self.assertEqual(['Korsar3', 'HelpersInCppK3'], [name for name, __, __, __ in results])
+        self.assertEqual([False, False], [changed for __, __, changed, __ in results])
+        self.assertIsNot(cp.data, project_watch.cache.load(lib_prj, 'HelpersInCppK3').data)
+        self.assertIsNone(project_watch.step(0))
+
+    def test_step_error(self):
+        watcher = FakeWatcher([{self.prjs['HelpersInCppK3']}])
+        project_watch = ProjectWatch(self.tasks, watcher, debounce=0)
+        project_watch.run()
+        with open(self.prjs['HelpersInCppK3'], 'w') as f:
+            f.write('<Project')
+        results = project_watch.step(0)
+        self.assertEqual(2, len(results))
+        # app graph doesn't need library project without --unified
+        self.assertIsNone(results[0][3])
+        self.assertIsNotNone(results[1][3])
+        # deps are kept, so fixed project is converted again
+        self.assertIn(self.prjs['HelpersInCppK3'], project_watch.deps['Korsar3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
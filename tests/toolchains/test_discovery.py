@@ -0,0 +1,84 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from asninja.parser import AtmelStudioProject
+from asninja.toolchains.discovery import *
+
+FAKE_TOOLCHAIN = os.path.abspath('fake-arm-toolchain')
+
+
+@unittest.skipIf(sys.platform.startswith('win'), 'requires POSIX')
+class TestToolchainDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.tmp_dir, 'cache', 'toolchains.json')
+        self.empty_dir = os.path.join(self.tmp_dir, 'empty')
+        os.makedirs(self.empty_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_search_dirs(self):
+        discovery = ToolchainDiscovery(self.cache_file, [FAKE_TOOLCHAIN, '', FAKE_TOOLCHAIN + '/../fake-*',
+                                                         os.path.join(self.tmp_dir, 'missing')])
+        self.assertEqual([FAKE_TOOLCHAIN], discovery.search_dirs())
+
+    def test_discover(self):
+        discovery = ToolchainDiscovery(self.cache_file, [self.empty_dir, FAKE_TOOLCHAIN])
+        self.assertEqual([{'path': FAKE_TOOLCHAIN, 'tool_type': 'arm', 'version': '4.8.4',
+                           'machine': 'arm-none-eabi'}], discovery.discover())
+        self.assertTrue(os.path.isfile(self.cache_file))
+
+        # unchanged dirs - no probing
+        with patch.object(ToolchainDiscovery, 'probe', side_effect=AssertionError):
+            self.assertEqual(1, len(discovery.discover()))
+            # results are kept in memory of process too
+            os.remove(self.cache_file)
+            self.assertEqual(1, len(ToolchainDiscovery(self.cache_file, [self.empty_dir, FAKE_TOOLCHAIN]).discover()))
+
+        # changed dir - probed again
+        with open(os.path.join(self.empty_dir, 'file'), 'w'):
+            pass
+        os.utime(self.empty_dir, ns=(0, 0))
+        with patch.object(ToolchainDiscovery, 'probe', return_value=None) as probe:
+            self.assertEqual([], discovery.discover())
+            probe.assert_called_once_with((FAKE_TOOLCHAIN, 'arm'))
+
+    def test_discover_avr8(self):
+        # AVR 8-bit toolchains ship avr-gcc (not avr8-gcc)
+        avr_dir = os.path.join(self.tmp_dir, 'avr8-gnu-toolchain', 'bin')
+        os.makedirs(avr_dir)
+        cc = os.path.join(avr_dir, 'avr-gcc')
+        with open(cc, 'w') as f:
+            f.write('#!/bin/sh\n[ "$1" = -dumpversion ] && echo 5.4.0 || echo avr\n')
+        os.chmod(cc, 0o755)
+        discovery = ToolchainDiscovery(self.cache_file, [FAKE_TOOLCHAIN, avr_dir])
+        self.assertEqual([{'path': avr_dir, 'tool_type': 'avr8', 'version': '5.4.0', 'machine': 'avr'}],
+                         discovery.discover()[1:])
+        tc = discovery.find(('7.0', 'com.Atmel.AVRGCC8.C', 'Native'))
+        self.assertEqual(cc, tc.cc())
+        self.assertEqual(os.path.join(avr_dir, 'avr-objcopy'), tc.objcopy())
+
+    def test_find(self):
+        asp = AtmelStudioProject('Korsar3.cproj', 'Korsar3')
+        discovery = ToolchainDiscovery(self.cache_file, [FAKE_TOOLCHAIN])
+        tc = discovery.find(asp.toolchain_id())
+        self.assertEqual(FAKE_TOOLCHAIN, tc.path)
+        self.assertEqual('arm', tc.tool_type)
+
+        infos = [{'path': '/a', 'tool_type': 'arm', 'version': '4.9.3', 'machine': 'arm-none-eabi'},
+                 {'path': '/b', 'tool_type': 'arm', 'version': '10.3.1', 'machine': 'arm-none-eabi'},
+                 {'path': '/c', 'tool_type': 'avr8', 'version': '12.1.0', 'machine': 'avr'}]
+        with patch.object(ToolchainDiscovery, 'discover', return_value=infos):
+            self.assertEqual('/b', discovery.find(asp.toolchain_id()).path)
+            self.assertEqual('/c', discovery.find(('7.0', 'com.Atmel.AVRGCC8.C', 'Native')).path)
+            self.assertRaises(Exception, lambda: discovery.find(('7.0', 'com.Atmel.AVR32GCC.C', 'Native')))
+            self.assertRaises(Exception, lambda: discovery.find(('7.0', 'Unknown', 'Native')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -41,6 +41,10 @@ class TestGccToolchain(unittest.TestCase):
         tc = GccToolchain('arm-')
         self.assertTrue('g++' in tc.cxx())
 
+    def test_objcopy(self):
+        tc = GccToolchain('arm-')
+        self.assertTrue('objcopy' in tc.objcopy())
+
 
 if __name__ == '__main__':
     unittest.main()